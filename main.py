@@ -5,14 +5,13 @@ A script for the Differential Universe of Honkai: Star Rail.
 Designed to roll for desired starting props (boon & equation).
 """
 
-from win32gui import FindWindow, SetForegroundWindow
 from time import sleep
-from typing import Dict
+from typing import Dict, List, Optional, Union
 import logging
+import os
 import traceback
 
-from mypackage.recognize import Recognizer
-from mypackage.operate import Operator
+# Only lightweight modules here, heavy backends (cv2, numpy, pywin32, ...) are loaded after the targets are set.
 from mypackage.config import *
 from mypackage.exceptions import *
 from mypackage.utils import setup_logger
@@ -22,88 +21,209 @@ def _set_targets(target: Dict[str, str]) -> None:
     """
     Set the target combination {boon, equation}.
 
-    Read and save the name of target props inputed by user.
+    Read the name of target props inputed by user, ask again until it names an option template, and store it in place.
 
-    Returns:
-        dict (Dict[str, str]): {"interface ID": "target name"}.
+    Arguments:
+        target (Dict[str, str]): {"interface ID": "target name"}, the names are filled in.
     """
     
+    # Names of the available options, from the file names only.
+    available_names = {os.path.splitext(file)[0] for file in os.listdir(OPTION_TEMPL_DIR)}
+
     for term in target:
-        name = input(f"\tINPUT:\tEnter the name (Chinese pinyin) of your target for [{term}]: ")
+        while True:
+            name = input(f"\tINPUT:\tEnter the name (Chinese pinyin) of your target for [{term}]: ")
 
-        # Standardize the input.
-        name = "".join([letter for letter in name.lower() if letter.isalpha()])  # Keep only letters and lowercase.
-        name = HOMOPHONE.get(name, name)  # Correct possible spelling errors.
+            # Standardize the input.
+            name = "".join([letter for letter in name.lower() if letter.isalpha()])  # Keep only letters and lowercase.
+            name = HOMOPHONE.get(name, name)  # Correct possible spelling errors.
+            if name in available_names:
+                break
+            print(f"\tHINT:\t[{name}] is not an option, check the file names in folder '{OPTION_TEMPL_DIR}';")
         target[term] = name
 
 
+def _check_goal(combinations: List[Dict[str, Union[str, List[str]]]]) -> None:
+    """
+    Check that every name of the configured combinations names an option template, and that each combination constrains an interface.
+
+    Arguments:
+        combinations (List[Dict[str, Union[str, List[str]]]]): acceptable combinations.
+    """
+
+    available_names = {os.path.splitext(file)[0] for file in os.listdir(OPTION_TEMPL_DIR)}
+    for combination in combinations:
+        is_constrained = False
+        for names in combination.values():
+            names = [names] if isinstance(names, str) else names
+            if WILDCARD in names:
+                continue
+            is_constrained = True
+            for name in names:
+                if name not in available_names:
+                    raise TemplateNotFoundError(os.path.join(OPTION_TEMPL_DIR, f"{name}.png"))
+        # Accepting any option, it would be secured by the first selection of every attempt.
+        if not is_constrained:
+            raise ValueError(f"The combination {combination} of GOAL_COMBINATIONS constrains no interface.")
+
+
+def _activate_window() -> None:
+    """
+    Activate the game window, at startup and to recover from stalls.
+    """
+
+    from win32gui import FindWindow, SetForegroundWindow
+    is_open = FindWindow(None, GAME_WINDOW)
+    if not is_open:
+        raise WindowNotFoundError(GAME_WINDOW)
+    SetForegroundWindow(is_open)
+    sleep(ACTIVE_WINDOWS_TIME)
+
+
+def _dump_flight(flight: Optional["FlightRecorder"], reason: str) -> None:
+    """
+    Dump the flight recorder, without masking the exit cause if it fails.
+
+    Arguments:
+        flight (Optional[FlightRecorder]): the flight recorder, None if not created;
+        reason (str): cause of the dump.
+    """
+
+    if flight is None:
+        return
+    try:
+        flight.dump(reason)
+    except Exception as e:
+        logging.getLogger(__name__).error("Fail to dump the flight recorder: %s", e)
+
+
 def main() -> None:
     """
     Entry of the program.
 
-    Aactivate the window, monitor the screen, and repeat the following process:
-    Take the screenshot -> Match the interface -> Perform the operation
+    Aactivate the window, build the recognizers and the operator, and run the monitoring loop.
     """
 
+    transitions = None          # Transition table of interfaces, saved on exit;
+    latency_profile = None      # Measured latencies of the game, saved on exit;
+    recorder = None             # Session recorder, closed on exit;
+    flight = None               # Flight recorder, dumped on exit;
+    interface_matcher = None    # Interface recognizer, reports its statistics on exit;
+    my_operator = None          # Operator, saves the histogram of observed options on exit;
+    runner = None               # Monitoring loop, reports the rate of attempts on exit.
     try:
         # Configure logging and get the root logger.
-        setup_logger()
+        setup_logger(LOG_QUEUED, LOG_EVENTS_FILE)
         root_logger = logging.getLogger(__name__)
 
-        # Check if game is open.
-        is_open = FindWindow(None, GAME_WINDOW)
-        if not is_open:
-            raise WindowNotFoundError(GAME_WINDOW)
-        
-        # Set the target.
-        target = {"select_golden_bloods_boon": "", "select_equation": ""}
-        _set_targets(target)
-        root_logger.debug(f"Set the target combination: [{target}];\n")
+        # Set the target, before any heavy backend is loaded.
+        if GOAL_COMBINATIONS:
+            _check_goal(GOAL_COMBINATIONS)
+            target = GOAL_COMBINATIONS
+        else:
+            target = {"select_golden_bloods_boon": "", "select_equation": ""}
+            _set_targets(target)
+            target = [target]
+        root_logger.debug("Set the target combinations: %s;\n", target)
+
+        # Check if game is open and active the game window, unless the frames are replayed.
+        if not REPLAY_SOURCE:
+            _activate_window()
+
+        # Enable the instrumentation if required, before any instrumented object is built.
+        if METRICS_ENABLED:
+            from mypackage import metrics
+            metrics.enable(METRICS_JSON_FILE, METRICS_PROM_FILE, METRICS_EXPORT_INTERVAL)
 
-        # Active the game window.
-        SetForegroundWindow(is_open)
-        sleep(ACTIVE_WINDOWS_TIME)
+        # Load the heavy backends.
+        from mypackage.goal import Goal
+        from mypackage.recognize import Recognizer
+        from mypackage.capture import create_capture
+        from mypackage.transition import TransitionModel
+        from mypackage.latency import LatencyProfile
+        from mypackage.operate import Operator
+        from mypackage.layout import Layout
+        from mypackage.inputs import create_input
+        from mypackage.session import RecordingCapture, RecordingInput, SessionRecorder
+        from mypackage.runtime import Runner
+        from mypackage.pipeline import PipelinedRunner, SynchronizedCapture
+        from mypackage.watchdog import Watchdog
+        from mypackage.flight import FlightRecorder
 
+        # Create the capture backend shared by the recognizers, and the input backend, only recording the operations when replaying.
+        # Replayed frames are decoded into the same buffers unless pipelined, where the capture thread and Operator grab concurrently.
+        capture = create_capture(CAPTURE_MODE, REPLAY_SOURCE, REUSE_BUFFERS and RUN_MODE == "serial")
+        input_backend = create_input(REPLAY_SOURCE)
+        # Record the session if required.
+        if RECORD_SESSION_DIR:
+            recorder = SessionRecorder(RECORD_SESSION_DIR, capture.size(), SESSION_CHUNK_SIZE, RECORD_REGIONS_ONLY)
+            capture = RecordingCapture(capture, recorder)
+            input_backend = RecordingInput(input_backend, recorder)
+        # The capture thread and Operator grab concurrently in pipelined mode.
+        if RUN_MODE == "pipelined":
+            capture = SynchronizedCapture(capture)
+        # Map the configured layout to the actual capture size, the rescaled templates are cached per resolution.
+        layout = Layout(capture.size(), REFERENCE_RESOLUTION, REGION_ANCHORS)
+        root_logger.info("Capture size: %s, UI scale: %.4f;", layout.size, layout.scale)
+        # Interfaces of the abort route, those whose template has been added.
+        abort_regions = {}
+        if ABORT_ON_MISS:
+            abort_regions = {id: box for id, box in ABORT_REGIONS.items() if os.path.isfile(os.path.join(INTERFACE_TEMPL_DIR, f"{id}.png"))}
+            for id in ABORT_REGIONS.keys() - abort_regions.keys():
+                root_logger.warning("Template of the abort route interface [%s] not found, ignore it;", id)
+        interface_flow = {
+            id: list(dict.fromkeys(INTERFACE_FLOW.get(id, []) + (ABORT_FLOW.get(id, []) if ABORT_ON_MISS else [])))
+            for id in {**INTERFACE_FLOW, **ABORT_FLOW}
+        }
+        # Create the transition table of interfaces, seeded from the game flow.
+        transitions = TransitionModel(interface_flow, TRANSITIONS_FILE)
+        # Load the latencies measured by previous runs, calibrating the waits.
+        latency_profile = LatencyProfile(LATENCY_PROFILE_FILE) if LATENCY_PROFILE_FILE else None
         # Create an interface recognizer.
         interface_matcher = Recognizer(
             templates_dir = INTERFACE_TEMPL_DIR,
-            id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+            id_to_file_name = {id: id for id in [*INTERFACE_REGIONS, *abort_regions]},
             confidence_threshold = INTERFACE_MATCH_THRESHOLD,
-            id_to_coordinate = INTERFACE_REGIONS
+            id_to_coordinate = layout.regions({**INTERFACE_REGIONS, **abort_regions}),
+            capture = capture,
+            engine = SCORING_ENGINE,
+            transitions = transitions,
+            cache_size = SCORE_CACHE_SIZE,
+            use_bundle = TEMPLATE_BUNDLE,
+            scale = layout.scale,
+            search_padding = SHIFT_SEARCH_PADDING,
+            reuse_buffers = REUSE_BUFFERS,
+            calibration_file = CALIBRATION_FILE
         )
         # Create a operator.
         my_operator = Operator(
             id_to_coordinate = OPTION_REGIONS,
-            targets = target
+            targets = Goal(target),
+            capture = capture,
+            classify = OPTION_CLASSIFY,
+            layout = layout,
+            input_backend = input_backend,
+            abort_on_miss = ABORT_ON_MISS,
+            abort_clicks = {id: click for id, click in ABORT_CLICKS.items() if id in abort_regions},
+            latency_profile = latency_profile
         )
 
-        # Ready to run.
-        root_logger.info("Begins monitoring, press Ctrl+C to interrupt;\n\n")
-        counter = 0                     # Record the times of attempts.
-        _current_interface_id = None    # Record the current interface.
-        # Continuous monitoring.
-        while counter <= MAX_ATTEMPT_COUNT:
-            # Match and update current interface.
-            _current_interface_id = interface_matcher.match()
-            if _current_interface_id == "unmatched":
-                root_logger.info("Undefined interface;")
-            else:
-                # Each time entering the start game interface, the counter plus one.
-                if _current_interface_id == "start_game":
-                    counter += 1
-                    root_logger.info(f"Begin to attempt the order number: {counter};" + "\n" + "-" * 100)
-                root_logger.info(f"Current interface id: [{_current_interface_id}];")
-                
-            # Operate according to the current interface.
-            my_operator.operate(_current_interface_id)
-            sleep(MONITOR_INTERVAL_TIME)
-
-        raise MaxAttemptCountExceededError(MAX_ATTEMPT_COUNT)
+        # Keep the last ticks in the flight recorder.
+        if FLIGHT_TICKS > 0:
+            flight = FlightRecorder(interface_matcher.id_to_coordinate, capture.size())
+        # Create a stall watchdog, recovering from unexpected screens.
+        watchdog = Watchdog(my_operator, capture, None if REPLAY_SOURCE else _activate_window, flight = flight)
+
+        # Ready to run, continuous monitoring.
+        runner_class = PipelinedRunner if RUN_MODE == "pipelined" else Runner
+        runner = runner_class(interface_matcher, my_operator, transitions, MAX_ATTEMPT_COUNT, recorder, watchdog, flight)
+        runner.run()
 
             
     # Catch exceptions.
     except TargetAchievedError as e:
         root_logger.info(e.message)
+        _dump_flight(flight, "achieved")
         # 执行资源清理（如关闭文件、释放连接等）######################################
         # clean_up_resources()
         return 0
@@ -115,13 +235,56 @@ def main() -> None:
         return 67
     except MaxAttemptCountExceededError as e:
         root_logger.error(e.message)
+        _dump_flight(flight, "max_attempts")
         return 75
+    except CaptureExhaustedError as e:
+        root_logger.error(e.message)
+        _dump_flight(flight, "exhausted")
+        return 74
 
     except KeyboardInterrupt:
         root_logger.warning("Interrupt process!")
+        _dump_flight(flight, "interrupted")
     except Exception as e:
-        root_logger.error(f"Undefined error: {e}")
+        root_logger.error("Undefined error: %s", e)
         traceback.print_exc()
+        _dump_flight(flight, "error")
+
+    finally:
+        # Keep the learned transitions for later sessions.
+        if transitions is not None:
+            transitions.save()
+        # Keep the measured latencies for later sessions.
+        if latency_profile is not None:
+            latency_profile.save()
+        # Keep the observed options, saved periodically while running.
+        if my_operator is not None:
+            my_operator.save()
+        # Write the remaining recorded events.
+        if recorder is not None:
+            recorder.close()
+        if flight is not None:
+            flight.close()
+        # Report the memoization of interface scores.
+        if interface_matcher is not None and interface_matcher.cache is not None:
+            logging.getLogger(__name__).debug("Score cache hits: %d, misses: %d;", interface_matcher.cache.hits, interface_matcher.cache.misses)
+        # Report the regions moved by the shift search.
+        if interface_matcher is not None and interface_matcher.offsets:
+            logging.getLogger(__name__).info("Shifted regions: %s;", interface_matcher.offsets)
+        # Report the rejections of the cascade engine.
+        if interface_matcher is not None and hasattr(interface_matcher.engine, "stats"):
+            logging.getLogger(__name__).debug("Cascade engine statistics: %s;", interface_matcher.engine.stats)
+        # Report the rate of attempts, to compare the modes.
+        if runner is not None:
+            logging.getLogger(__name__).info("Attempts: %d, %.1f per hour (abort on miss: %s);", runner.attempts, runner.attempts_per_hour(), ABORT_ON_MISS)
+            if ABORT_ON_MISS:
+                logging.getLogger(__name__).info("Attempts played to the end, the abort route failing: %d;", runner.operator.abort_failures)
+            logging.getLogger(__name__).info("Stalls: %d, recovery actions: %d;", runner.watchdog.stalls, runner.watchdog.recoveries)
+        # Export the final values of the instrumentation.
+        if METRICS_ENABLED:
+            from mypackage import metrics
+            if metrics.registry is not None:
+                metrics.registry.export()
 
 
 if __name__ == "__main__":
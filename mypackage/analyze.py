@@ -0,0 +1,265 @@
+# mypackage/analyze.py
+"""
+Batch analysis of frame archives.
+
+Re-score recorded frames with the interface and option recognizers on a process pool, and write every score to a columnar file.
+
+Run from the project directory:
+    python -m mypackage.analyze ARCHIVE [--workers N] [--output FILE]
+
+ARCHIVE is a directory of images, a video file, or a recorded session directory:
+* image files are sharded across the workers by path, each worker decodes its own frames;
+* video frames can only be decoded in order, the parent decodes them into a pool of shared-memory slots that the workers read in place;
+* session chunks are sharded across the workers, each worker loads its own chunks.
+No image data is pickled between processes. Each worker builds the recognizers once; with TEMPLATE_BUNDLE,
+the bundles are built by the parent beforehand and memory-mapped by every worker, sharing the pages.
+
+The output is a compressed .npz, with one row per (frame, region, template):
+* frame, region, template (int32): codes into the frame_names, region_names and template_names tables;
+* score (float32): normalized correlation, -1 for templates of another size than the region.
+"""
+
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import logging
+import os
+import time
+import numpy
+import cv2
+
+from mypackage.capture import Frame, ReplayCapture
+from mypackage.recognize import Recognizer
+from mypackage.layout import Layout
+from mypackage.bundle import load_bundle
+from mypackage.session import SESSION_META, load_chunk_frames
+from mypackage.config import (
+    INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_MATCH_THRESHOLD, OPTION_TEMPL_DIR, OPTION_REGIONS, OPTION_MATCH_THRESHOLD,
+    SCORING_ENGINE, TEMPLATE_BUNDLE, REFERENCE_RESOLUTION, REGION_ANCHORS,
+)
+
+
+Row = Tuple[str, str, float]   # (region ID, template file name, score).
+
+FRAMES_PER_TASK: int = 16   # Image files per task of a worker;
+SHARED_SLOTS_PER_WORKER: int = 4   # Shared-memory frame slots per worker, when decoding a video.
+
+_logger = logging.getLogger(__name__)
+
+# State of a worker process, set once by _init_worker.
+_recognizers: List[Tuple[Recognizer, Optional[List[str]]]] = []
+_shared: Optional[Tuple[SharedMemory, numpy.ndarray]] = None
+
+
+def _build_recognizers(size: Tuple[int, int]) -> List[Tuple[Recognizer, Optional[List[str]]]]:
+    # Interface regions against their own template, option slots against all option templates.
+    layout = Layout(size, REFERENCE_RESOLUTION, REGION_ANCHORS)
+    option_names = sorted(os.path.splitext(file)[0] for file in os.listdir(OPTION_TEMPL_DIR) if file.lower().endswith(".png"))
+    interface_recognizer = Recognizer(
+        templates_dir = INTERFACE_TEMPL_DIR,
+        id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+        confidence_threshold = INTERFACE_MATCH_THRESHOLD,
+        id_to_coordinate = layout.regions(INTERFACE_REGIONS),
+        engine = SCORING_ENGINE,
+        use_bundle = TEMPLATE_BUNDLE,
+        scale = layout.scale
+    )
+    option_recognizer = Recognizer(
+        templates_dir = OPTION_TEMPL_DIR,
+        id_to_file_name = {},
+        confidence_threshold = OPTION_MATCH_THRESHOLD,
+        id_to_coordinate = layout.regions(OPTION_REGIONS),
+        engine = SCORING_ENGINE,
+        labels = option_names,
+        use_bundle = TEMPLATE_BUNDLE,
+        scale = layout.scale
+    )
+    return [(interface_recognizer, None), (option_recognizer, option_names)]
+
+
+def _init_worker(size: Tuple[int, int], shared: Optional[Tuple[str, Tuple[int, ...]]]) -> None:
+    # Load the templates once per worker, and attach the shared frame slots if any.
+    global _recognizers, _shared
+    logging.getLogger("mypackage").setLevel(logging.WARNING)
+    _recognizers = _build_recognizers(size)
+    if shared is not None:
+        memory = SharedMemory(name=shared[0])
+        _shared = (memory, numpy.ndarray(shared[1], numpy.uint8, memory.buf))
+
+
+def _analyze_frame(name: str, screen: Frame) -> List[Row]:
+    rows = []
+    try:
+        for recognizer, file_names in _recognizers:
+            for region_id, scores in recognizer.score(screen, file_names=file_names).items():
+                rows.extend((region_id, file_name, score) for file_name, score in scores.items())
+    except ValueError as e:
+        _logger.warning("Skip the frame [%s]: %s", name, e)
+        return []
+    return rows
+
+
+def _analyze_images(paths: List[str]) -> List[Tuple[str, List[Row]]]:
+    results = []
+    for path in paths:
+        name = os.path.basename(path)
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            _logger.warning("Skip the unreadable frame [%s];", name)
+            continue
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        results.append((name, _analyze_frame(name, Frame([((0, 0, image.shape[1], image.shape[0]), image)], 0.))))
+    return results
+
+
+def _analyze_slot(slot: int, name: str) -> List[Tuple[str, List[Row]]]:
+    # The frame is read in place from the shared memory, the slot is reused once the result is returned.
+    image = _shared[1][slot]
+    return [(name, _analyze_frame(name, Frame([((0, 0, image.shape[1], image.shape[0]), image)], 0.)))]
+
+
+def _analyze_chunk(session_dir: str, index: int) -> List[Tuple[str, List[Row]]]:
+    frames = load_chunk_frames(session_dir, index)
+    return [(f"chunk_{index:05d}/{position}", _analyze_frame(f"chunk_{index:05d}/{position}", frame)) for position, frame in enumerate(frames)]
+
+
+def _archive_kind(archive: str) -> str:
+    if os.path.isfile(os.path.join(archive, SESSION_META)):
+        return "session"
+    return "images" if os.path.isdir(archive) else "video"
+
+
+def _archive_size(archive: str, kind: str) -> Tuple[int, int]:
+    if kind == "session":
+        with open(os.path.join(archive, SESSION_META), "r", encoding="utf-8") as file:
+            return tuple(json.load(file)["size"])
+    return ReplayCapture(archive).size()
+
+
+def _video_results(pool: Pool, video: cv2.VideoCapture, slots: numpy.ndarray) -> Iterator[Tuple[str, List[Row]]]:
+    # Decode into a free slot, waiting for the oldest pending frame when all the slots are in use.
+    pending = deque()
+    free = list(range(len(slots)))
+    index = 0
+    while True:
+        if not free:
+            slot, result = pending.popleft()
+            yield from result.get()
+            free.append(slot)
+        is_read, image = video.read()
+        if not is_read:
+            break
+        slot = free.pop()
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=slots[slot])
+        pending.append((slot, pool.apply_async(_analyze_slot, (slot, f"{index:08d}"))))
+        index += 1
+    for _, result in pending:
+        yield from result.get()
+
+
+def analyze(archive: str, output: str, workers: int = 0) -> Dict[str, object]:
+    """
+    Score every frame of an archive with the interface and option recognizers, on a process pool.
+
+    Arguments:
+        archive (str): directory of images, video file, or recorded session directory;
+        output (str): path of the columnar results file (.npz);
+        workers (int): number of worker processes, one per core if 0.
+
+    Returns:
+        Dict[str, object]: numbers of workers, frames and rows, elapsed time and frames per second.
+    """
+
+    kind = _archive_kind(archive)
+    size = _archive_size(archive, kind)
+    workers = workers or os.cpu_count() or 1
+    # Build the bundles once, before the workers map them.
+    if TEMPLATE_BUNDLE:
+        scale = Layout(size, REFERENCE_RESOLUTION, REGION_ANCHORS).scale
+        load_bundle(INTERFACE_TEMPL_DIR, scale=scale)
+        load_bundle(OPTION_TEMPL_DIR, scale=scale)
+
+    frame_names: List[str] = []
+    columns: Dict[str, List] = {"frame": [], "region": [], "template": [], "score": []}
+    codes: Dict[str, Dict[str, int]] = {"region": {}, "template": {}}
+
+    def collect(results: Iterator[Tuple[str, List[Row]]]) -> None:
+        # Dictionary-encode the names into the integer columns.
+        for name, rows in results:
+            frame_code = len(frame_names)
+            frame_names.append(name)
+            for region_id, file_name, score in rows:
+                columns["frame"].append(frame_code)
+                columns["region"].append(codes["region"].setdefault(region_id, len(codes["region"])))
+                columns["template"].append(codes["template"].setdefault(file_name, len(codes["template"])))
+                columns["score"].append(score)
+
+    start = time.perf_counter()
+    if kind == "video":
+        video = cv2.VideoCapture(archive)
+        shape = (workers * SHARED_SLOTS_PER_WORKER, size[1], size[0], 3)
+        memory = SharedMemory(create=True, size=int(numpy.prod(shape)))
+        slots = numpy.ndarray(shape, numpy.uint8, memory.buf)
+        try:
+            with Pool(workers, _init_worker, (size, (memory.name, shape))) as pool:
+                collect(_video_results(pool, video, slots))
+        finally:
+            # Release the view before closing the shared memory.
+            slots = None
+            video.release()
+            memory.close()
+            memory.unlink()
+    else:
+        with Pool(workers, _init_worker, (size, None)) as pool:
+            if kind == "images":
+                paths = [
+                    os.path.join(archive, file) for file in sorted(os.listdir(archive))
+                    if os.path.splitext(file)[1].lower() in ReplayCapture.IMAGE_EXTENSIONS
+                ]
+                tasks = [paths[index: index + FRAMES_PER_TASK] for index in range(0, len(paths), FRAMES_PER_TASK)]
+                for results in pool.imap(_analyze_images, tasks):
+                    collect(results)
+            else:
+                with open(os.path.join(archive, SESSION_META), "r", encoding="utf-8") as file:
+                    chunk_count = json.load(file)["chunks"]
+                for results in pool.starmap(_analyze_chunk, [(archive, index) for index in range(chunk_count)]):
+                    collect(results)
+    elapsed = time.perf_counter() - start
+
+    numpy.savez_compressed(
+        output,
+        frame = numpy.array(columns["frame"], numpy.int32),
+        region = numpy.array(columns["region"], numpy.int32),
+        template = numpy.array(columns["template"], numpy.int32),
+        score = numpy.array(columns["score"], numpy.float32),
+        frame_names = numpy.array(frame_names),
+        region_names = numpy.array(list(codes["region"])),
+        template_names = numpy.array(list(codes["template"])),
+    )
+    return {
+        "archive": archive,
+        "kind": kind,
+        "workers": workers,
+        "frames": len(frame_names),
+        "rows": len(columns["score"]),
+        "seconds": elapsed,
+        "frames_per_second": len(frame_names) / elapsed if elapsed > 0 else 0.,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m mypackage.analyze", description="Re-score a frame archive with the recognizers, in parallel.")
+    parser.add_argument("archive", help="directory of images, video file, or recorded session directory")
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes, one per core by default")
+    parser.add_argument("--output", default="analysis.npz", help="columnar results file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s\t%(message)s")
+    print(json.dumps(analyze(args.archive, args.output, args.workers), indent=4))
+
+
+if __name__ == "__main__":
+    main()
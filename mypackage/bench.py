@@ -0,0 +1,588 @@
+# mypackage/bench.py
+"""
+Benchmarks of the program.
+
+Run from the project directory:
+    python -m mypackage.bench startup [--frames DIR] [--output FILE]
+    python -m mypackage.bench replay SESSION (--boon NAME --equation NAME | --combo BOON,EQUATION ...) [--latency-profile FILE] [--output FILE]
+    python -m mypackage.bench cascade ARCHIVE [--output FILE]
+    python -m mypackage.bench simulate (--boon NAME --equation NAME | --combo BOON,EQUATION ...) [--trials N] [--seed N] [--popups P] [--abort-drops P] [--latency-profile FILE] [--output FILE]
+    python -m mypackage.bench alloc [--frames SOURCE] [--ticks N] [--output FILE]
+
+startup: cold import time of each module, and time to construct the interface recognizer and run the first match() on a replayed frame.
+Each measurement runs in a fresh interpreter, so modules are not cached between them.
+
+replay: run Recognizer and Operator over a recorded session with fake input and virtual time,
+report per-tick latency percentiles, ticks per second and simulated attempts per hour.
+
+cascade: score recorded frames (directory of images, video file, or session) with the cascade and its full-resolution engine,
+recommend the highest coarse threshold rejecting no match, and report the rejection rate of each stage, the decisions changed and the time per region.
+
+simulate: run the whole loop against the simulated game with virtual time, until an acceptable combination is secured, for several seeds,
+playing each attempt to the end and aborting on miss; report ticks per second, the distribution of attempts to the target,
+simulated attempts per hour, the achievements not confirmed by the simulator, and how many runs ended on each combination.
+The goal is a single --boon/--equation pair, or ranked --combo combinations, e.g. --combo "baie,beiguolangmu" --combo "baie|tibao,*".
+With --popups, unexpected popups interrupt the simulated game, and the stalls and recovery actions of the watchdog are reported.
+With --abort-drops, the simulated game drops the abort key, and the attempts played to the end after the retries are reported.
+
+replay and simulate calibrate the waits with the latency profile (--latency-profile, LATENCY_PROFILE_FILE by default, empty for the configured times),
+shared by all the runs and saved at the end, so that running the benchmark again measures the calibrated waits.
+Replayed frames do not depend on the waits: measure the calibration with simulate.
+
+alloc: memory churn of the capture → crop → grayscale → score path, with and without REUSE_BUFFERS, each in a fresh interpreter:
+bytes allocated per grab and per match (traced by tracemalloc, freed or not), time per grab and per match, and peak RSS.
+"""
+
+from typing import Dict, List
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Modules whose cold import time is measured.
+STARTUP_MODULES = ["main", "mypackage.config", "numpy", "cv2", "mypackage.recognize", "mypackage.operate"]
+
+# Script measuring the time to first match, run in a fresh interpreter.
+_FIRST_MATCH_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from mypackage.recognize import Recognizer
+from mypackage.capture import ReplayCapture
+from mypackage.config import *
+imported = time.perf_counter()
+recognizer = Recognizer(
+    templates_dir = INTERFACE_TEMPL_DIR,
+    id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+    confidence_threshold = INTERFACE_MATCH_THRESHOLD,
+    id_to_coordinate = INTERFACE_REGIONS,
+    capture = ReplayCapture(sys.argv[1], loop = True),
+    engine = SCORING_ENGINE,
+    use_bundle = TEMPLATE_BUNDLE
+)
+constructed = time.perf_counter()
+recognizer.match()
+matched = time.perf_counter()
+print(json.dumps({"import": imported - start, "construct": constructed - imported, "first_match": matched - constructed, "total": matched - start}))
+"""
+
+
+# Script measuring the memory churn of the recognition path, run in a fresh interpreter.
+_ALLOC_SCRIPT = """
+import json, sys, time, tracemalloc
+from mypackage.recognize import Recognizer
+from mypackage.capture import ReplayCapture
+from mypackage.config import *
+try:
+    import resource
+except ImportError:
+    resource = None
+source, reuse, ticks = sys.argv[1], sys.argv[2] == "1", int(sys.argv[3])
+recognizer = Recognizer(
+    templates_dir = INTERFACE_TEMPL_DIR,
+    id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+    confidence_threshold = INTERFACE_MATCH_THRESHOLD,
+    id_to_coordinate = INTERFACE_REGIONS,
+    capture = ReplayCapture(source, loop = True, reuse_buffer = reuse),
+    engine = SCORING_ENGINE,
+    use_bundle = TEMPLATE_BUNDLE,
+    reuse_buffers = reuse
+)
+for _ in range(20):
+    recognizer.match(recognizer.capture.grab(recognizer.boxes))
+grab_time, match_time = 0., 0.
+for _ in range(ticks):
+    start = time.perf_counter()
+    screen = recognizer.capture.grab(recognizer.boxes)
+    middle = time.perf_counter()
+    recognizer.match(screen)
+    grab_time, match_time = grab_time + middle - start, match_time + time.perf_counter() - middle
+# Bytes allocated by each step, the peak over the memory in use before it.
+tracemalloc.start()
+grabbed, matched = 0, 0
+for _ in range(ticks):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    screen = recognizer.capture.grab(recognizer.boxes)
+    grabbed += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    recognizer.match(screen)
+    matched += tracemalloc.get_traced_memory()[1] - before
+    del screen
+tracemalloc.stop()
+print(json.dumps({
+    "grab_bytes_per_tick": grabbed / ticks,
+    "match_bytes_per_tick": matched / ticks,
+    "grab_ms": grab_time * 1000 / ticks,
+    "match_ms": match_time * 1000 / ticks,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None,
+}))
+"""
+
+
+def _run(code: str, *args: str) -> str:
+    # Run the code in a fresh interpreter from the project directory, and return its output.
+    return subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True, check=True).stdout
+
+
+def _write_blank_frame(directory: str) -> None:
+    # One black 1920×1080 frame, used when no frames are given.
+    import numpy, cv2
+    cv2.imwrite(os.path.join(directory, "blank.png"), numpy.zeros((1080, 1920, 3), numpy.uint8))
+
+
+def bench_startup(frames_dir: str = "") -> Dict[str, object]:
+    """
+    Measure the cold-start budget.
+
+    Arguments:
+        frames_dir (str): directory of frames replayed for the first match, a black frame if empty.
+
+    Returns:
+        Dict[str, object]: import time of each module, and the stages up to the first match, in seconds.
+    """
+
+    imports = {}
+    for module in STARTUP_MODULES:
+        imports[module] = float(_run(f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"))
+    with tempfile.TemporaryDirectory(prefix="idm_bench_") as blank_dir:
+        if not frames_dir:
+            _write_blank_frame(blank_dir)
+        first_match = json.loads(_run(_FIRST_MATCH_SCRIPT, frames_dir or blank_dir))
+    return {"imports": imports, "first_match": first_match}
+
+
+def bench_alloc(source: str = "", ticks: int = 200) -> Dict[str, object]:
+    """
+    Measure the memory churn of the recognition path, with and without reusing buffers.
+
+    Arguments:
+        source (str): directory of images or video file replayed, a black frame if empty;
+        ticks (int): grabs and matches measured.
+
+    Returns:
+        Dict[str, object]: for each setting ("allocating" and "reusing"), bytes allocated and time per grab and per match, and peak RSS in MB.
+    """
+
+    with tempfile.TemporaryDirectory(prefix="idm_bench_") as blank_dir:
+        if not source:
+            _write_blank_frame(blank_dir)
+        return {
+            mode: json.loads(_run(_ALLOC_SCRIPT, source or blank_dir, reuse, str(ticks)))
+            for mode, reuse in (("allocating", "0"), ("reusing", "1"))
+        }
+
+
+def percentiles(samples: List[float], scale: float = 1000) -> Dict[str, float]:
+    """
+    Summarize latency samples.
+
+    Arguments:
+        samples (List[float]): latencies, in seconds;
+        scale (float): factor applied to the results, from seconds to milliseconds by default.
+
+    Returns:
+        Dict[str, float]: p50, p90, p99 and max, in milliseconds.
+    """
+
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda ratio: ordered[min(int(ratio * len(ordered)), len(ordered) - 1)] * scale
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1] * scale}
+
+
+def bench_replay(session_dir: str, combinations: List[Dict[str, object]], latency_profile_path: str = "") -> Dict[str, object]:
+    """
+    Replay a recorded session through Recognizer and Operator.
+
+    Arguments:
+        session_dir (str): directory of the recorded session;
+        combinations (List[Dict[str, object]]): acceptable combinations, most valuable first;
+        latency_profile_path (str): latency profile calibrating the waits, saved at the end, empty to use the configured times.
+
+    Returns:
+        Dict[str, object]: tick latency percentiles, ticks per second, and attempts per hour of simulated time.
+    """
+
+    from mypackage.goal import Goal
+    from mypackage.recognize import Recognizer
+    from mypackage.operate import Operator
+    from mypackage.latency import LatencyProfile
+    from mypackage.transition import TransitionModel
+    from mypackage.layout import Layout
+    from mypackage.clock import VirtualClock
+    from mypackage.inputs import FakeInput
+    from mypackage.session import SessionCapture
+    from mypackage.runtime import Runner
+    from mypackage.config import (
+        INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_MATCH_THRESHOLD, INTERFACE_FLOW, OPTION_REGIONS,
+        SCORING_ENGINE, SCORE_CACHE_SIZE, TEMPLATE_BUNDLE, REFERENCE_RESOLUTION, REGION_ANCHORS, CALIBRATION_FILE,
+    )
+    from mypackage.exceptions import CaptureExhaustedError, TargetAchievedError
+
+    clock = VirtualClock()
+    capture = SessionCapture(session_dir, clock)
+    layout = Layout(capture.size(), REFERENCE_RESOLUTION, REGION_ANCHORS)
+    transitions = TransitionModel(INTERFACE_FLOW)
+    interface_matcher = Recognizer(
+        templates_dir = INTERFACE_TEMPL_DIR,
+        id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+        confidence_threshold = INTERFACE_MATCH_THRESHOLD,
+        id_to_coordinate = layout.regions(INTERFACE_REGIONS),
+        capture = capture,
+        engine = SCORING_ENGINE,
+        transitions = transitions,
+        cache_size = SCORE_CACHE_SIZE,
+        use_bundle = TEMPLATE_BUNDLE,
+        scale = layout.scale,
+        clock = clock,
+        calibration_file = CALIBRATION_FILE
+    )
+    fake_input = FakeInput(clock)
+    latency_profile = LatencyProfile(latency_profile_path) if latency_profile_path else None
+    operator = Operator(
+        OPTION_REGIONS, Goal(combinations), capture, layout = layout, input_backend = fake_input, clock = clock, latency_profile = latency_profile
+    )
+    runner = Runner(interface_matcher, operator, transitions, max_attempt_count = float("inf"))
+
+    # Run until the recording ends, or the target is achieved as in the recorded run.
+    start_time, start = clock.time(), time.perf_counter()
+    is_achieved = False
+    try:
+        runner.run()
+    except CaptureExhaustedError:
+        pass
+    except TargetAchievedError:
+        is_achieved = True
+    elapsed, simulated = time.perf_counter() - start, clock.time() - start_time
+    if latency_profile is not None:
+        latency_profile.save()
+
+    return {
+        "ticks": len(runner.tick_latencies),
+        "tick_latency_ms": percentiles(runner.tick_latencies),
+        "ticks_per_second": len(runner.tick_latencies) / elapsed if elapsed > 0 else 0.,
+        "attempts": runner.attempts,
+        "simulated_seconds": simulated,
+        "attempts_per_hour": runner.attempts * 3600 / simulated if simulated > 0 else 0.,
+        "actions": len(fake_input.actions),
+        "target_achieved": is_achieved,
+        "latency_profile": latency_profile_path,
+    }
+
+
+def bench_cascade(archive: str) -> Dict[str, object]:
+    """
+    Tune the coarse threshold of the cascade engine on recorded frames.
+
+    Interface regions are scored against their own template, option slots against all the option templates, as in the program.
+
+    Arguments:
+        archive (str): directory of images, video file, or recorded session directory.
+
+    Returns:
+        Dict[str, object]: coarse confidences of matches and non-matches, recommended threshold,
+            and for the configured and recommended thresholds: rejection rates per stage, decisions changed, time per region.
+    """
+
+    from mypackage.capture import ReplayCapture
+    from mypackage.recognize import Recognizer
+    from mypackage.layout import Layout
+    from mypackage.session import SESSION_META, load_chunk_frames
+    from mypackage.config import (
+        INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_MATCH_THRESHOLD, OPTION_TEMPL_DIR, OPTION_REGIONS, OPTION_MATCH_THRESHOLD,
+        CASCADE_FULL_ENGINE, CASCADE_COARSE_THRESHOLD, TEMPLATE_BUNDLE, REFERENCE_RESOLUTION, REGION_ANCHORS,
+    )
+    from mypackage.exceptions import CaptureExhaustedError
+
+    # Load the frames.
+    if os.path.isfile(os.path.join(archive, SESSION_META)):
+        with open(os.path.join(archive, SESSION_META), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        size = tuple(meta["size"])
+        frames = [frame for index in range(meta["chunks"]) for frame in load_chunk_frames(archive, index)]
+    else:
+        capture = ReplayCapture(archive)
+        size = capture.size()
+        frames = []
+        try:
+            while True:
+                frames.append(capture.grab([]))
+        except CaptureExhaustedError:
+            pass
+
+    # (cascade recognizer, full-resolution recognizer, templates scored on each region, match threshold) of interfaces and options.
+    layout = Layout(size, REFERENCE_RESOLUTION, REGION_ANCHORS)
+    option_names = sorted(os.path.splitext(file)[0] for file in os.listdir(OPTION_TEMPL_DIR) if file.lower().endswith(".png"))
+    kinds = []
+    for templates_dir, regions, file_names, threshold in (
+        (INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, None, INTERFACE_MATCH_THRESHOLD),
+        (OPTION_TEMPL_DIR, OPTION_REGIONS, option_names, OPTION_MATCH_THRESHOLD),
+    ):
+        recognizers = [
+            Recognizer(
+                templates_dir = templates_dir,
+                id_to_file_name = {id: id for id in regions} if file_names is None else {},
+                confidence_threshold = threshold,
+                id_to_coordinate = layout.regions(regions),
+                engine = engine,
+                labels = file_names,
+                use_bundle = TEMPLATE_BUNDLE,
+                scale = layout.scale
+            )
+            for engine in ("cascade", CASCADE_FULL_ENGINE)
+        ]
+        kinds.append((*recognizers, file_names, threshold))
+
+    # Coarse and full confidences of every (frame, region, template).
+    positives, negatives = [], []
+    for cascade, full, file_names, threshold in kinds:
+        for frame in frames:
+            for region_id, scores in full.score(frame, file_names=file_names).items():
+                image = frame.gray_crop(full.id_to_coordinate[region_id])
+                coarse = cascade.engine.coarse(image, list(scores))
+                for name, score in scores.items():
+                    if score > -1:
+                        (positives if score > threshold else negatives).append(coarse[name])
+    recommended = round(min(positives) - 0.05, 2) if positives else CASCADE_COARSE_THRESHOLD
+
+    def evaluate(coarse_threshold: float) -> Dict[str, object]:
+        # Rejection rates, decisions changed and time per region of the cascade, against the full-resolution engine.
+        changed, regions, cascade_time, full_time = 0, 0, 0., 0.
+        stats = {"candidates": 0, "flat": 0, "coarse": 0, "full": 0}
+        for cascade, full, file_names, threshold in kinds:
+            cascade.engine.coarse_threshold = coarse_threshold
+            cascade.engine.stats = dict.fromkeys(stats, 0)
+            for frame in frames:
+                start = time.perf_counter()
+                cascade_scores = cascade.score(frame, file_names=file_names)
+                middle = time.perf_counter()
+                full_scores = full.score(frame, file_names=file_names)
+                cascade_time, full_time = cascade_time + middle - start, full_time + time.perf_counter() - middle
+                regions += len(full_scores)
+                for region_id, scores in full_scores.items():
+                    changed += sum((scores[name] > threshold) != (cascade_scores[region_id][name] > threshold) for name in scores)
+            stats = {key: stats[key] + value for key, value in cascade.engine.stats.items()}
+        candidates = max(stats["candidates"], 1)
+        return {
+            "coarse_threshold": coarse_threshold,
+            "rejected_flat": stats["flat"] / candidates,
+            "rejected_coarse": stats["coarse"] / candidates,
+            "scored_full": stats["full"] / candidates,
+            "decisions_changed": changed,
+            "cascade_ms_per_region": cascade_time * 1000 / max(regions, 1),
+            "full_ms_per_region": full_time * 1000 / max(regions, 1),
+        }
+
+    return {
+        "frames": len(frames),
+        "matches": len(positives),
+        "non_matches": len(negatives),
+        "min_coarse_of_matches": min(positives, default=None),
+        "max_coarse_of_non_matches": max(negatives, default=None),
+        "recommended_threshold": recommended,
+        "configured": evaluate(CASCADE_COARSE_THRESHOLD),
+        "recommended": evaluate(recommended),
+    }
+
+
+def bench_simulate(
+    combinations: List[Dict[str, object]], trials: int = 20, seed: int = 0, max_attempts: int = 1000, popup_probability: float = 0.,
+    abort_drop_probability: float = 0., latency_profile_path: str = ""
+) -> Dict[str, object]:
+    """
+    Run Recognizer, Operator and Runner against the simulated game until an acceptable combination is secured.
+
+    Options are matched against the names of the combinations only, the histogram of observed options is not fed with simulated rolls.
+
+    Arguments:
+        combinations (List[Dict[str, object]]): acceptable combinations, most valuable first;
+        trials (int): runs per mode, each with its own seed;
+        seed (int): seed of the first run;
+        max_attempts (int): attempts after which a run gives up;
+        popup_probability (float): probability of a popup after each transition of the simulated game;
+        abort_drop_probability (float): probability the simulated game drops the abort key;
+        latency_profile_path (str): latency profile calibrating the waits, shared by all the runs and saved at the end, empty to use the configured times.
+
+    Returns:
+        Dict[str, object]: for playing to the end ("play") and aborting on miss ("abort"): ticks and captures per second,
+            percentiles of the attempts to the target, attempts per hour of simulated time, runs given up, wrong achievements,
+            the number of runs ending on each combination, the popups, stalls and recovery actions,
+            and the abort keys dropped and the attempts played to the end because of them; and the latency profile used.
+    """
+
+    from mypackage.goal import Goal
+    from mypackage.recognize import Recognizer
+    from mypackage.operate import Operator
+    from mypackage.latency import LatencyProfile
+    from mypackage.transition import TransitionModel
+    from mypackage.clock import VirtualClock
+    from mypackage.simulate import GameSimulator
+    from mypackage.runtime import Runner
+    from mypackage.watchdog import Watchdog
+    from mypackage.config import (
+        INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_MATCH_THRESHOLD, INTERFACE_FLOW, ABORT_FLOW, OPTION_REGIONS,
+        SCORING_ENGINE, SCORE_CACHE_SIZE, TEMPLATE_BUNDLE, CALIBRATION_FILE,
+    )
+    from mypackage.exceptions import MaxAttemptCountExceededError, TargetAchievedError
+
+    latency_profile = LatencyProfile(latency_profile_path) if latency_profile_path else None
+    results = {}
+    for mode, abort_on_miss in (("play", False), ("abort", True)):
+        flow = {
+            id: list(dict.fromkeys(INTERFACE_FLOW.get(id, []) + (ABORT_FLOW.get(id, []) if abort_on_miss else [])))
+            for id in {**INTERFACE_FLOW, **ABORT_FLOW}
+        }
+        attempts, ticks, grabs, elapsed, simulated, given_up, wrong = [], 0, 0, 0., 0., 0, 0
+        secured = [0] * len(combinations)
+        popups, stalls, recoveries, dropped_aborts, abort_failures = 0, 0, 0, 0, 0
+        for trial in range(trials):
+            clock = VirtualClock()
+            simulator = GameSimulator(clock, seed + trial, popup_probability, abort_drop_probability)
+            transitions = TransitionModel(flow)
+            interface_matcher = Recognizer(
+                templates_dir = INTERFACE_TEMPL_DIR,
+                id_to_file_name = {id: id for id in INTERFACE_REGIONS.keys()},
+                confidence_threshold = INTERFACE_MATCH_THRESHOLD,
+                id_to_coordinate = INTERFACE_REGIONS,
+                capture = simulator,
+                engine = SCORING_ENGINE,
+                transitions = transitions,
+                cache_size = SCORE_CACHE_SIZE,
+                use_bundle = TEMPLATE_BUNDLE,
+                clock = clock,
+                calibration_file = CALIBRATION_FILE
+            )
+            goal = Goal(combinations)
+            operator = Operator(
+                OPTION_REGIONS, goal, simulator, input_backend = simulator, clock = clock, abort_on_miss = abort_on_miss, latency_profile = latency_profile
+            )
+            watchdog = Watchdog(operator, simulator, frames_dir = "")
+            runner = Runner(interface_matcher, operator, transitions, max_attempts, watchdog = watchdog)
+
+            start = time.perf_counter()
+            try:
+                runner.run()
+            except TargetAchievedError:
+                attempts.append(runner.attempts)
+                # The selections confirmed in the simulated game must make up the secured combination.
+                combination = goal.secured()
+                secured[combinations.index(combination)] += 1
+                check = Goal([combination])
+                for interface_id, name in simulator.selected.items():
+                    check.select(interface_id, name)
+                wrong += check.secured() is None
+            except MaxAttemptCountExceededError:
+                given_up += 1
+            elapsed += time.perf_counter() - start
+            ticks += len(runner.tick_latencies)
+            grabs += simulator.grabs
+            popups, stalls, recoveries = popups + simulator.popups, stalls + watchdog.stalls, recoveries + watchdog.recoveries
+            dropped_aborts, abort_failures = dropped_aborts + simulator.dropped_aborts, abort_failures + operator.abort_failures
+            simulated += clock.time()
+
+        results[mode] = {
+            "ticks_per_second": ticks / elapsed if elapsed > 0 else 0.,
+            "captures_per_second": grabs / elapsed if elapsed > 0 else 0.,
+            "attempts_to_target": {"mean": sum(attempts) / len(attempts) if attempts else None, **percentiles(attempts, 1)},
+            "attempts_per_hour": (sum(attempts) + given_up * max_attempts) * 3600 / simulated if simulated > 0 else 0.,
+            "given_up": given_up,
+            "wrong_achievements": wrong,
+            "secured_combinations": secured,
+            "popups": popups,
+            "stalls": stalls,
+            "recovery_actions": recoveries,
+            "dropped_aborts": dropped_aborts,
+            "abort_failures": abort_failures,
+        }
+    if latency_profile is not None:
+        latency_profile.save()
+    results["latency_profile"] = latency_profile_path
+    return results
+
+
+def _add_goal_arguments(parser: argparse.ArgumentParser) -> None:
+    from mypackage.config import LATENCY_PROFILE_FILE
+
+    parser.add_argument("--boon", default="", help="target golden blood's boon, shorthand for a single combination with --equation")
+    parser.add_argument("--equation", default="", help="target equation")
+    parser.add_argument(
+        "--combo", action="append", default=[],
+        help='acceptable combination "BOON,EQUATION", alternatives separated by "|", "*" for any option; repeat in order of value'
+    )
+    parser.add_argument(
+        "--latency-profile", default=LATENCY_PROFILE_FILE,
+        help="latency profile calibrating the waits, updated with the measured latencies; empty to use the configured times"
+    )
+
+
+def _goal_combinations(args: argparse.Namespace, parser: argparse.ArgumentParser) -> List[Dict[str, object]]:
+    from mypackage.goal import Goal, parse_combination
+
+    interfaces = ["select_golden_bloods_boon", "select_equation"]
+    combinations = [parse_combination(text, interfaces) for text in args.combo]
+    if args.boon or args.equation:
+        combinations.insert(0, parse_combination(f"{args.boon or '*'},{args.equation or '*'}", interfaces))
+    if not combinations:
+        parser.error("a goal is required: --boon and --equation, or --combo")
+    try:
+        Goal(combinations)
+    except ValueError as e:
+        parser.error(str(e))
+    return combinations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m mypackage.bench", description="Benchmarks of the program.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    startup_parser = subparsers.add_parser("startup", help="cold import time and time to first match")
+    startup_parser.add_argument("--frames", default="", help="directory of frames replayed for the first match")
+    startup_parser.add_argument("--output", default="", help="JSON lines file the result is appended to, for tracking across releases")
+    replay_parser = subparsers.add_parser("replay", help="replay a recorded session with fake input and virtual time")
+    replay_parser.add_argument("session", help="directory of the recorded session")
+    _add_goal_arguments(replay_parser)
+    replay_parser.add_argument("--output", default="", help="JSON lines file the result is appended to")
+    cascade_parser = subparsers.add_parser("cascade", help="tune the coarse threshold of the cascade engine on recorded frames")
+    cascade_parser.add_argument("archive", help="directory of images, video file, or recorded session directory")
+    cascade_parser.add_argument("--output", default="", help="JSON lines file the result is appended to")
+    simulate_parser = subparsers.add_parser("simulate", help="run the loop against the simulated game until the target is achieved")
+    _add_goal_arguments(simulate_parser)
+    simulate_parser.add_argument("--trials", type=int, default=20, help="runs per mode, each with its own seed")
+    simulate_parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    simulate_parser.add_argument("--popups", type=float, default=0., help="probability of an unexpected popup after each transition")
+    simulate_parser.add_argument("--abort-drops", type=float, default=0., help="probability the abort key is dropped on a selection interface")
+    simulate_parser.add_argument("--output", default="", help="JSON lines file the result is appended to")
+    alloc_parser = subparsers.add_parser("alloc", help="memory churn of the recognition path, with and without reusing buffers")
+    alloc_parser.add_argument("--frames", default="", help="directory of images or video file replayed, a black frame if omitted")
+    alloc_parser.add_argument("--ticks", type=int, default=200, help="grabs and matches measured")
+    alloc_parser.add_argument("--output", default="", help="JSON lines file the result is appended to")
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        result = bench_startup(args.frames)
+    elif args.command == "replay":
+        result = bench_replay(args.session, _goal_combinations(args, parser), args.latency_profile)
+    elif args.command == "cascade":
+        result = bench_cascade(args.archive)
+    elif args.command == "simulate":
+        result = bench_simulate(
+            _goal_combinations(args, parser), args.trials, args.seed, popup_probability = args.popups, abort_drop_probability = args.abort_drops,
+            latency_profile_path = args.latency_profile
+        )
+    elif args.command == "alloc":
+        result = bench_alloc(args.frames, args.ticks)
+
+    result = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "command": args.command, **result}
+    print(json.dumps(result, indent=4))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# mypackage/bundle.py
+"""
+Defines the template bundle.
+
+A bundle packs all the grayscale templates of a directory into one versioned binary file:
+* magic, version and header length;
+* JSON header, with the content hash of the source PNGs, the scale, and the index of templates (shape, offset, mean, norm);
+* raw uint8 image data, memory-mapped on loading.
+
+Templates rescaled for another resolution are cached in their own bundle per scale.
+
+Build bundles ahead of time with:
+    python -m mypackage.bundle interface_templates option_templates
+"""
+
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import numpy
+import cv2
+
+from mypackage.layout import scale_template
+
+
+BUNDLE_MAGIC: bytes = b"IDMB"
+BUNDLE_VERSION: int = 1
+BUNDLE_EXTENSION: str = ".bundle"
+_PREFIX = struct.Struct("<4sII")   # magic, version, header length.
+_ALIGNMENT = 64                    # Alignment of the image data.
+
+_logger = logging.getLogger(__name__)
+
+
+def bundle_path(templates_dir: str, scale: float = 1) -> str:
+    """
+    Path of the bundle built from a template directory.
+
+    Arguments:
+        templates_dir (str): directory of template image files;
+        scale (float): scale of the templates.
+
+    Returns:
+        str: path of the bundle file.
+    """
+
+    suffix = "" if scale == 1 else f"@{scale:.4f}"
+    return os.path.normpath(templates_dir) + suffix + BUNDLE_EXTENSION
+
+
+def _template_files(templates_dir: str) -> Dict[str, str]:
+    # Mapping from template file name (excluding extension) to path.
+    return {
+        os.path.splitext(file)[0]: os.path.join(templates_dir, file)
+        for file in sorted(os.listdir(templates_dir)) if file.lower().endswith(".png")
+    }
+
+
+def source_hash(templates_dir: str) -> str:
+    """
+    Hash the content of the template files, reading the bytes without decoding them.
+
+    Arguments:
+        templates_dir (str): directory of template image files.
+
+    Returns:
+        str: hex digest of the names and contents of the PNG files.
+    """
+
+    digest = hashlib.sha1()
+    for name, path in _template_files(templates_dir).items():
+        digest.update(name.encode("utf-8"))
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def build_bundle(templates_dir: str, path: Optional[str] = None, scale: float = 1) -> str:
+    """
+    Pack the templates of a directory into a bundle.
+
+    Arguments:
+        templates_dir (str): directory of template image files;
+        path (Optional[str]): path of the bundle file, next to the directory by default;
+        scale (float): scale the templates are resized by.
+
+    Returns:
+        str: path of the bundle file.
+    """
+
+    path = path or bundle_path(templates_dir, scale)
+    index = {}
+    blobs = []
+    offset = 0
+    for name, template_path in _template_files(templates_dir).items():
+        template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+        if template is None:
+            continue
+        template = scale_template(template, scale)
+        vector = template.astype(numpy.float32).ravel()
+        mean = float(vector.mean())
+        index[name] = {
+            "shape": list(template.shape),
+            "offset": offset,
+            "mean": mean,
+            "norm": float(numpy.linalg.norm(vector - mean)),
+        }
+        blobs.append(template.tobytes())
+        offset += template.size
+
+    header = json.dumps({"hash": source_hash(templates_dir), "scale": scale, "templates": index}).encode("utf-8")
+    # Pad the header, so that the image data is aligned.
+    data_offset = -(-(_PREFIX.size + len(header)) // _ALIGNMENT) * _ALIGNMENT
+    header += b" " * (data_offset - _PREFIX.size - len(header))
+
+    # Write to a temporary file of this builder first, so that a concurrent reader never sees a partial bundle,
+    # and concurrent builders (e.g. the workers of mypackage.analyze) never write into the same file.
+    descriptor, temporary_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(_PREFIX.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(header)))
+            file.write(header)
+            for blob in blobs:
+                file.write(blob)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    _logger.info("Success to build the bundle '%s' with %d templates;\n", path, len(index))
+    return path
+
+
+def _read_header(path: str) -> Optional[Tuple[dict, int]]:
+    # Header and data offset of the bundle, None if it is not a valid bundle of the current version.
+    with open(path, "rb") as file:
+        prefix = file.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            return None
+        magic, version, header_length = _PREFIX.unpack(prefix)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            return None
+        return json.loads(file.read(header_length)), _PREFIX.size + header_length
+
+
+def load_bundle(templates_dir: str, path: Optional[str] = None, scale: float = 1) -> Optional[Dict[str, Tuple[numpy.ndarray, float, float]]]:
+    """
+    Memory-map the bundle of a template directory, rebuilding it when the source PNGs changed.
+
+    Arguments:
+        templates_dir (str): directory of template image files;
+        path (Optional[str]): path of the bundle file, next to the directory by default;
+        scale (float): scale of the templates, a bundle is built once per scale.
+
+    Returns:
+        Optional[Dict[str, Tuple[numpy.ndarray, float, float]]]: mapping from template file name to (template image data, mean, norm), None if the bundle is unusable.
+    """
+
+    path = path or bundle_path(templates_dir, scale)
+    try:
+        current_hash = source_hash(templates_dir)
+        header = _read_header(path) if os.path.isfile(path) else None
+        if header is None or header[0]["hash"] != current_hash or header[0].get("scale", 1) != scale:
+            _logger.info("Template bundle '%s' missing or outdated, rebuilding...", path)
+            build_bundle(templates_dir, path, scale)
+            header = _read_header(path)
+        index, data_offset = header[0]["templates"], header[1]
+        data = numpy.memmap(path, dtype=numpy.uint8, mode="r", offset=data_offset) if index else None
+    except (OSError, ValueError, KeyError) as e:
+        _logger.warning("Fail to load the template bundle '%s': %s;", path, e)
+        return None
+
+    templates = {}
+    for name, entry in index.items():
+        height, width = entry["shape"]
+        image = data[entry["offset"]: entry["offset"] + height * width].reshape(height, width)
+        templates[name] = (image, entry["mean"], entry["norm"])
+    return templates
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s\t%(message)s")
+    for directory in sys.argv[1:]:
+        build_bundle(directory)
@@ -0,0 +1,85 @@
+# mypackage/cache.py
+"""
+Defines ScoreCache class.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import numpy
+
+
+class ScoreCache:
+    """
+    Memoize the scores of characteristic regions whose pixels are unchanged.
+
+    Entries are keyed by the region coordinates and a fast hash of the downsampled grayscale crop, and the least recently used entry is evicted when full.
+
+    Arguments:
+        capacity (int): maximum number of entries;
+        step (int): downsampling step of the crop before hashing.
+
+    Attributes:
+        hits (int): times the scores were found in the cache;
+        misses (int): times the scores had to be computed;
+        _entries (OrderedDict[Hashable, Dict[str, float]]): mapping from key to scores, in order of use.
+    """
+
+    def __init__(self, capacity: int, step: int) -> None:
+
+        # Configuration parameters.
+        self.capacity = capacity
+        self.step = step
+
+        # State variables.
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Dict[str, float]]" = OrderedDict()
+
+
+    def key(self, region_coor: Tuple[int, int, int, int], image: numpy.ndarray) -> Hashable:
+        """
+        Build the cache key of a characteristic image.
+
+        Arguments:
+            region_coor (Tuple[int, int, int, int]): characteristic region coordinates;
+            image (numpy.ndarray): grayscale characteristic image data.
+
+        Returns:
+            Hashable: the cache key.
+        """
+
+        return (region_coor, hash(image[::self.step, ::self.step].tobytes()))
+
+
+    def get(self, key: Hashable) -> Optional[Dict[str, float]]:
+        """
+        Look up the scores.
+
+        Arguments:
+            key (Hashable): the cache key.
+
+        Returns:
+            Optional[Dict[str, float]]: the memoized scores, None if not cached.
+        """
+
+        scores = self._entries.get(key)
+        if scores is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return scores
+
+
+    def put(self, key: Hashable, scores: Dict[str, float]) -> None:
+        """
+        Memoize the scores, evicting the least recently used entry when full.
+
+        Arguments:
+            key (Hashable): the cache key;
+            scores (Dict[str, float]): scores of the characteristic image.
+        """
+
+        self._entries[key] = scores
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
@@ -0,0 +1,226 @@
+# mypackage/calibrate.py
+"""
+Calibration of the match thresholds on a labelled frame set.
+
+Every frame is scored against every (region, template) pair in parallel with mypackage.analyze (process pool, batched scoring),
+then, for each template:
+* the confidence threshold separating the frames showing it (positives) from the others (negatives);
+* for option templates, the threshold of the margin of the best template over the second best, on the slots where it scores best;
+* the ROC and precision at thresholds from 0 to 1, to check the choice.
+A separable template gets the midpoint between its lowest positive and highest negative, otherwise the threshold with the best F1 score.
+Templates without positive frames are left out, and keep the global thresholds.
+
+Run from the project directory:
+    python -m mypackage.calibrate ARCHIVE --labels FILE [--workers N] [--scores FILE] [--output FILE]
+
+ARCHIVE is a directory of images, a video file, or a recorded session directory, as for mypackage.analyze.
+The labels file is JSON, mapping each frame name (image file name, video frame index "%08d", or session "chunk_NNNNN/position")
+to what the frame shows: {"interface": interface ID or "unmatched", option slot ID: option name or "unknown", ...}.
+Missing keys are not used, e.g. frames labelled with the interface only calibrate the interface templates.
+
+The output (CALIBRATION_FILE) is loaded by Recognizer, per templates directory, in place of the global confidence threshold.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import tempfile
+import numpy
+
+from mypackage.config import (
+    INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_MATCH_THRESHOLD, OPTION_TEMPL_DIR, OPTION_REGIONS, OPTION_MATCH_THRESHOLD, CALIBRATION_FILE,
+)
+
+
+CALIBRATION_VERSION: int = 1
+ROC_STEPS: int = 101    # Thresholds of the ROC, evenly spaced from 0 to 1.
+
+
+def _templates_key(templates_dir: str) -> str:
+    # Section of the calibration file of a templates directory.
+    return os.path.basename(os.path.normpath(templates_dir))
+
+
+def load_calibration(path: str, templates_dir: str) -> Dict[str, Dict[str, object]]:
+    """
+    Load the calibration of the templates of a directory.
+
+    Arguments:
+        path (str): calibration file;
+        templates_dir (str): directory of the templates.
+
+    Returns:
+        Dict[str, Dict[str, object]]: mapping from template file name to its calibration ("threshold", "margin", ...), empty if the file is missing.
+    """
+
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)["templates"].get(_templates_key(templates_dir), {})
+
+
+def _roc(positives: numpy.ndarray, negatives: numpy.ndarray) -> List[List[float]]:
+    # (threshold, true positive rate, false positive rate, precision) of "score > threshold", vectorized over the thresholds.
+    thresholds = numpy.linspace(0, 1, ROC_STEPS)
+    true = len(positives) - numpy.searchsorted(numpy.sort(positives), thresholds, side="right")
+    false = len(negatives) - numpy.searchsorted(numpy.sort(negatives), thresholds, side="right")
+    tpr = true / max(len(positives), 1)
+    fpr = false / max(len(negatives), 1)
+    precision = numpy.where(true + false > 0, true / numpy.maximum(true + false, 1), 1.)
+    return [[round(float(value), 4) for value in row] for row in zip(thresholds, tpr, fpr, precision)]
+
+
+def choose_threshold(positives: numpy.ndarray, negatives: numpy.ndarray, default: float) -> Tuple[float, bool]:
+    """
+    Choose the threshold of "value > threshold" separating positive from negative values.
+
+    Arguments:
+        positives (numpy.ndarray): values that must pass;
+        negatives (numpy.ndarray): values that must not pass;
+        default (float): threshold when there are no negatives, lowered to let every positive pass.
+
+    Returns:
+        Tuple[float, bool]: the threshold, and whether it separates all the values.
+    """
+
+    lowest = float(positives.min())
+    if not len(negatives):
+        return min(default, lowest - 1e-3), True
+    highest = float(negatives.max())
+    if lowest > highest:
+        return (lowest + highest) / 2, True
+    # Overlapping: best F1 score over the candidate thresholds, the values themselves.
+    candidates = numpy.unique(numpy.concatenate([positives, negatives]))
+    true = len(positives) - numpy.searchsorted(numpy.sort(positives), candidates, side="right")
+    false = len(negatives) - numpy.searchsorted(numpy.sort(negatives), candidates, side="right")
+    f1 = 2 * true / numpy.maximum(2 * true + false + (len(positives) - true), 1)
+    return float(candidates[int(numpy.argmax(f1))]), False
+
+
+def _calibrate_template(positives: numpy.ndarray, negatives: numpy.ndarray, default: float) -> Dict[str, object]:
+    threshold, separable = choose_threshold(positives, negatives, default)
+    return {
+        "threshold": round(threshold, 4),
+        "positives": int(len(positives)),
+        "negatives": int(len(negatives)),
+        "separable": separable,
+        "misses": int((positives <= threshold).sum()),
+        "false_positives": int((negatives > threshold).sum()),
+        "default_misses": int((positives <= default).sum()),
+        "default_false_positives": int((negatives > default).sum()),
+        "roc": _roc(positives, negatives),
+    }
+
+
+def calibrate(scores_path: str, labels: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Dict[str, object]]]:
+    """
+    Calibrate the thresholds of every template from the scores of a labelled frame set.
+
+    Arguments:
+        scores_path (str): columnar scores written by mypackage.analyze;
+        labels (Dict[str, Dict[str, str]]): mapping from frame name to what it shows.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, object]]]: mapping from templates directory section to mapping from template file name to its calibration.
+    """
+
+    with numpy.load(scores_path) as columns:
+        frames, regions, templates, scores = columns["frame"], columns["region"], columns["template"], columns["score"]
+        frame_names, region_names, template_names = list(columns["frame_names"]), list(columns["region_names"]), list(columns["template_names"])
+
+    # Label of each row's region in its frame, "" if not labelled.
+    frame_labels = [labels.get(name, {}) for name in frame_names]
+    interface_label = numpy.array([label.get("interface", "") for label in frame_labels])
+    region_code = {name: code for code, name in enumerate(region_names)}
+    template_code = {name: code for code, name in enumerate(template_names)}
+    results: Dict[str, Dict[str, Dict[str, object]]] = {_templates_key(INTERFACE_TEMPL_DIR): {}, _templates_key(OPTION_TEMPL_DIR): {}}
+
+    # Interface templates, each scored on its own region: positive on the frames labelled with it.
+    for interface_id in INTERFACE_REGIONS:
+        if interface_id not in region_code or interface_id not in template_code:
+            continue
+        rows = (regions == region_code[interface_id]) & (templates == template_code[interface_id])
+        row_labels = interface_label[frames[rows]]
+        labelled = row_labels != ""
+        is_positive = row_labels[labelled] == interface_id
+        values = scores[rows][labelled]
+        if is_positive.any():
+            results[_templates_key(INTERFACE_TEMPL_DIR)][interface_id] = {
+                **_calibrate_template(values[is_positive], values[~is_positive], INTERFACE_MATCH_THRESHOLD), "margin": None,
+            }
+
+    # Option templates, scored on every slot: positive on the slots labelled with it; templates of another size (-1) are left out.
+    slots = [slot for slot in OPTION_REGIONS if slot in region_code]
+    option_rows = numpy.isin(regions, [region_code[slot] for slot in slots]) & (scores > -1)
+    slot_label = {slot: numpy.array([label.get(slot, "") for label in frame_labels]) for slot in slots}
+    row_label = numpy.full(len(scores), "", dtype=object)
+    for slot in slots:
+        rows = option_rows & (regions == region_code[slot])
+        row_label[rows] = slot_label[slot][frames[rows]]
+    option_rows &= row_label != ""
+    # Best and second best template of each labelled (frame, slot), for the margins.
+    keys = frames[option_rows].astype(numpy.int64) * len(region_names) + regions[option_rows]
+    order = numpy.lexsort((-scores[option_rows], keys))
+    sorted_keys, sorted_scores, sorted_templates = keys[order], scores[option_rows][order], templates[option_rows][order]
+    starts = numpy.flatnonzero(numpy.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = numpy.r_[starts[1:], len(sorted_keys)]
+    best_template = sorted_templates[starts]
+    margins = sorted_scores[starts] - numpy.where(ends - starts > 1, sorted_scores[numpy.minimum(starts + 1, len(sorted_scores) - 1)], -1.)
+    best_label = row_label[option_rows][order][starts]
+
+    for name in template_names:
+        code = template_code[name]
+        rows = option_rows & (templates == code)
+        if not rows.any():
+            continue
+        is_positive = row_label[rows] == name
+        if not is_positive.any():
+            continue
+        calibration = _calibrate_template(scores[rows][is_positive], scores[rows][~is_positive], OPTION_MATCH_THRESHOLD)
+        # Margin over the second best, on the slots where this template scores best.
+        best = best_template == code
+        correct = best_label[best] == name
+        if correct.any():
+            calibration["margin"] = round(choose_threshold(margins[best][correct], margins[best][~correct], 0.)[0], 4)
+        else:
+            calibration["margin"] = None
+        results[_templates_key(OPTION_TEMPL_DIR)][name] = calibration
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m mypackage.calibrate", description="Calibrate the match thresholds on a labelled frame set.")
+    parser.add_argument("archive", help="directory of images, video file, or recorded session directory")
+    parser.add_argument("--labels", required=True, help="JSON file mapping each frame name to the interface and options it shows")
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes, one per core by default")
+    parser.add_argument("--scores", default="", help="columnar scores file of mypackage.analyze, reused if it exists, kept if given")
+    parser.add_argument("--output", default=CALIBRATION_FILE or "calibration.json", help="calibration file")
+    args = parser.parse_args()
+
+    # Loaded here only, Recognizer imports this module.
+    from mypackage.analyze import analyze
+
+    with open(args.labels, "r", encoding="utf-8") as file:
+        labels = json.load(file)
+    scores_path = args.scores or os.path.join(tempfile.mkdtemp(), "scores.npz")
+    analysis: Optional[Dict[str, object]] = None
+    if not os.path.isfile(scores_path):
+        analysis = analyze(args.archive, scores_path, args.workers)
+    templates = calibrate(scores_path, labels)
+    if not args.scores:
+        os.remove(scores_path)
+        os.rmdir(os.path.dirname(scores_path))
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"version": CALIBRATION_VERSION, "archive": args.archive, "templates": templates}, file, indent=1)
+    # Summary, without the ROC.
+    summary = {
+        section: {name: {key: value for key, value in calibration.items() if key != "roc"} for name, calibration in calibrations.items()}
+        for section, calibrations in templates.items()
+    }
+    print(json.dumps({"analysis": analysis, "output": args.output, "templates": summary}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
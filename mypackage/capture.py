@@ -0,0 +1,396 @@
+# mypackage/capture.py
+"""
+Defines capture backends.
+
+A capture backend supplies the screen content that Recognizer works on:
+* ScreenCapture, grab the live desktop (full screen, bounding box of the regions, or each region separately),
+  through PyAutoGUI, or through GDI into preallocated buffers;
+* ReplayCapture, read frames from a directory of images or a video file, no game or display required.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from time import perf_counter, time
+import ctypes
+import os
+import sys
+import numpy
+import cv2
+
+from mypackage import metrics
+from mypackage.exceptions import CaptureExhaustedError
+
+
+Box = Tuple[int, int, int, int]
+
+
+class Frame:
+    """
+    Captured screen content.
+
+    A frame consists of one or several patches, each patch is the RGB image data of a known screen rectangle.
+
+    Arguments:
+        patches (List[Tuple[Box, numpy.ndarray]]): pairs of (screen rectangle, RGB image data);
+        timestamp (float): time when the frame was captured.
+
+    Attributes:
+        _gray_patches (List[numpy.ndarray]): grayscale image data of the patches, converted on first use.
+    """
+
+    def __init__(self, patches: List[Tuple[Box, numpy.ndarray]], timestamp: float) -> None:
+        self.patches = patches
+        self.timestamp = timestamp
+
+        # State variables.
+        self._gray_patches: List[numpy.ndarray] = [None] * len(patches)
+
+
+    def _locate(self, box: Box) -> int:
+        # Index of the first patch containing the rectangle.
+        for index, ((left, top, right, bottom), _) in enumerate(self.patches):
+            if left <= box[0] and top <= box[1] and box[2] <= right and box[3] <= bottom:
+                return index
+        raise ValueError(f"Region {box} is out of the captured frame.")
+
+
+    def crop(self, box: Box) -> numpy.ndarray:
+        """
+        Cut out a screen rectangle from the frame.
+
+        Arguments:
+            box (Box): screen rectangle (left, top, right, bottom).
+
+        Returns:
+            numpy.ndarray: RGB image data of the rectangle, a view into the patch containing it.
+        """
+
+        (left, top, _, _), image = self.patches[self._locate(box)]
+        return image[box[1] - top: box[3] - top, box[0] - left: box[2] - left]
+
+
+    def gray_crop(self, box: Box, out: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Cut out a screen rectangle from the grayscale frame.
+
+        Each patch is converted to grayscale only once, however many rectangles are cut out of it.
+        With an output buffer, only the rectangle is converted, into the buffer, unless its patch is already converted.
+
+        Arguments:
+            box (Box): screen rectangle (left, top, right, bottom);
+            out (Optional[numpy.ndarray]): preallocated grayscale buffer of the rectangle size, None to convert the whole patch.
+
+        Returns:
+            numpy.ndarray: grayscale image data of the rectangle, the buffer or a view into the converted patch.
+        """
+
+        index = self._locate(box)
+        (left, top, _, _), image = self.patches[index]
+        if self._gray_patches[index] is None:
+            if metrics.registry is not None:
+                started = perf_counter()
+            if out is not None:
+                cv2.cvtColor(image[box[1] - top: box[3] - top, box[0] - left: box[2] - left], cv2.COLOR_RGB2GRAY, dst=out)
+            else:
+                self._gray_patches[index] = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            if metrics.registry is not None:
+                metrics.registry.since("grayscale", started)
+            if out is not None:
+                return out
+        return self._gray_patches[index][box[1] - top: box[3] - top, box[0] - left: box[2] - left]
+
+
+def bounding_box(boxes: Iterable[Box]) -> Box:
+    """
+    Calculate the smallest rectangle enclosing all the rectangles.
+
+    Arguments:
+        boxes (Iterable[Box]): screen rectangles (left, top, right, bottom).
+
+    Returns:
+        Box: the enclosing rectangle.
+    """
+
+    lefts, tops, rights, bottoms = zip(*boxes)
+    return (min(lefts), min(tops), max(rights), max(bottoms))
+
+
+class CaptureBackend:
+    """
+    Base class of capture backends.
+
+    Subclasses implement `grab`, which returns a Frame covering at least the requested rectangles, and `size`.
+    """
+
+    def size(self) -> Tuple[int, int]:
+        """
+        Size of the whole captured screen.
+
+        Returns:
+            Tuple[int, int]: (width, height).
+        """
+
+        raise NotImplementedError
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        """
+        Capture the screen content.
+
+        Arguments:
+            boxes (List[Box]): screen rectangles that will be cropped from the frame.
+
+        Returns:
+            Frame: captured content.
+        """
+
+        raise NotImplementedError
+
+
+class _BitmapInfoHeader(ctypes.Structure):
+    # BITMAPINFOHEADER of GDI.
+    _fields_ = [
+        ("biSize", ctypes.c_uint32), ("biWidth", ctypes.c_int32), ("biHeight", ctypes.c_int32), ("biPlanes", ctypes.c_uint16),
+        ("biBitCount", ctypes.c_uint16), ("biCompression", ctypes.c_uint32), ("biSizeImage", ctypes.c_uint32), ("biXPelsPerMeter", ctypes.c_int32),
+        ("biYPelsPerMeter", ctypes.c_int32), ("biClrUsed", ctypes.c_uint32), ("biClrImportant", ctypes.c_uint32),
+    ]
+
+
+class GdiGrabber:
+    """
+    Copy a screen rectangle of a fixed size into preallocated buffers through GDI (Windows only).
+
+    The memory device context, its bitmap and the buffers are created once; a grab blits the screen into the bitmap,
+    copies its bits into the BGRA buffer (GetDIBits), and converts them into the RGB buffer, allocating nothing.
+
+    Arguments:
+        width (int): width of the rectangle;
+        height (int): height of the rectangle.
+
+    Attributes:
+        bgra (numpy.ndarray): BGRA buffer the bitmap bits are copied into;
+        rgb (numpy.ndarray): RGB buffer returned by each grab;
+        _user32 (ctypes.WinDLL): user32, with its own function prototypes;
+        _gdi32 (ctypes.WinDLL): gdi32, with its own function prototypes;
+        _screen_dc (int): device context of the screen;
+        _memory_dc (int): memory device context the screen is blitted into;
+        _bitmap (int): bitmap selected into the memory device context;
+        _info (_BitmapInfoHeader): format of the bits, top-down 32-bit.
+    """
+
+    SRCCOPY = 0x00CC0020
+    DIB_RGB_COLORS = 0
+
+    def __init__(self, width: int, height: int) -> None:
+        from ctypes import wintypes
+
+        # Configuration parameters.
+        self.width = width
+        self.height = height
+
+        # Private instances, so that the prototypes do not clash with other users of ctypes.windll.
+        self._user32 = ctypes.WinDLL("user32")
+        self._gdi32 = ctypes.WinDLL("gdi32")
+        self._user32.GetDC.argtypes, self._user32.GetDC.restype = [wintypes.HWND], wintypes.HDC
+        self._gdi32.CreateCompatibleDC.argtypes, self._gdi32.CreateCompatibleDC.restype = [wintypes.HDC], wintypes.HDC
+        self._gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+        self._gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+        self._gdi32.SelectObject.argtypes, self._gdi32.SelectObject.restype = [wintypes.HDC, wintypes.HGDIOBJ], wintypes.HGDIOBJ
+        self._gdi32.BitBlt.argtypes = [wintypes.HDC] + [ctypes.c_int] * 4 + [wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+        self._gdi32.BitBlt.restype = wintypes.BOOL
+        self._gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT, ctypes.c_void_p, ctypes.c_void_p, wintypes.UINT]
+        self._gdi32.GetDIBits.restype = ctypes.c_int
+
+        # State variables, kept for the lifetime of the process.
+        self._screen_dc = self._user32.GetDC(None)
+        self._memory_dc = self._gdi32.CreateCompatibleDC(self._screen_dc)
+        self._bitmap = self._gdi32.CreateCompatibleBitmap(self._screen_dc, width, height)
+        self._gdi32.SelectObject(self._memory_dc, self._bitmap)
+        self._info = _BitmapInfoHeader(ctypes.sizeof(_BitmapInfoHeader), width, -height, 1, 32, 0, 0, 0, 0, 0, 0)
+        self.bgra = numpy.empty((height, width, 4), numpy.uint8)
+        self.rgb = numpy.empty((height, width, 3), numpy.uint8)
+
+
+    def grab(self, left: int, top: int) -> numpy.ndarray:
+        """
+        Copy the screen rectangle into the buffers.
+
+        Arguments:
+            left (int): left of the rectangle on the screen;
+            top (int): top of the rectangle on the screen.
+
+        Returns:
+            numpy.ndarray: the RGB buffer, valid until the next grab.
+        """
+
+        if not self._gdi32.BitBlt(self._memory_dc, 0, 0, self.width, self.height, self._screen_dc, left, top, self.SRCCOPY):
+            raise OSError("Screen grab failed.")
+        if self._gdi32.GetDIBits(self._memory_dc, self._bitmap, 0, self.height, self.bgra.ctypes.data, ctypes.byref(self._info), self.DIB_RGB_COLORS) != self.height:
+            raise OSError("Screen grab failed.")
+        return cv2.cvtColor(self.bgra, cv2.COLOR_BGRA2RGB, dst=self.rgb)
+
+
+class ScreenCapture(CaptureBackend):
+    """
+    Capture the live desktop.
+
+    When reusing buffers on Windows, each rectangle is copied by GDI into buffers preallocated for it (see GdiGrabber),
+    a frame is then only valid until the next grab of the same rectangle; otherwise each grab allocates a PyAutoGUI screenshot.
+
+    Arguments:
+        mode (str): "full" grabs the whole screen; "bbox" grabs the bounding box of the requested rectangles; "regions" grabs each distinct rectangle separately;
+        reuse_buffer (bool): whether to copy every grab into the same buffers, ignored outside Windows.
+
+    Attributes:
+        _grabbers (Dict[Box, GdiGrabber]): mapping from grabbed rectangle to its grabber, when reusing buffers.
+    """
+
+    MODES = ("full", "bbox", "regions")
+
+    def __init__(self, mode: str = "bbox", reuse_buffer: bool = False) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown capture mode '{mode}', expected one of {self.MODES}.")
+        self.mode = mode
+        self.reuse_buffer = reuse_buffer and sys.platform == "win32"
+
+        # State variables.
+        self._grabbers: Dict[Box, GdiGrabber] = {}
+
+
+    def size(self) -> Tuple[int, int]:
+        from pyautogui import size
+        width, height = size()
+        return (width, height)
+
+
+    def _grab_box(self, box: Box) -> numpy.ndarray:
+        # Into the buffers of the rectangle.
+        if self.reuse_buffer:
+            grabber = self._grabbers.get(box)
+            if grabber is None:
+                grabber = self._grabbers[box] = GdiGrabber(box[2] - box[0], box[3] - box[1])
+            return grabber.grab(box[0], box[1])
+        # PyAutoGUI takes the region as (left, top, width, height).
+        from pyautogui import screenshot
+        image = screenshot(region=(box[0], box[1], box[2] - box[0], box[3] - box[1]))
+        return numpy.asarray(image)
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        timestamp = time()
+        if self.mode == "full" and self.reuse_buffer:
+            box = (0, 0, *self.size())
+            patches = [(box, self._grab_box(box))]
+        elif self.mode == "full":
+            from pyautogui import screenshot
+            image = numpy.asarray(screenshot())
+            patches = [((0, 0, image.shape[1], image.shape[0]), image)]
+        elif self.mode == "bbox":
+            box = bounding_box(boxes)
+            patches = [(box, self._grab_box(box))]
+        else:
+            patches = [(box, self._grab_box(box)) for box in dict.fromkeys(boxes)]
+        return Frame(patches, timestamp)
+
+
+class ReplayCapture(CaptureBackend):
+    """
+    Replay recorded frames instead of capturing the screen.
+
+    Arguments:
+        source (str): directory of image files (replayed in file name order) or a video file;
+        loop (bool): whether to restart from the first frame after the last one, otherwise raise CaptureExhaustedError;
+        reuse_buffer (bool): whether to decode every frame into the same buffers, a frame is then only valid until the next grab.
+
+    Attributes:
+        _files (List[str]): paths of the image files, empty when replaying a video;
+        _index (int): index of the next image file;
+        _video (cv2.VideoCapture): opened video, None when replaying a directory;
+        _bgr (Optional[numpy.ndarray]): decoding buffer of the frames, allocated by the first grab when reusing buffers;
+        _rgb (Optional[numpy.ndarray]): RGB buffer of the frames, allocated by the first grab when reusing buffers.
+    """
+
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+    def __init__(self, source: str, loop: bool = False, reuse_buffer: bool = False) -> None:
+        self.source = source
+        self.loop = loop
+        self.reuse_buffer = reuse_buffer
+
+        # State variables.
+        self._files: List[str] = []
+        self._index = 0
+        self._video = None
+        self._bgr: Optional[numpy.ndarray] = None
+        self._rgb: Optional[numpy.ndarray] = None
+
+        if os.path.isdir(source):
+            self._files = [
+                os.path.join(source, file) for file in sorted(os.listdir(source))
+                if os.path.splitext(file)[1].lower() in self.IMAGE_EXTENSIONS
+            ]
+            if not self._files:
+                raise CaptureExhaustedError(source)
+        else:
+            self._video = cv2.VideoCapture(source)
+            if not self._video.isOpened():
+                raise CaptureExhaustedError(source)
+
+
+    def _next_image(self) -> numpy.ndarray:
+        # Read from the video.
+        if self._video is not None:
+            is_read, image = self._video.read(self._bgr)
+            if not is_read and self.loop:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                is_read, image = self._video.read(self._bgr)
+            if not is_read:
+                raise CaptureExhaustedError(self.source)
+            if self.reuse_buffer:
+                self._bgr = image
+            return image
+
+        # Read from the directory, decoded into the buffer of the previous frame if it has the same size.
+        if self._index >= len(self._files):
+            if not self.loop:
+                raise CaptureExhaustedError(self.source)
+            self._index = 0
+        if self._bgr is not None:
+            image = cv2.imread(self._files[self._index], self._bgr, cv2.IMREAD_COLOR)
+        else:
+            image = cv2.imread(self._files[self._index], cv2.IMREAD_COLOR)
+        if self.reuse_buffer:
+            self._bgr = image
+        self._index += 1
+        return image
+
+
+    def size(self) -> Tuple[int, int]:
+        if self._video is not None:
+            return (int(self._video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        height, width = cv2.imread(self._files[0], cv2.IMREAD_GRAYSCALE).shape
+        return (width, height)
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        image = cv2.cvtColor(self._next_image(), cv2.COLOR_BGR2RGB, dst=self._rgb)
+        if self.reuse_buffer:
+            self._rgb = image
+        return Frame([((0, 0, image.shape[1], image.shape[0]), image)], time())
+
+
+def create_capture(mode: str, replay_source: str = "", reuse_buffer: bool = False) -> CaptureBackend:
+    """
+    Create the capture backend according to the configuration.
+
+    Arguments:
+        mode (str): capture mode of ScreenCapture;
+        replay_source (str): directory or video file to replay, empty to capture the screen;
+        reuse_buffer (bool): whether the frames are copied (screen) or decoded (replay) into the same buffers.
+
+    Returns:
+        CaptureBackend: the capture backend.
+    """
+
+    if replay_source:
+        return ReplayCapture(replay_source, reuse_buffer=reuse_buffer)
+    return ScreenCapture(mode, reuse_buffer)
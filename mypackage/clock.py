@@ -0,0 +1,69 @@
+# mypackage/clock.py
+"""
+Defines clocks.
+
+Every deliberate wait of the program goes through a clock:
+* Clock, the real monotonic time and time.sleep;
+* VirtualClock, simulated time advanced by sleeps instantly, used by replays and benchmarks.
+"""
+
+from time import monotonic, sleep
+
+from mypackage import metrics
+
+
+class Clock:
+    """
+    Real clock.
+    """
+
+    def time(self) -> float:
+        """
+        Current time, in seconds.
+
+        Returns:
+            float: monotonic time.
+        """
+
+        return monotonic()
+
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Wait for a duration.
+
+        Arguments:
+            seconds (float): duration of the wait.
+        """
+
+        if metrics.registry is None:
+            sleep(seconds)
+            return
+        started = monotonic()
+        sleep(seconds)
+        metrics.registry.observe("sleep", monotonic() - started)
+
+
+class VirtualClock(Clock):
+    """
+    Simulated clock, sleeping only advances the simulated time.
+
+    Arguments:
+        start (float): initial simulated time, in seconds.
+
+    Attributes:
+        now (float): current simulated time.
+    """
+
+    def __init__(self, start: float = 0.) -> None:
+        self.now = start
+
+
+    def time(self) -> float:
+        return self.now
+
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(seconds, 0.)
+        if metrics.registry is not None:
+            metrics.registry.observe("sleep", max(seconds, 0.))
@@ -6,15 +6,25 @@ Defines the configuration of the program:
 * name of window;
 * times of attempt;
 * path of templates;
+* source of capture;
+* recording of sessions;
+* flow of interfaces;
+* goal of the attempts;
+* recovery from stalls;
+* flight recorder;
 * threshold of match;
+* classification of options;
 * constants of time;
+* stability of screen;
+* memoization of scores;
+* layout of resolutions;
 * coordinates of characteristic regions;
 * positions of buttons;
 * whitelist of input.
 """
 
 
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Union
 
 
 # -------------------- WINDOW NAME CONFIGURATION --------------------
@@ -28,11 +38,114 @@ MAX_ATTEMPT_COUNT = 50
 # -------------------- PATH CONFIGURATION --------------------
 INTERFACE_TEMPL_DIR: str = "interface_templates"
 OPTION_TEMPL_DIR: str = "option_templates"
+TEMPLATE_BUNDLE: bool = True    # Memory-map the precompiled bundle of each templates directory, rebuilt when the PNGs change.
+
+
+# -------------------- RUN MODE CONFIGURATION --------------------
+RUN_MODE: str = "serial"            # "serial" captures, recognizes and acts in turn, "pipelined" overlaps them in threads;
+CAPTURE_INTERVAL_TIME: float = 0.05 # Time interval between captures of the pipelined capture thread;
+FRAME_RING_SIZE: int = 4            # Number of frames buffered between the capture and recognition threads, at least 3.
+
+
+# -------------------- CAPTURE CONFIGURATION --------------------
+CAPTURE_MODE: str = "bbox"      # "full" grabs the whole screen, "bbox" the bounding box of the regions, "regions" each region separately;
+REPLAY_SOURCE: str = ""         # Directory of images or video file replayed instead of the screen, empty to capture the screen;
+REUSE_BUFFERS: bool = False     # Convert each region to grayscale into a preallocated buffer, decode the replayed frames and copy the screen grabs (GDI, Windows only) into the same buffers.
+
+
+# -------------------- SESSION RECORDING CONFIGURATION --------------------
+RECORD_SESSION_DIR: str = ""        # Directory the session (frames, interfaces, actions) is recorded to, empty to disable;
+RECORD_REGIONS_ONLY: bool = True    # Store only the characteristic regions instead of the captured patches;
+SESSION_CHUNK_SIZE: int = 256       # Number of frames per chunk file.
+
+
+# -------------------- INTERFACE FLOW CONFIGURATION --------------------
+TRANSITIONS_FILE: str = "transitions.json"     # File of the learned transition table, empty to disable persistence.
+INTERFACE_FLOW: Dict[str, List[str]] = {        # Interfaces expected to follow each interface, as driven by Operator.operate.
+    "start_game": ["select_conv"],
+    "select_conv": ["conv_calculus"],
+    "conv_calculus": ["run_calculus"],
+    "run_calculus": ["select_golden_bloods_boon"],
+    "select_golden_bloods_boon": ["select_equation"],
+    "select_equation": ["confirm_equation"],
+    "confirm_equation": ["select_oddity", "select_blessing", "select_weighted_curio"],
+    "select_oddity": ["select_blessing", "select_weighted_curio", "in_game"],
+    "select_blessing": ["confirm_blessing"],
+    "confirm_blessing": ["select_weighted_curio", "select_oddity", "in_game"],
+    "select_weighted_curio": ["in_game", "select_oddity", "select_blessing"],
+    "in_game": ["exit"],
+    "exit": ["hint", "restart_game"],
+    "hint": ["restart_game", "start_game"],
+    "restart_game": ["start_game"],
+}
+
+
+# -------------------- GOAL CONFIGURATION --------------------
+# Acceptable combinations, most valuable first, e.g. {"select_golden_bloods_boon": ["baie", "tibao"], "select_equation": "*"}.
+# Each interface maps to a name, a list of names (any of them), or "*" (any option); the run stops once any combination is secured.
+# Every combination must constrain at least one interface.
+GOAL_COMBINATIONS: List[Dict[str, Union[str, List[str]]]] = []   # Empty to enter a single {boon, equation} pair at startup;
+WILDCARD: str = "*"     # Any option is acceptable.
+
+
+# -------------------- ABORT CONFIGURATION --------------------
+# The abort route is the route out of the game: the menu opened by the abort key ("exit", its exit button clicked),
+# its confirmation dialog ("hint", confirmed), the settlement ("restart_game"), then "start_game"; their templates are in INTERFACE_TEMPL_DIR.
+ABORT_ON_MISS: bool = False     # Leave the attempt as soon as a target is missed (boon after the roll, or equation), instead of playing it to the end;
+ABORT_KEY: int = 27             # Key pressed on the selection interface to open the menu (ESC), which leads to the "exit" interface;
+ABORT_RETRIES: int = 2          # Times the abort key is pressed again while the selection interface stays, before playing this attempt to the end;
+ABORT_REGIONS: Dict[str, Tuple[int, int, int, int]] = {}   # Characteristic regions of extra interfaces met on the abort route in other game versions, used once their templates are added to INTERFACE_TEMPL_DIR;
+ABORT_CLICKS: Dict[str, Tuple[int, int]] = {}               # Click performed on each of these extra interfaces;
+ABORT_FLOW: Dict[str, List[str]] = {                        # Interfaces expected after aborting, merged into INTERFACE_FLOW.
+    "select_golden_bloods_boon": ["exit"],
+    "select_equation": ["exit"],
+    "exit": ["hint", "restart_game"],
+    "hint": ["restart_game"],
+}
+
+
+# -------------------- WATCHDOG CONFIGURATION --------------------
+# The loop stalls on screens no template matches (e.g. an unexpected popup), or when an interface does not respond to the actions.
+STALL_UNMATCHED_TIME: float = 30    # Time without any recognized interface before recovering, in seconds, 0 to disable;
+STALL_SAME_TIME: float = 120        # Time on the same interface before recovering, in seconds, 0 to disable;
+STALL_RECOVERY_ACTIONS: List[str] = ["esc", "click_center", "focus"]    # Recovery actions, one more every timeout while the stall lasts: press ESC, click on the screen centre, activate the game window again;
+STALL_FRAMES_DIR: str = "stalls"    # Directory the frame of each stall is saved to, empty to disable.
+
+
+# -------------------- FLIGHT RECORDER CONFIGURATION --------------------
+# The last ticks (downsampled grayscale crops, confidences, interface IDs, actions) are kept in a memory-mapped ring file,
+# and dumped on achieving the target, on an error exit and on each stall. Dump the ring left by a killed run with: python -m mypackage.flight dump
+FLIGHT_TICKS: int = 512                 # Ticks kept, 0 to disable;
+FLIGHT_DOWNSAMPLE: int = 2              # Downsampling factor of the crops, 1 to keep them at full resolution (replayed exactly);
+FLIGHT_RING_FILE: str = "flight.ring"   # Ring file, overwritten on each launch;
+FLIGHT_DUMP_DIR: str = "flights"        # Directory of the dumps, each a session loadable by the replay tooling.
 
 
 # -------------------- MATCH THRESHOLD CONFIGURATION --------------------
 INTERFACE_MATCH_THRESHOLD: float = 0.95
 OPTION_MATCH_THRESHOLD: float = 0.7
+CALIBRATION_FILE: str = ""      # Per-template thresholds and margins from: python -m mypackage.calibrate ARCHIVE --labels FILE, used in place of the thresholds above; empty to disable.
+SCORING_ENGINE: str = "ncc"     # "cv2" calls cv2.matchTemplate per template, "ncc" scores same-shape templates in one batch, "cascade" rejects clear non-matches on downsampled images first.
+
+
+# -------------------- SHIFT SEARCH CONFIGURATION --------------------
+# When no interface matches at the configured regions, search around them for UI shifted by a few pixels.
+SHIFT_SEARCH_PADDING: int = 0   # Margin searched around each interface region (px at the reference resolution), 0 to disable;
+SHIFT_CONFIRM_COUNT: int = 3    # Consecutive matches at the same offset before the region is moved there.
+
+
+# -------------------- CASCADE CONFIGURATION --------------------
+# Tune the coarse threshold on recorded frames with: python -m mypackage.bench cascade ARCHIVE
+CASCADE_FULL_ENGINE: str = "ncc"        # Engine of the full-resolution stage, "cv2" or "ncc";
+CASCADE_FACTOR: int = 4                 # Downsampling factor of the coarse stage;
+CASCADE_COARSE_THRESHOLD: float = 0.5   # Minimum coarse confidence to be scored at full resolution;
+CASCADE_FLAT_STD: float = 2.0           # Standard deviation (gray levels) under which a region is flat and matches nothing.
+
+
+# -------------------- OPTION CLASSIFICATION CONFIGURATION --------------------
+OPTION_CLASSIFY: bool = True                # Classify every option slot against all option templates, instead of matching the target only;
+ROLL_HISTOGRAM_FILE: str = "rolls.json"     # File of the histogram of observed options;
+ROLL_HISTOGRAM_SAVE_INTERVAL: float = 30    # Minimum time between two saves of the histogram while running, saved on exit too.
 
 
 # -------------------- TIME CONFIGURATION --------------------
@@ -42,6 +155,42 @@ HOLD_TIME: float = 0.05                 # Mouse and keyboard hold time;
 BOONS_ANIMATION_TIME: float = 2         # Animation duration of entering the boon-selection interface;
 SELECT_TO_CONFIRM_TIME: float = 0.5     # Time to wait after selecting before confirming;
 ROOL_ANIMATION_TIME: float = 3          # Animation duration of rolling the boon-selection interface.
+# The durations above are upper bounds, waits return as soon as the screen settles or the expected interface appears.
+
+
+# -------------------- LATENCY PROFILE CONFIGURATION --------------------
+# Waits after each (interface, action) are calibrated from the latencies measured on previous runs, the times above are used until then.
+LATENCY_PROFILE_FILE: str = "latency.json"  # File of the measured latencies, empty to disable the calibration;
+LATENCY_PERCENTILE: float = 0.95            # Percentile of the measured latencies used as the wait;
+LATENCY_MARGIN: float = 0.3                 # Margin added to the percentile, in seconds;
+LATENCY_MIN_SAMPLES: int = 5                # Latencies measured before the configured time is replaced;
+LATENCY_MAX_SAMPLES: int = 200              # Latest latencies kept per (interface, action);
+LATENCY_BACKOFF: float = 1.5                # Factor the wait is multiplied by after a timeout, and divided by after a success;
+LATENCY_MAX_BACKOFF: float = 2.             # Maximum accumulated back-off factor.
+
+
+# -------------------- STABILITY CONFIGURATION --------------------
+POLL_INTERVAL_TIME: float = 0.05        # Time interval for polling the screen while waiting;
+SIGNATURE_STEP: int = 4                 # Downsampling step of the region signature;
+STABLE_FRAMES: int = 3                  # Consecutive unchanged polls to treat the screen as settled;
+STABLE_TOLERANCE: float = 2.0           # Mean absolute difference of the signature (gray levels) still treated as unchanged.
+
+
+# -------------------- CACHE CONFIGURATION --------------------
+SCORE_CACHE_SIZE: int = 64      # Maximum number of memoized region scores, 0 to disable;
+SCORE_CACHE_STEP: int = 2       # Downsampling step of the region before hashing.
+
+
+# -------------------- LOGGING CONFIGURATION --------------------
+LOG_QUEUED: bool = True     # Format and write the log in a background thread, off the monitoring loop;
+LOG_EVENTS_FILE: str = ""   # JSON lines file of the region scores (timestamp, region, score) instead of text lines in idm.log, empty to disable.
+
+
+# -------------------- METRICS CONFIGURATION --------------------
+METRICS_ENABLED: bool = False               # Time the stages of each tick into histograms, per interface ID;
+METRICS_JSON_FILE: str = "metrics.json"     # JSON snapshot of the histograms and counters, empty to disable;
+METRICS_PROM_FILE: str = "metrics.prom"     # Prometheus text file of the histograms and counters, empty to disable;
+METRICS_EXPORT_INTERVAL: float = 10         # Time interval between two exports.
 
 
 # -------------------- RANDOM OFFSET CONFIGURATION --------------------
@@ -49,6 +198,12 @@ POSITION_OFFSET: int = 8    # px
 TIME_PAUSE: float = 70      # ms
 
 
+# -------------------- LAYOUT CONFIGURATION --------------------
+# Regions and coordinates below are given at the reference resolution, and mapped to the actual capture size at startup.
+REFERENCE_RESOLUTION: Tuple[int, int] = (1920, 1080)
+REGION_ANCHORS: Dict[str, Tuple[str, str]] = {}     # Explicit (horizontal, vertical) anchors of region IDs, "start", "center" or "end"; others stick to the nearest edge or centre.
+
+
 # -------------------- MATCH CHARACTERISTIC REGIONS --------------------
 INTERFACE_REGIONS: Dict[str, List[Tuple[int, int, int, int]]] = {
     "start_game": (1520, 930, 1650, 980),
@@ -2,7 +2,10 @@
 """
 Custom exception classes:
 * target achieved error;
-* window not found error.
+* window not found error;
+* template not found error;
+* max attempt count exceeded error;
+* capture exhausted error.
 """
 
 from typing import Dict
@@ -57,4 +60,17 @@ class MaxAttemptCountExceededError(Exception):
     """
     def __init__(self, max_count: int):
         self.message = f"Attempting times exceeded maximum count ({max_count}), target not achieved."
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class CaptureExhaustedError(Exception):
+    """
+    Exception raised when the capture source cannot supply any more frames.
+
+    Usually indicates that the replayed directory or video is finished, or that it cannot be opened.
+
+    Arguments:
+        source (str): the replay source.
+    """
+    def __init__(self, source: str):
+        self.message = f"No more frames from capture source '{source}', program will exit."
+        super().__init__(self.message)
@@ -0,0 +1,254 @@
+# mypackage/flight.py
+"""
+Defines FlightRecorder class.
+
+The flight recorder keeps the last ticks of the monitoring loop in a fixed-size memory-mapped ring file:
+downsampled grayscale crops of the interface regions, the confidences computed, the interface ID matched and the action performed.
+Every slot and its views are laid out once, a tick only writes into them.
+The ring is dumped on demand (target achieved, error exit, stall) to a timestamped directory, which is both:
+* a session (session.json, chunk_NNNNN.npz), the crops upsampled back to the region size, loadable by SessionCapture and the replay tooling;
+* flight.npz and flight.json, the raw ring in time order and its layout.
+
+Dump the ring file left by a killed run with:
+    python -m mypackage.flight dump [RING_FILE] [--dir DIR]
+"""
+
+from typing import Dict, List, Optional, Tuple
+from time import strftime
+import argparse
+import json
+import logging
+import os
+import numpy
+import cv2
+
+from mypackage.capture import Box, Frame
+from mypackage.session import SessionRecorder
+from mypackage.config import FLIGHT_TICKS, FLIGHT_DOWNSAMPLE, FLIGHT_RING_FILE, FLIGHT_DUMP_DIR
+
+
+# Actions of Operator, stored by index.
+ACTIONS: List[str] = ["none", "click", "press", "select", "abort", "esc", "click_center"]
+
+
+def _layout_path(path: str) -> str:
+    return path + ".json"
+
+
+def _dtype(layout: dict) -> numpy.dtype:
+    # One record per tick: sequence number (0 for an empty slot), time, interface and action indices, confidences, and a crop per region.
+    fields = [("seq", numpy.int64), ("t", numpy.float64), ("interface", numpy.int16), ("action", numpy.int16), ("scores", numpy.float32, (len(layout["ids"]),))]
+    fields += [(f"crop_{index}", numpy.uint8, tuple(shape)) for index, shape in enumerate(layout["shapes"])]
+    return numpy.dtype(fields)
+
+
+class FlightRecorder:
+    """
+    Flight recorder, keep the last ticks in a memory-mapped ring file.
+
+    Arguments:
+        id_to_coordinate (Dict[str, Box]): mapping from interface ID to characteristic region, at the capture resolution;
+        size (Tuple[int, int]): capture size (width, height);
+        capacity (int): number of ticks kept;
+        downsample (int): downsampling factor of the crops;
+        path (str): ring file, overwritten;
+        dump_dir (str): directory the dumps are written to.
+
+    Attributes:
+        dumps (List[str]): directories of the dumps written;
+        _layout (dict): layout of the ring, saved next to the ring file;
+        _ids (Dict[str, int]): mapping from interface ID to its index, "unmatched" included;
+        _actions (Dict[str, int]): mapping from action to its index;
+        _ring (numpy.memmap): the ring of records;
+        _records (List[numpy.void]): views of the records of each slot;
+        _crops (List[List[numpy.ndarray]]): views of the crops of each slot, one per region;
+        _scores (List[numpy.ndarray]): views of the confidences of each slot;
+        _gray_buffers (List[numpy.ndarray]): full-resolution grayscale buffer of each region;
+        _sequence (int): sequence number of the newest record;
+        _newest (int): slot of the newest record, -1 if none;
+        _logger (logging.Logger): log.
+    """
+
+    def __init__(
+        self,
+        id_to_coordinate: Dict[str, Box],
+        size: Tuple[int, int],
+        capacity: int = FLIGHT_TICKS,
+        downsample: int = FLIGHT_DOWNSAMPLE,
+        path: str = FLIGHT_RING_FILE,
+        dump_dir: str = FLIGHT_DUMP_DIR,
+    ) -> None:
+
+        # Configuration parameters.
+        self.boxes: List[Box] = list(dict.fromkeys(id_to_coordinate.values()))
+        self.capacity = capacity
+        self.downsample = max(downsample, 1)
+        self.path = path
+        self.dump_dir = dump_dir
+
+        # State variables.
+        self.dumps: List[str] = []
+        ids = list(id_to_coordinate)
+        self._layout = {
+            "size": list(size),
+            "capacity": capacity,
+            "downsample": self.downsample,
+            "boxes": [list(box) for box in self.boxes],
+            "shapes": [[max((box[3] - box[1]) // self.downsample, 1), max((box[2] - box[0]) // self.downsample, 1)] for box in self.boxes],
+            "ids": ids,
+            "regions": [self.boxes.index(id_to_coordinate[id]) for id in ids],
+            "interfaces": ids + ["unmatched"],
+            "actions": ACTIONS,
+        }
+        self._ids = {id: index for index, id in enumerate(self._layout["interfaces"])}
+        self._actions = {action: index for index, action in enumerate(ACTIONS)}
+        self._ring = numpy.memmap(path, _dtype(self._layout), "w+", shape=(capacity,))
+        with open(_layout_path(path), "w", encoding="utf-8") as file:
+            json.dump(self._layout, file)
+        self._records = [self._ring[slot] for slot in range(capacity)]
+        self._crops = [[self._ring[f"crop_{index}"][slot] for index in range(len(self.boxes))] for slot in range(capacity)]
+        self._scores = [self._ring["scores"][slot] for slot in range(capacity)]
+        self._gray_buffers = [numpy.empty((box[3] - box[1], box[2] - box[0]), numpy.uint8) for box in self.boxes]
+        self._sequence = 0
+        self._newest = -1
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+
+    def record(self, frame: Frame, scores: Dict[str, float], interface_id: str) -> None:
+        """
+        Record a tick, overwriting the oldest one.
+
+        Arguments:
+            frame (Frame): frame matched, covering the regions;
+            scores (Dict[str, float]): mapping from ID to the confidence computed, the others are recorded as NaN;
+            interface_id (str): the interface ID matched, or "unmatched".
+        """
+
+        slot = (self._newest + 1) % self.capacity
+        for box, gray, crop in zip(self.boxes, self._gray_buffers, self._crops[slot]):
+            cv2.resize(frame.gray_crop(box, gray), (crop.shape[1], crop.shape[0]), dst=crop, interpolation=cv2.INTER_AREA)
+        slot_scores = self._scores[slot]
+        for index, id in enumerate(self._layout["ids"]):
+            slot_scores[index] = scores.get(id, numpy.nan)
+        record = self._records[slot]
+        record["t"] = frame.timestamp
+        record["interface"] = self._ids.get(interface_id, -1)
+        record["action"] = 0
+        self._sequence += 1
+        record["seq"] = self._sequence
+        self._newest = slot
+
+
+    def record_action(self, action: str) -> None:
+        """
+        Record the action performed on the newest tick.
+
+        Arguments:
+            action (str): last action of Operator.
+        """
+
+        if self._newest >= 0:
+            self._records[self._newest]["action"] = self._actions.get(action, -1)
+
+
+    def dump(self, reason: str) -> Optional[str]:
+        """
+        Write the ticks kept to a timestamped directory.
+
+        Arguments:
+            reason (str): cause of the dump, appended to the directory name.
+
+        Returns:
+            Optional[str]: the directory, None if nothing was recorded.
+        """
+
+        path = dump_ring(self._ring, self._layout, os.path.join(self.dump_dir, f"flight_{strftime('%Y%m%d_%H%M%S')}_{reason}"))
+        if path is not None:
+            self.dumps.append(path)
+            self._logger.info("Dump the last %d ticks to '%s';", min(self._sequence, self.capacity), path)
+        return path
+
+
+    def close(self) -> None:
+        """
+        Write the ring file to disk.
+        """
+
+        self._ring.flush()
+
+
+def load_ring(path: str) -> Tuple[numpy.ndarray, dict]:
+    """
+    Open a ring file and its layout.
+
+    Arguments:
+        path (str): ring file.
+
+    Returns:
+        Tuple[numpy.ndarray, dict]: the ring of records, and its layout.
+    """
+
+    with open(_layout_path(path), encoding="utf-8") as file:
+        layout = json.load(file)
+    return numpy.memmap(path, _dtype(layout), "r", shape=(layout["capacity"],)), layout
+
+
+def dump_ring(ring: numpy.ndarray, layout: dict, path: str) -> Optional[str]:
+    """
+    Write the records of a ring to a directory, as a session and as the raw records in time order.
+
+    Arguments:
+        ring (numpy.ndarray): the ring of records;
+        layout (dict): layout of the ring;
+        path (str): directory, created.
+
+    Returns:
+        Optional[str]: the directory, None if the ring is empty.
+    """
+
+    records = numpy.array(ring)
+    records = records[records["seq"] > 0]
+    if not len(records):
+        return None
+    records = records[numpy.argsort(records["seq"])]
+
+    os.makedirs(path, exist_ok=True)
+    numpy.savez_compressed(os.path.join(path, "flight.npz"), records=records)
+    with open(os.path.join(path, "flight.json"), "w", encoding="utf-8") as file:
+        json.dump(layout, file)
+
+    # Session of the crops, upsampled back to the region size.
+    boxes = [tuple(box) for box in layout["boxes"]]
+    recorder = SessionRecorder(path, tuple(layout["size"]), len(records) + 1, regions_only=False)
+    for record in records:
+        patches = []
+        for index, (left, top, right, bottom) in enumerate(boxes):
+            gray = cv2.resize(record[f"crop_{index}"], (right - left, bottom - top), interpolation=cv2.INTER_LINEAR)
+            patches.append(((left, top, right, bottom), cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)))
+        timestamp = float(record["t"])
+        recorder.record_grab(boxes, Frame(patches, timestamp))
+        if record["interface"] >= 0:
+            recorder.record_interface(layout["interfaces"][record["interface"]], timestamp)
+        if record["action"] > 0:
+            recorder.record_action(layout["actions"][record["action"]], (), timestamp)
+    recorder.close()
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m mypackage.flight", description="Flight recorder.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dump_parser = subparsers.add_parser("dump", help="dump a ring file, e.g. left by a killed run")
+    dump_parser.add_argument("ring", nargs="?", default=FLIGHT_RING_FILE, help="ring file")
+    dump_parser.add_argument("--dir", default=FLIGHT_DUMP_DIR, help="directory the dump is written to")
+    args = parser.parse_args()
+
+    ring, layout = load_ring(args.ring)
+    path = dump_ring(ring, layout, os.path.join(args.dir, f"flight_{strftime('%Y%m%d_%H%M%S')}_manual"))
+    print(path if path is not None else "The ring is empty.")
+
+
+if __name__ == "__main__":
+    main()
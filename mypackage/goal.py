@@ -0,0 +1,163 @@
+# mypackage/goal.py
+"""
+Defines Goal class.
+"""
+
+from typing import Dict, FrozenSet, List, Optional, Set, Union
+
+from mypackage.config import WILDCARD
+
+
+Combination = Dict[str, Union[str, List[str]]]
+
+
+def is_wildcard(names: Union[str, List[str]]) -> bool:
+    """
+    Whether the acceptable options of an interface accept any option.
+
+    Arguments:
+        names (Union[str, List[str]]): a name, a list of names, or "*".
+
+    Returns:
+        bool: True if the names are "*" or a list containing "*".
+    """
+
+    return names == WILDCARD if isinstance(names, str) else WILDCARD in names
+
+
+def parse_combination(text: str, interfaces: List[str]) -> Combination:
+    """
+    Parse a combination written on the command line, e.g. "baie|tibao,*".
+
+    Arguments:
+        text (str): comma-separated options of each interface, in order, alternatives separated by "|", "*" for any option;
+        interfaces (List[str]): selection interfaces, in the order of the text.
+
+    Returns:
+        Combination: mapping from interface ID to a name, a list of names, or "*".
+    """
+
+    combination = {}
+    for interface_id, options in zip(interfaces, text.split(",")):
+        names = [name.strip() for name in options.split("|") if name.strip()]
+        combination[interface_id] = names[0] if len(names) == 1 else names
+    return combination
+
+
+class Goal:
+    """
+    Ranked acceptable combinations of options, and the options selected in the current attempt.
+
+    A combination maps each selection interface to its acceptable options: a name, a list of names (any of them), or "*" (any option);
+    an interface missing from a combination accepts any option, but every combination must constrain at least one interface.
+    The first combination is the most valuable.
+    On each selection interface, the option kept is the one leaving the most valuable combination reachable (then the most combinations),
+    and the goal is secured as soon as every constrained interface of a reachable combination is selected.
+
+    Arguments:
+        combinations (List[Combination]): acceptable combinations, most valuable first.
+
+    Attributes:
+        selected (Dict[str, str]): mapping from interface ID to the option selected in the current attempt ("unknown" if not recognized);
+        _accepted (List[Dict[str, FrozenSet[str]]]): acceptable names of the constrained interfaces of each combination.
+    """
+
+    def __init__(self, combinations: List[Combination]) -> None:
+
+        # Configuration parameters.
+        self.combinations = combinations
+
+        # State variables.
+        self.selected: Dict[str, str] = {}
+        self._accepted: List[Dict[str, FrozenSet[str]]] = [
+            {
+                interface_id: frozenset([names] if isinstance(names, str) else names)
+                for interface_id, names in combination.items() if not is_wildcard(names)
+            }
+            for combination in combinations
+        ]
+        # A combination accepting any option would be secured by the first selection of every attempt.
+        for combination, accepted in zip(combinations, self._accepted):
+            if not accepted:
+                raise ValueError(f"The combination {combination} constrains no interface, every attempt would secure it.")
+
+
+    def names(self, interface_id: Optional[str] = None) -> Set[str]:
+        """
+        Names of the options accepted by any combination.
+
+        Arguments:
+            interface_id (Optional[str]): selection interface, None for all.
+
+        Returns:
+            Set[str]: the names.
+        """
+
+        return {
+            name for accepted in self._accepted for id, names in accepted.items() if interface_id is None or id == interface_id for name in names
+        }
+
+
+    def reset(self) -> None:
+        """
+        Forget the selections, at the end of an attempt.
+        """
+
+        self.selected = {}
+
+
+    def _reachable(self, selected: Dict[str, str]) -> List[int]:
+        # Indices of the combinations the selections keep reachable, most valuable first.
+        return [
+            index for index, accepted in enumerate(self._accepted)
+            if all(selected[id] in names for id, names in accepted.items() if id in selected)
+        ]
+
+
+    def choose(self, interface_id: str, labels: List[str]) -> Optional[int]:
+        """
+        Decide which visible option to select.
+
+        Arguments:
+            interface_id (str): selection interface;
+            labels (List[str]): recognized option of each slot, "unknown" if not recognized.
+
+        Returns:
+            Optional[int]: index of the slot keeping the most valuable combination reachable, then the most combinations; None if no slot keeps any.
+        """
+
+        best, best_key = None, None
+        for slot, label in enumerate(labels):
+            reachable = self._reachable({**self.selected, interface_id: label})
+            if not reachable:
+                continue
+            key = (reachable[0], -len(reachable))
+            if best_key is None or key < best_key:
+                best, best_key = slot, key
+        return best
+
+
+    def select(self, interface_id: str, label: str) -> None:
+        """
+        Record the option selected.
+
+        Arguments:
+            interface_id (str): selection interface;
+            label (str): option selected, "unknown" if not recognized.
+        """
+
+        self.selected[interface_id] = label
+
+
+    def secured(self) -> Optional[Combination]:
+        """
+        The most valuable combination secured by the selections.
+
+        Returns:
+            Optional[Combination]: the combination, None if none is secured yet.
+        """
+
+        for index in self._reachable(self.selected):
+            if all(id in self.selected for id in self._accepted[index]):
+                return self.combinations[index]
+        return None
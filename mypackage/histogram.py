@@ -0,0 +1,89 @@
+# mypackage/histogram.py
+"""
+Defines RollHistogram class.
+"""
+
+from typing import Dict, List
+from time import monotonic
+import json
+import os
+
+
+class RollHistogram:
+    """
+    On-disk histogram of the options observed in the selection interfaces.
+
+    The file is a small JSON object: {"interface ID": {"screens": count, "options": {"option name": count}}}.
+    It is saved periodically while recording, off most selection screens, and on save().
+
+    Arguments:
+        path (str): file the histogram is loaded from and saved to;
+        interval (float): minimum time between two periodic saves, in seconds.
+
+    Attributes:
+        _counts (Dict[str, Dict]): histogram data;
+        _is_dirty (bool): whether screens were recorded since the last save;
+        _saved (float): time of the last save.
+    """
+
+    def __init__(self, path: str, interval: float = 30) -> None:
+
+        # Configuration parameters.
+        self.path = path
+        self.interval = interval
+
+        # State variables.
+        self._counts: Dict[str, Dict] = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self._counts = json.load(file)
+        self._is_dirty = False
+        self._saved = monotonic()
+
+
+    def record(self, interface_id: str, labels: List[str]) -> None:
+        """
+        Append one observed screen of options to the histogram, saved if the interval has passed since the last save.
+
+        Arguments:
+            interface_id (str): selection interface ID;
+            labels (List[str]): option names recognized in the slots.
+        """
+
+        counts = self._counts.setdefault(interface_id, {"screens": 0, "options": {}})
+        counts["screens"] += 1
+        for label in labels:
+            counts["options"][label] = counts["options"].get(label, 0) + 1
+        self._is_dirty = True
+        if monotonic() - self._saved >= self.interval:
+            self.save()
+
+
+    def save(self) -> None:
+        """
+        Write the histogram to its file, if screens were recorded since the last save.
+        """
+
+        self._saved = monotonic()
+        if not self._is_dirty:
+            return
+        # Replace atomically, so that an interrupted save never leaves a partial file.
+        with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self._counts, file, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
+        self._is_dirty = False
+
+
+    def frequencies(self, interface_id: str) -> Dict[str, float]:
+        """
+        Calculate how often each option shows up per screen.
+
+        Arguments:
+            interface_id (str): selection interface ID.
+
+        Returns:
+            Dict[str, float]: mapping from option name to its average appearances per screen.
+        """
+
+        counts = self._counts.get(interface_id, {"screens": 0, "options": {}})
+        return {label: count / counts["screens"] for label, count in counts["options"].items()} if counts["screens"] else {}
@@ -0,0 +1,111 @@
+# mypackage/inputs.py
+"""
+Defines input backends.
+
+An input backend performs the mouse and keyboard operations of Operator:
+* Win32Input, real input through pywin32 (requires administrator privileges);
+* FakeInput, only record the operations, used by replays and simulations.
+"""
+
+from typing import List, Optional, Tuple
+
+from mypackage.clock import Clock
+
+
+class InputBackend:
+    """
+    Base class of input backends.
+
+    Arguments:
+        clock (Clock): clock used for holding buttons and keys, the real clock by default.
+    """
+
+    def __init__(self, clock: Optional[Clock] = None) -> None:
+        self.clock = clock if clock is not None else Clock()
+
+
+    def click(self, x: int, y: int, hold: float) -> None:
+        """
+        Click on a screen position with the left mouse button.
+
+        Arguments:
+            x (int): horizontal coordinate;
+            y (int): vertical coordinate;
+            hold (float): time the button is held, in seconds.
+        """
+
+        raise NotImplementedError
+
+
+    def press(self, key: int, hold: float) -> None:
+        """
+        Press a key.
+
+        Arguments:
+            key (int): virtual key code (ASCII for ordinary keys);
+            hold (float): time the key is held, in seconds.
+        """
+
+        raise NotImplementedError
+
+
+class Win32Input(InputBackend):
+    """
+    Real mouse and keyboard input through pywin32.
+    """
+
+    def click(self, x: int, y: int, hold: float) -> None:
+        # Mouse move -> press -> hold -> release.
+        import win32api, win32con
+        win32api.SetCursorPos((x, y))
+        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
+        self.clock.sleep(hold)
+        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
+
+
+    def press(self, key: int, hold: float) -> None:
+        # Keyboard press -> hold -> release.
+        import win32api, win32con
+        win32api.keybd_event(key, 0, 0, 0)
+        self.clock.sleep(hold)
+        win32api.keybd_event(key, 0, win32con.KEYEVENTF_KEYUP, 0)
+
+
+class FakeInput(InputBackend):
+    """
+    Record the operations without performing them.
+
+    Attributes:
+        actions (List[Tuple[float, str, Tuple[int, ...]]]): performed operations, as (time, "click" or "press", arguments).
+    """
+
+    def __init__(self, clock: Optional[Clock] = None) -> None:
+        super().__init__(clock)
+        self.actions: List[Tuple[float, str, Tuple[int, ...]]] = []
+
+
+    def click(self, x: int, y: int, hold: float) -> None:
+        self.actions.append((self.clock.time(), "click", (x, y)))
+        self.clock.sleep(hold)
+
+
+    def press(self, key: int, hold: float) -> None:
+        self.actions.append((self.clock.time(), "press", (key,)))
+        self.clock.sleep(hold)
+
+
+def create_input(replay_source: str = "", clock: Optional[Clock] = None) -> InputBackend:
+    """
+    Create the input backend according to the configuration.
+
+    Arguments:
+        replay_source (str): directory or video file replayed instead of the screen, empty to operate the game;
+        clock (Clock): clock used for holding buttons and keys, the real clock by default.
+
+    Returns:
+        InputBackend: the input backend, recording only when replaying.
+    """
+
+    if replay_source:
+        return FakeInput(clock)
+    return Win32Input(clock)
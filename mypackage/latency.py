@@ -0,0 +1,123 @@
+# mypackage/latency.py
+"""
+Defines LatencyProfile class.
+"""
+
+from typing import Dict, List
+import json
+import logging
+import os
+
+from mypackage.config import LATENCY_BACKOFF, LATENCY_MARGIN, LATENCY_MAX_BACKOFF, LATENCY_MAX_SAMPLES, LATENCY_MIN_SAMPLES, LATENCY_PERCENTILE
+
+
+class LatencyProfile:
+    """
+    Measured latencies of the game, per (interface, action) pair, used as the waits of later runs.
+
+    A latency is the time the game takes, after an action on an interface, to show the next recognized interface or to settle an animation.
+    Once enough samples are measured, the wait of a pair is a high percentile of its latencies plus a margin, instead of the configured time.
+    Each failed transition (the wait timed out) multiplies the calibrated wait of the pair by a back-off factor, relaxed again on each success;
+    the configured time is used as is until then.
+
+    Arguments:
+        path (str): file the profile is loaded from and saved to, empty to keep it in memory only.
+
+    Attributes:
+        _samples (Dict[str, List[float]]): mapping from "interface/action" to the latest latencies, in seconds;
+        _backoff (Dict[str, float]): mapping from "interface/action" to the current back-off factor;
+        _logger (logging.Logger): log.
+    """
+
+    def __init__(self, path: str = "") -> None:
+
+        # Configuration parameters.
+        self.path = path
+
+        # State variables.
+        self._samples: Dict[str, List[float]] = {}
+        self._backoff: Dict[str, float] = {}
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self.load()
+
+
+    def load(self) -> None:
+        """
+        Load the latencies measured by previous sessions.
+        """
+
+        if not self.path or not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            profile = json.load(file)
+        self._samples = {key: samples[-LATENCY_MAX_SAMPLES:] for key, samples in profile.get("samples", {}).items()}
+        self._backoff = profile.get("backoff", {})
+        self._logger.info("Success to load the latency profile from '%s';\n", self.path)
+
+
+    def save(self) -> None:
+        """
+        Save the latencies for later sessions.
+        """
+
+        if not self.path:
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"samples": self._samples, "backoff": self._backoff}, file)
+
+
+    def observe(self, interface_id: str, action: str, seconds: float) -> None:
+        """
+        Record the latency of a successful transition, and relax its back-off.
+
+        Arguments:
+            interface_id (str): interface the action was performed on;
+            action (str): name of the action;
+            seconds (float): time until the next interface was recognized or the animation settled.
+        """
+
+        key = f"{interface_id}/{action}"
+        samples = self._samples.setdefault(key, [])
+        samples.append(round(seconds, 4))
+        del samples[:-LATENCY_MAX_SAMPLES]
+        if key in self._backoff:
+            self._backoff[key] = max(self._backoff[key] / LATENCY_BACKOFF, 1.)
+
+
+    def fail(self, interface_id: str, action: str) -> None:
+        """
+        Record a failed transition, backing off its wait.
+
+        Arguments:
+            interface_id (str): interface the action was performed on;
+            action (str): name of the action.
+        """
+
+        key = f"{interface_id}/{action}"
+        self._backoff[key] = min(self._backoff.get(key, 1.) * LATENCY_BACKOFF, LATENCY_MAX_BACKOFF)
+        self._logger.debug("Transition [%s] failed, back-off: %.2f;", key, self._backoff[key])
+
+
+    def delay(self, interface_id: str, action: str, default: float) -> float:
+        """
+        Wait of a transition.
+
+        Arguments:
+            interface_id (str): interface the action is performed on;
+            action (str): name of the action;
+            default (float): configured time, used until enough latencies are measured.
+
+        Returns:
+            float: the wait, in seconds.
+        """
+
+        key = f"{interface_id}/{action}"
+        samples = self._samples.get(key, [])
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return default
+        ordered = sorted(samples)
+        wait = ordered[min(int(LATENCY_PERCENTILE * len(ordered)), len(ordered) - 1)] + LATENCY_MARGIN
+        return wait * self._backoff.get(key, 1.)
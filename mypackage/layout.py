@@ -0,0 +1,131 @@
+# mypackage/layout.py
+"""
+Defines Layout class.
+
+Coordinates in config.py are expressed in the layout space of the reference resolution (1920×1080).
+The game does not scale its UI proportionally: elements keep their size relative to the screen height (or width, on narrower screens),
+and stay anchored to the nearest screen edge or to the centre. Layout maps reference coordinates to the actual capture size accordingly.
+"""
+
+from typing import Dict, Optional, Tuple
+import numpy
+import cv2
+
+
+Box = Tuple[int, int, int, int]
+Anchor = Tuple[str, str]   # (horizontal, vertical), each "start", "center" or "end".
+
+
+def scale_template(template: numpy.ndarray, scale: float) -> numpy.ndarray:
+    """
+    Rescale a template image for the actual resolution.
+
+    The size is rounded the same way as the regions, so the rescaled template and region always have the same shape.
+
+    Arguments:
+        template (numpy.ndarray): template image data at the reference resolution;
+        scale (float): UI scale of the actual resolution.
+
+    Returns:
+        numpy.ndarray: rescaled template image data.
+    """
+
+    if scale == 1:
+        return template
+    height, width = template.shape[:2]
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(template, (round(width * scale), round(height * scale)), interpolation=interpolation)
+
+
+class Layout:
+    """
+    Map coordinates from the reference layout space to the actual capture size.
+
+    Arguments:
+        size (Tuple[int, int]): actual capture size (width, height);
+        reference (Tuple[int, int]): reference resolution (width, height) of the configured coordinates;
+        anchors (Dict[str, Anchor]): explicit anchors of region IDs, others are anchored to the nearest edge or centre.
+
+    Attributes:
+        scale (float): UI scale, the size of an element at the actual resolution relative to the reference.
+    """
+
+    def __init__(self, size: Tuple[int, int], reference: Tuple[int, int] = (1920, 1080), anchors: Optional[Dict[str, Anchor]] = None) -> None:
+
+        # Configuration parameters.
+        self.size = size
+        self.reference = reference
+        self.anchors = anchors if anchors is not None else {}
+
+        # The UI keeps its aspect ratio, and fits the limiting dimension.
+        self.scale = min(size[0] / reference[0], size[1] / reference[1])
+
+
+    @staticmethod
+    def _nearest_anchor(value: float, reference: int) -> str:
+        # Elements in the outer thirds stick to that edge, others to the centre.
+        if value < reference / 3:
+            return "start"
+        if value > reference * 2 / 3:
+            return "end"
+        return "center"
+
+
+    def _map(self, value: float, axis: int, anchor: str) -> float:
+        # Map one coordinate along an axis.
+        reference, actual = self.reference[axis], self.size[axis]
+        if anchor == "start":
+            return value * self.scale
+        if anchor == "end":
+            return actual - (reference - value) * self.scale
+        return actual / 2 + (value - reference / 2) * self.scale
+
+
+    def point(self, point: Tuple[int, int], anchor: Optional[Anchor] = None) -> Tuple[int, int]:
+        """
+        Map a point to the actual resolution.
+
+        Arguments:
+            point (Tuple[int, int]): point (x, y) at the reference resolution;
+            anchor (Optional[Anchor]): anchor of the element, nearest edge or centre if None.
+
+        Returns:
+            Tuple[int, int]: point at the actual resolution.
+        """
+
+        anchor = anchor or (self._nearest_anchor(point[0], self.reference[0]), self._nearest_anchor(point[1], self.reference[1]))
+        return (round(self._map(point[0], 0, anchor[0])), round(self._map(point[1], 1, anchor[1])))
+
+
+    def box(self, box: Box, anchor: Optional[Anchor] = None) -> Box:
+        """
+        Map a rectangle to the actual resolution.
+
+        Arguments:
+            box (Box): rectangle (left, top, right, bottom) at the reference resolution;
+            anchor (Optional[Anchor]): anchor of the element, nearest edge or centre of the rectangle centre if None.
+
+        Returns:
+            Box: rectangle at the actual resolution, sized like a template rescaled by scale_template.
+        """
+
+        anchor = anchor or (
+            self._nearest_anchor((box[0] + box[2]) / 2, self.reference[0]),
+            self._nearest_anchor((box[1] + box[3]) / 2, self.reference[1]),
+        )
+        left, top = round(self._map(box[0], 0, anchor[0])), round(self._map(box[1], 1, anchor[1]))
+        return (left, top, left + round((box[2] - box[0]) * self.scale), top + round((box[3] - box[1]) * self.scale))
+
+
+    def regions(self, id_to_coordinate: Dict[str, Box]) -> Dict[str, Box]:
+        """
+        Map characteristic regions to the actual resolution.
+
+        Arguments:
+            id_to_coordinate (Dict[str, Box]): mapping from ID to region at the reference resolution.
+
+        Returns:
+            Dict[str, Box]: mapping from ID to region at the actual resolution.
+        """
+
+        return {id: self.box(coordinate, self.anchors.get(id)) for id, coordinate in id_to_coordinate.items()}
@@ -0,0 +1,217 @@
+# mypackage/metrics.py
+"""
+Hot-path instrumentation.
+
+Stages of a tick are timed into fixed-bucket histograms, and events are counted, both per interface ID:
+* capture, grab of the screen content;
+* grayscale, conversion of a captured patch;
+* score, scoring of a characteristic region against its templates;
+* click and press, Operator actions (including the hold);
+* sleep, every deliberate sleep of a clock;
+* stable_wait and interface_wait, waits of Recognizer;
+* tick, a whole match and operation of Runner.
+The interface ID is the one the program is currently on (the last one matched), set by Runner.
+
+Instrumentation is disabled unless `enable` is called: the hot path only tests `metrics.registry is not None`.
+Snapshots are exported periodically as JSON and as a Prometheus text file (for the node exporter textfile collector).
+"""
+
+from bisect import bisect_left
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+
+
+# Upper bounds of the histogram buckets, in seconds, the last bucket is unbounded.
+BUCKETS: Tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.,
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations.
+
+    Attributes:
+        counts (List[int]): number of observations per bucket, the last one above the largest bound;
+        total (float): sum of the observations, in seconds;
+        count (int): number of observations.
+    """
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.total = 0.
+        self.count = 0
+
+
+    def observe(self, seconds: float) -> None:
+        """
+        Add an observation.
+
+        Arguments:
+            seconds (float): observed duration.
+        """
+
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Metrics:
+    """
+    Registry of the histograms and counters.
+
+    Updates are not locked, counts may rarely be lost when several threads update the same histogram (pipelined mode).
+
+    Arguments:
+        json_path (str): path of the JSON snapshot, empty to disable;
+        prometheus_path (str): path of the Prometheus text file, empty to disable;
+        interval (float): minimum time between two periodic exports, in seconds.
+
+    Attributes:
+        interface (str): interface ID the program is currently on, label of the observations;
+        histograms (Dict[Tuple[str, str], Histogram]): mapping from (stage, interface ID) to histogram;
+        counters (Dict[Tuple[str, str], int]): mapping from (event, interface ID) to count;
+        _exported (float): time of the last export.
+    """
+
+    def __init__(self, json_path: str = "", prometheus_path: str = "", interval: float = 10) -> None:
+
+        # Configuration parameters.
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+
+        # State variables.
+        self.interface = "unmatched"
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self._exported = monotonic()
+
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record the duration of a stage on the current interface.
+
+        Arguments:
+            stage (str): name of the stage;
+            seconds (float): duration.
+        """
+
+        key = (stage, self.interface)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+    def since(self, stage: str, started: float) -> None:
+        """
+        Record the duration of a stage started at a perf_counter time.
+
+        Arguments:
+            stage (str): name of the stage;
+            started (float): perf_counter value at the start of the stage.
+        """
+
+        self.observe(stage, perf_counter() - started)
+
+
+    def count(self, event: str, amount: int = 1) -> None:
+        """
+        Count an event on the current interface.
+
+        Arguments:
+            event (str): name of the event;
+            amount (int): increment.
+        """
+
+        key = (event, self.interface)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+
+    def snapshot(self) -> dict:
+        """
+        Current values of the histograms and counters.
+
+        Returns:
+            dict: bucket bounds, histograms and counters, grouped by stage or event then interface ID.
+        """
+
+        histograms: Dict[str, Dict[str, dict]] = {}
+        for (stage, interface), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(stage, {})[interface] = {"counts": list(histogram.counts), "sum": histogram.total, "count": histogram.count}
+        counters: Dict[str, Dict[str, int]] = {}
+        for (event, interface), value in sorted(self.counters.items()):
+            counters.setdefault(event, {})[interface] = value
+        return {"buckets": list(BUCKETS), "histograms": histograms, "counters": counters}
+
+
+    def prometheus(self) -> str:
+        """
+        Current values in the Prometheus text exposition format.
+
+        Returns:
+            str: the exposition text.
+        """
+
+        lines = ["# TYPE idm_stage_seconds histogram"]
+        for (stage, interface), histogram in sorted(self.histograms.items()):
+            labels = f'stage="{stage}",interface="{interface}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                lines.append(f'idm_stage_seconds_bucket{{{labels},le="{"+Inf" if bound == float("inf") else bound}"}} {cumulative}')
+            lines.append(f"idm_stage_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"idm_stage_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# TYPE idm_events_total counter")
+        for (event, interface), value in sorted(self.counters.items()):
+            lines.append(f'idm_events_total{{event="{event}",interface="{interface}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+    def export(self) -> None:
+        """
+        Write the JSON snapshot and the Prometheus text file.
+        """
+
+        self._exported = monotonic()
+        for path, render in ((self.json_path, lambda: json.dumps(self.snapshot())), (self.prometheus_path, self.prometheus)):
+            if not path:
+                continue
+            # Replace atomically, so that a collector never reads a partial file.
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                file.write(render())
+            os.replace(path + ".tmp", path)
+
+
+    def maybe_export(self) -> None:
+        """
+        Export if the interval has passed since the last export.
+        """
+
+        if monotonic() - self._exported >= self.interval:
+            self.export()
+
+
+# The active registry, None while instrumentation is disabled.
+registry: Optional[Metrics] = None
+
+
+def enable(json_path: str = "", prometheus_path: str = "", interval: float = 10) -> Metrics:
+    """
+    Enable the instrumentation.
+
+    Arguments:
+        json_path (str): path of the JSON snapshot, empty to disable;
+        prometheus_path (str): path of the Prometheus text file, empty to disable;
+        interval (float): minimum time between two periodic exports, in seconds.
+
+    Returns:
+        Metrics: the active registry.
+    """
+
+    global registry
+    registry = Metrics(json_path, prometheus_path, interval)
+    return registry
@@ -3,13 +3,21 @@
 Defines Operator class.
 """
 
-import win32api, win32con
 import logging
-from typing import Dict, Tuple, Union
-from time import sleep
+import os
+from typing import Dict, List, Optional, Tuple, Union
 from random import randint
+from time import perf_counter
 
+from mypackage import metrics
 from mypackage.recognize import Recognizer
+from mypackage.capture import CaptureBackend, bounding_box
+from mypackage.histogram import RollHistogram
+from mypackage.layout import Layout
+from mypackage.inputs import InputBackend, Win32Input
+from mypackage.clock import Clock
+from mypackage.latency import LatencyProfile
+from mypackage.goal import Goal
 from mypackage.config import *
 from mypackage.exceptions import TargetAchievedError
 
@@ -22,88 +30,212 @@ class Operator:
 
     Arguments:
         id_to_coordinate (Dict[str, Tuple[int, int, int, int]]): mapping from option ID to coordinate;
-        targets (Dict[str, str]): mapping from interface ID to target name (template file name).
+        targets (Union[Dict[str, str], Goal]): mapping from interface ID to target name (template file name), or ranked acceptable combinations;
+        capture (CaptureBackend): source of the screen content for option matching;
+        classify (bool): whether to classify every option slot against all option templates, instead of matching the target only;
+        layout (Layout): maps the configured coordinates to the actual resolution, the reference resolution by default;
+        input_backend (InputBackend): performs mouse and keyboard operations, real input through pywin32 by default;
+        clock (Clock): clock of the deliberate waits, the real clock by default;
+        abort_on_miss (bool): whether to leave the attempt as soon as a target is missed, instead of playing it to the end;
+        abort_retries (int): times the abort key is pressed again while the selection interface stays, before playing the attempt to the end;
+        abort_clicks (Dict[str, Tuple[int, int]]): click on each interface only met on the abort route;
+        latency_profile (LatencyProfile): measured latencies calibrating the waits, None to use the configured times.
 
     Attributes:
-        _current_selection (Tuple[bool]): Record the choices made;
+        last_action (str): name of the last action performed by operate ("click", "press", "select", "abort" or "none"), or recover;
+        goal (Goal): acceptable combinations, and the options selected in the current attempt;
+        abort_failures (int): attempts played to the end because the abort route did not leave the selection interface;
+        _aborting (Optional[str]): selection interface the attempt was aborted from, None if not aborting;
+        _abort_tries (int): times the abort key was pressed again in the current abort;
+        _may_abort (bool): whether the current attempt may still be aborted;
         _logger (logging.Logger): log;
-        _option_recognizer (Recognizer): Match the options with the templates.
+        _option_recognizer (Recognizer): Match the options with the templates;
+        _roll_histogram (Optional[RollHistogram]): histogram of the observed options, None if not classifying;
+        _scaled_coordinate (Dict[str, Tuple[int, int, int, int]]): option regions at the actual resolution.
     """
     
     # Initialize Operator.
     def __init__(
         self,
         id_to_coordinate: Dict[str, Tuple[int, int, int, int]],
-        targets: Dict[str, str],
+        targets: Union[Dict[str, str], Goal],
+        capture: Optional[CaptureBackend] = None,
+        classify: bool = False,
+        layout: Optional[Layout] = None,
+        input_backend: Optional[InputBackend] = None,
+        clock: Optional[Clock] = None,
+        abort_on_miss: bool = False,
+        abort_retries: int = ABORT_RETRIES,
+        abort_clicks: Optional[Dict[str, Tuple[int, int]]] = None,
+        latency_profile: Optional[LatencyProfile] = None,
     ) -> None:
         
         # Configuration parameters.
         self.id_to_coordinate = id_to_coordinate
-        self.interface_id_to_file_name = targets
+        self.goal = targets if isinstance(targets, Goal) else Goal([targets])
+        self.classify = classify
+        self.layout = layout if layout is not None else Layout(REFERENCE_RESOLUTION, REFERENCE_RESOLUTION, REGION_ANCHORS)
+        self._scaled_coordinate = self.layout.regions(id_to_coordinate)
+        self.clock = clock if clock is not None else Clock()
+        self.input = input_backend if input_backend is not None else Win32Input(self.clock)
+        self.abort_on_miss = abort_on_miss
+        self.abort_retries = abort_retries
+        self.abort_clicks = abort_clicks if abort_clicks is not None else {}
+        self.latency_profile = latency_profile
 
         # State variables.
-        self._current_selection: Tuple[bool] = [False, False]   # Record the choices made
+        self._aborting: Optional[str] = None                     # Selection interface aborted from;
+        self._abort_tries = 0                                    # Abort key presses again in the current abort;
+        self._may_abort = True                                   # Whether the current attempt may still be aborted;
+        self.abort_failures = 0                                  # Attempts the abort route failed to leave;
+        self.last_action = "none"                                # Action performed on the current interface.
 
         # Logger.
         self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
-        # Recognizer.
+        # Recognizer, of the options of the goal, or of all the options when classifying.
         self._option_recognizer = Recognizer(
             templates_dir = OPTION_TEMPL_DIR,
-            id_to_file_name = {id: self.interface_id_to_file_name[id[:-2]] for id in self.id_to_coordinate.keys()},
+            id_to_file_name = {},
             confidence_threshold = OPTION_MATCH_THRESHOLD,
-            id_to_coordinate = self.id_to_coordinate
+            id_to_coordinate = self._scaled_coordinate,
+            capture = capture,
+            engine = SCORING_ENGINE,
+            cache_size = SCORE_CACHE_SIZE,
+            labels = [os.path.splitext(file)[0] for file in os.listdir(OPTION_TEMPL_DIR)] if classify else sorted(self.goal.names()),
+            use_bundle = TEMPLATE_BUNDLE,
+            scale = self.layout.scale,
+            clock = self.clock,
+            reuse_buffers = REUSE_BUFFERS,
+            calibration_file = CALIBRATION_FILE
         )
+        self._roll_histogram = RollHistogram(ROLL_HISTOGRAM_FILE, ROLL_HISTOGRAM_SAVE_INTERVAL) if classify else None
     
 
-    # Click on the designated location.
-    def _mouse_click(self, coordinate: Union[Tuple[int, int], Tuple[int, int, int, int]]) -> Tuple[int, int]:
+    # Click on the designated location, given at the reference resolution.
+    def _mouse_click(self, coordinate: Union[Tuple[int, int], Tuple[int, int, int, int]], region_id: Optional[str] = None) -> Tuple[int, int]:
         if len(coordinate) == 4:
-            x = (coordinate[0] + coordinate[2]) // 2
-            y = (coordinate[1] + coordinate[3]) // 2
+            box = self.layout.box(coordinate, self.layout.anchors.get(region_id))
+            x = (box[0] + box[2]) // 2
+            y = (box[1] + box[3]) // 2
         elif len(coordinate) == 2:
-            x = coordinate[0]
-            y = coordinate[1]
+            x, y = self.layout.point(coordinate)
         # Mouse move -> press -> hold -> release.
-        win32api.SetCursorPos((x + randint(-POSITION_OFFSET, POSITION_OFFSET), y + randint(-POSITION_OFFSET, POSITION_OFFSET)))
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
-        sleep(HOLD_TIME + randint(0, TIME_PAUSE) / 1000)
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP,0, 0, 0, 0)
+        if metrics.registry is not None:
+            started = perf_counter()
+        self.input.click(x + randint(-POSITION_OFFSET, POSITION_OFFSET), y + randint(-POSITION_OFFSET, POSITION_OFFSET), HOLD_TIME + randint(0, TIME_PAUSE) / 1000)
+        if metrics.registry is not None:
+            metrics.registry.since("click", started)
         return (x, y)
 
 
     # Press the designated key.
     def _keyboard_press(self, key_ascii: int) -> int:
         # Keyboard press -> hold -> release
-        win32api.keybd_event(key_ascii, 0, 0, 0)
-        sleep(HOLD_TIME + randint(0, TIME_PAUSE) / 1000)
-        win32api.keybd_event(key_ascii, 0, win32con.KEYEVENTF_KEYUP, 0)
+        if metrics.registry is not None:
+            started = perf_counter()
+        self.input.press(key_ascii, HOLD_TIME + randint(0, TIME_PAUSE) / 1000)
+        if metrics.registry is not None:
+            metrics.registry.since("press", started)
         return key_ascii
 
 
-    def _update_selection(self, interfece_id: str) -> None:
+    def _update_selection(self, interfece_id: str, label: str = "unknown") -> None:
         """
         Update the record of target completion status.
 
         Arguments:
-            interfece_id (str): used to determine which target is completed, or whether necessary to reset
+            interfece_id (str): used to determine which option is selected, or whether necessary to reset;
+            label (str): option selected, "unknown" if not recognized.
         """
 
         match interfece_id:
             case "in_game":
-                self._current_selection = [False, False]
+                self.goal.reset()
                 self._logger.info("Fail to achieve the target, reset the record of target completion status;\n")
 
-            case "select_golden_bloods_boon":
-                self._current_selection[0] = True
-                self._logger.info("Success to select the target golden blood's boon;\n")
+            case "select_golden_bloods_boon" | "select_equation":
+                self.goal.select(interfece_id, label)
+                if label == "unknown":
+                    self._logger.info("Select the default option on [%s], no combination constraining it is reachable;\n", interfece_id)
+                else:
+                    self._logger.info("Success to select [%s] on [%s];\n", label, interfece_id)
 
-            case "select_equation":
-                self._current_selection[1] = True
-                self._logger.info("Success to select the target equation;\n")
+        # Stop as soon as an acceptable combination is secured.
+        secured = self.goal.secured()
+        if secured is not None:
+            raise TargetAchievedError(secured)
 
-        if  all(completed for completed in self._current_selection):
-            raise TargetAchievedError(self.interface_id_to_file_name)
+
+    def _wait_settled(self, interface_id: str, action: str, region: Tuple[int, int, int, int], default: float, changed: bool = False) -> bool:
+        """
+        Wait for the options to settle after an action, at most the calibrated latency of the action.
+
+        Arguments:
+            interface_id (str): interface the action is performed on;
+            action (str): name of the action;
+            region (Tuple[int, int, int, int]): region of the options;
+            default (float): configured maximum time of the wait;
+            changed (bool): whether the region must change before settling.
+
+        Returns:
+            bool: True if the options settled, False if timeout.
+        """
+
+        timeout = default if self.latency_profile is None else self.latency_profile.delay(interface_id, action, default)
+        started = self.clock.time()
+        is_stable = self._option_recognizer.wait_until_stable(region, timeout + randint(0, TIME_PAUSE) / 1000, changed=changed)
+        if self.latency_profile is not None:
+            if is_stable:
+                self.latency_profile.observe(interface_id, action, self.clock.time() - started)
+            else:
+                self.latency_profile.fail(interface_id, action)
+        return is_stable
+
+
+    def _abort(self, interface_id: str) -> str:
+        """
+        Abort the attempt, the target being unreachable: open the menu and take the shortest route back to the start interface.
+
+        Arguments:
+            interface_id (str): selection interface where the target is missed.
+
+        Returns:
+            str: "opt_abort".
+        """
+
+        self._logger.info("Target unreachable in this attempt, abort from [%s];\n", interface_id)
+        self.goal.reset()
+        self._aborting = interface_id
+        self._abort_tries = 0
+        self._keyboard_press(ABORT_KEY)
+        return "opt_abort"
+
+
+    def _classify(self, interface_id: str) -> Tuple[List[str], List[str]]:
+        """
+        Classify every option slot of the selection interface, and record the observed options when classifying.
+
+        Only the options of the goal are recognized unless classifying against all option templates.
+
+        Arguments:
+            interface_id (str): which selection interfece is currently in.
+
+        Returns:
+            Tuple[List[str], List[str]]: option IDs of the slots, and the option recognized in each ("unknown" if none).
+        """
+
+        slots = [id for id in self.id_to_coordinate if id[:-2] == interface_id]
+        names = None if self.classify else sorted(self.goal.names(interface_id))
+        if names == []:
+            return slots, ["unknown"] * len(slots)
+        results = self._option_recognizer.classify(slots, file_names=names)
+        # Options under the (calibrated) thresholds are unknown.
+        labels = [label if self._option_recognizer.accepts(label, score, margin) else "unknown" for label, score, margin in results.values()]
+        if self._roll_histogram is not None:
+            self._roll_histogram.record(interface_id, labels)
+        self._logger.info("Observed options: %s;", labels)
+        return slots, labels
 
 
     def _select(self, interface_id: str, is_rolled: bool = False) -> None:
@@ -120,36 +252,72 @@ class Operator:
         # Selections interface which need to judge.
         if interface_id == "select_golden_bloods_boon" or interface_id == "select_equation":
 
-            # Play the animation of entering the boons selection interface.
+            # Region of the options in the current interface, watched while the animations play.
+            options_region = bounding_box(coor for id, coor in self._scaled_coordinate.items() if id[:-2] == interface_id)
+
+            # Play the animation of entering the boons selection interface, until the options settle.
+            # The slots must change first, two polls of the empty slots before the animation starts are not settled.
             if interface_id == "select_golden_bloods_boon" and is_rolled == False:
-                sleep(BOONS_ANIMATION_TIME + randint(0, TIME_PAUSE) / 1000)
+                self._wait_settled(interface_id, "enter", options_region, BOONS_ANIMATION_TIME, changed=True)
 
-            # Match the characteristic regions of options.
-            my_option = self._option_recognizer.match()
+            # Recognize the options, and keep the one leaving the most valuable combination reachable.
+            slots, labels = self._classify(interface_id)
+            slot = self.goal.choose(interface_id, labels)
             # Match successfully. Select and confirm, and update the target progress.
-            if my_option != "unmatched":
-                self._logger.info(f"Select the target option [{my_option}] and config;\n")
-                self._mouse_click(self.id_to_coordinate[my_option])
-                sleep(SELECT_TO_CONFIRM_TIME + randint(0, TIME_PAUSE) / 1000)
+            if slot is not None:
+                my_option = slots[slot]
+                self._logger.info("Select the target option [%s] and config;\n", my_option)
+                self._mouse_click(self.id_to_coordinate[my_option], my_option)
+                # Measured as "highlight", "select" is the transition to the next interface measured by Runner.
+                self._wait_settled(interface_id, "highlight", options_region, SELECT_TO_CONFIRM_TIME, changed=True)
                 self._mouse_click(CONFIRM[interface_id])
-                self._update_selection(interface_id)
+                self._update_selection(interface_id, labels[slot])
                 return my_option
 
             # Match failed. If the unrolled bonns interface is currently in, roll it and call itself with is_rolled = True
             elif interface_id == "select_golden_bloods_boon" and is_rolled == False:
                 self._logger.info("Roll the golden blood's boon;")
                 self._mouse_click(ROLL)
-                self._logger.info(f"Wait {ROOL_ANIMATION_TIME}s for the rolling animation playing;")
-                sleep(ROOL_ANIMATION_TIME + randint(0, TIME_PAUSE) / 1000)
+                self._logger.info("Wait at most %ss for the rolling animation playing;", ROOL_ANIMATION_TIME)
+                self._wait_settled(interface_id, "roll", options_region, ROOL_ANIMATION_TIME, changed=True)
                 return self._select(interface_id, is_rolled = True)
 
+            # Match failed for good, the target of this attempt is unreachable.
+            elif self.abort_on_miss and self._may_abort:
+                return self._abort(interface_id)
+
         # Select the default option and confirm.
         self._logger.info("Select the default option and confirm;\n")
         self._mouse_click(DEFAULT)
-        sleep(SELECT_TO_CONFIRM_TIME + randint(0, TIME_PAUSE) / 1000)
+        self.clock.sleep(SELECT_TO_CONFIRM_TIME + randint(0, TIME_PAUSE) / 1000)
         self._mouse_click(CONFIRM[interface_id])
+        # The option selected is unknown, no combination constraining this interface is reachable anymore.
+        if interface_id == "select_golden_bloods_boon" or interface_id == "select_equation":
+            self._update_selection(interface_id)
         return "opt_default"
 
+    def save(self) -> None:
+        """
+        Save the histogram of the observed options, on exit.
+        """
+
+        if self._roll_histogram is not None:
+            self._roll_histogram.save()
+
+    def recover(self, action: str) -> None:
+        """
+        Perform a recovery action of the stall watchdog.
+
+        Arguments:
+            action (str): "esc" presses ESC, "click_center" clicks on the screen centre.
+        """
+
+        if action == "esc":
+            self._logger.info("Press the keyboard: %d(ASCII);\n", self._keyboard_press(27))
+        elif action == "click_center":
+            self._logger.info("Click on the position: %s;\n", self._mouse_click(DEFAULT))
+        self.last_action = action
+
     def operate(self, interface_id: str) -> None:
         """
         Perform operation according to the current interface ID.
@@ -158,27 +326,57 @@ class Operator:
             interface_id (str): current interface ID.
         """
 
+        # Back to the start, the abort (if any) is over.
+        if interface_id == "start_game":
+            self._aborting = None
+            self._may_abort = True
+
+        self.last_action = "none"
         match interface_id:
-            case "undefined":
+            case "unmatched":
                 self._logger.info("No operate;\n")
 
             case "start_game" | "select_conv" | "conv_calculus" | "run_calculus" | "restart_game" | "hint" | "exit":
                 # Fixed process, click on the screen center directly.
-                self._logger.info(f"Click on the position: {self._mouse_click(INTERFACE_REGIONS[interface_id])};\n")
+                self._logger.info("Click on the position: %s;\n", self._mouse_click(INTERFACE_REGIONS[interface_id], interface_id))
+                self.last_action = "click"
+
+            case "select_golden_bloods_boon" | "select_equation" if self._aborting == interface_id and self._abort_tries < self.abort_retries:
+                # Still on the interface aborted from, e.g. the key was dropped: press it again.
+                self._abort_tries += 1
+                self._logger.warning("The abort route did not leave [%s], press the abort key again (%d/%d);\n", interface_id, self._abort_tries, self.abort_retries)
+                self._keyboard_press(ABORT_KEY)
+                self.last_action = "abort"
+
+            case "select_golden_bloods_boon" | "select_equation" if self._aborting == interface_id:
+                # The abort route is unavailable from this interface: go on to the end of this attempt, and abort again in the next ones.
+                self._logger.warning("The abort route did not leave [%s] after %d retries, play this attempt to the end;\n", interface_id, self.abort_retries)
+                self.abort_failures += 1
+                self._aborting = None
+                self._may_abort = False
+                self._select(interface_id, is_rolled = True)
+                self.last_action = "select"
 
             case "select_golden_bloods_boon" | "select_equation" | "select_oddity" | "select_blessing" | "select_weighted_curio":
                 # Selection interface.
                 self._logger.info("Selecting...")
-                self._select(interface_id)
+                self.last_action = "abort" if self._select(interface_id) == "opt_abort" else "select"
 
             case "confirm_equation" | "confirm_blessing":
                 # Confirm the acquisition interface, press ESC.
-                self._logger.info(f"Press the keyboard: {self._keyboard_press(27)}(ASCII);\n")
+                self._logger.info("Press the keyboard: %d(ASCII);\n", self._keyboard_press(27))
+                self.last_action = "press"
 
             case "in_game":
                 # Entered the game without achieving the target, execute the restart process.
                 self._update_selection(interface_id)
-                self._logger.info(f"Press the keyboard: {self._keyboard_press(27)}(ASCII);\n")
+                self._logger.info("Press the keyboard: %d(ASCII);\n", self._keyboard_press(27))
+                self.last_action = "press"
+
+            case _ if interface_id in self.abort_clicks:
+                # Interface on the abort route.
+                self._logger.info("Click on the position: %s;\n", self._mouse_click(self.abort_clicks[interface_id]))
+                self.last_action = "click"
 
             case _:
                 self._logger.warning("Abnormal interface id;\n")
@@ -0,0 +1,254 @@
+# mypackage/pipeline.py
+"""
+Defines the pipelined runtime.
+
+Capture, recognition and action overlap instead of running one after another:
+* a capture thread grabs the interface regions continuously into a preallocated ring buffer of frames;
+* a recognition thread always takes the newest frame (stale frames are dropped) and publishes the result with the frame timestamp;
+* the executor (calling thread) runs Operator on results whose frame was captured after its previous action completed.
+"""
+
+from typing import List, Optional, Tuple
+from time import time
+import logging
+import threading
+import numpy
+
+from mypackage import metrics
+from mypackage.capture import Box, CaptureBackend, Frame
+from mypackage.runtime import Runner
+from mypackage.config import CAPTURE_INTERVAL_TIME, FRAME_RING_SIZE, MONITOR_INTERVAL_TIME
+from mypackage.exceptions import MaxAttemptCountExceededError
+
+
+class FrameRing:
+    """
+    Ring buffer of frames with preallocated image storage.
+
+    Image data of each frame is copied into the storage of its slot, allocated once for the first frame's patch shapes.
+    The slot of the frame last taken by the consumer is never overwritten, so it stays valid until the next one is taken.
+
+    Arguments:
+        capacity (int): number of slots, at least 3 (the newest frame, the one being read, the one being written).
+
+    Attributes:
+        _slots (List[Optional[Tuple[int, Frame]]]): (sequence number, frame) of each slot;
+        _storage (List[List[numpy.ndarray]]): image storage of each slot, one array per patch;
+        _sequence (int): sequence number of the newest frame;
+        _newest (int): slot index of the newest frame;
+        _reading (int): slot index of the frame last taken by the consumer, -1 if none;
+        _condition (threading.Condition): notifies the consumers of new frames.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(capacity, 3)
+
+        # State variables.
+        self._slots: List[Optional[Tuple[int, Frame]]] = [None] * self.capacity
+        self._storage: List[List[numpy.ndarray]] = []
+        self._sequence = 0
+        self._newest = -1
+        self._reading = -1
+        self._condition = threading.Condition()
+
+
+    def put(self, frame: Frame) -> None:
+        """
+        Store a frame, overwriting the oldest one.
+
+        Arguments:
+            frame (Frame): captured frame.
+        """
+
+        shapes = [image.shape for _, image in frame.patches]
+        if not self._storage or [array.shape for array in self._storage[0]] != shapes:
+            self._storage = [[numpy.empty(shape, numpy.uint8) for shape in shapes] for _ in range(self.capacity)]
+        with self._condition:
+            index = (self._newest + 1) % self.capacity
+            if index == self._reading:
+                index = (index + 1) % self.capacity
+        for array, (_, image) in zip(self._storage[index], frame.patches):
+            numpy.copyto(array, image)
+        stored = Frame([(box, array) for (box, _), array in zip(frame.patches, self._storage[index])], frame.timestamp)
+        with self._condition:
+            self._sequence += 1
+            self._slots[index] = (self._sequence, stored)
+            self._newest = index
+            self._condition.notify_all()
+
+
+    def latest(self, after: int, timeout: float) -> Optional[Tuple[int, Frame]]:
+        """
+        Take the newest frame, waiting until one newer than a sequence number is available.
+
+        Arguments:
+            after (int): sequence number of the frame already consumed;
+            timeout (float): maximum time to wait, in seconds.
+
+        Returns:
+            Optional[Tuple[int, Frame]]: (sequence number, frame), None if timeout.
+        """
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._sequence > after, timeout):
+                return None
+            self._reading = self._newest
+            return self._slots[self._newest]
+
+
+class SynchronizedCapture(CaptureBackend):
+    """
+    Capture backend wrapper serializing the grabs, shared by the capture thread and Operator.
+
+    Arguments:
+        capture (CaptureBackend): the wrapped capture backend.
+    """
+
+    def __init__(self, capture: CaptureBackend) -> None:
+        self.capture = capture
+        self._lock = threading.Lock()
+
+
+    def size(self) -> Tuple[int, int]:
+        return self.capture.size()
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        with self._lock:
+            return self.capture.grab(boxes)
+
+
+class PipelinedRunner(Runner):
+    """
+    Runner overlapping capture, recognition and action.
+
+    Takes the same arguments as Runner, tick latencies are measured from the frame capture to the end of the action.
+    The flight recorder keeps every recognized frame, an action is recorded on the newest one when it completes.
+    The capture backend is shared with Operator, wrap it in SynchronizedCapture.
+
+    Attributes:
+        _ring (FrameRing): frames captured by the capture thread;
+        _result (Tuple[int, float, str]): newest recognition result, as (sequence number, frame timestamp, interface ID);
+        _result_condition (threading.Condition): notifies the executor of new results;
+        _stop (threading.Event): stops the threads;
+        _error (Optional[BaseException]): exception raised in a thread, re-raised by the executor.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        # State variables.
+        self._ring = FrameRing(FRAME_RING_SIZE)
+        self._result: Tuple[int, float, str] = (0, 0., "unmatched")
+        self._result_condition = threading.Condition()
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+
+    def _capture_loop(self, capture: CaptureBackend, boxes: List[Box]) -> None:
+        try:
+            while not self._stop.is_set():
+                self._ring.put(capture.grab(boxes))
+                self._stop.wait(CAPTURE_INTERVAL_TIME)
+        except BaseException as e:
+            self._fail(e)
+
+
+    def _recognize_loop(self) -> None:
+        try:
+            sequence = 0
+            while not self._stop.is_set():
+                # Always the newest frame, the ones captured in between are dropped.
+                latest = self._ring.latest(sequence, MONITOR_INTERVAL_TIME)
+                if latest is None:
+                    continue
+                sequence, frame = latest
+                interface_id = self.interface_matcher.match(frame)
+                if self.flight is not None:
+                    self.flight.record(frame, self.interface_matcher.last_scores, interface_id)
+                with self._result_condition:
+                    self._result = (sequence, frame.timestamp, interface_id)
+                    self._result_condition.notify_all()
+        except BaseException as e:
+            self._fail(e)
+
+
+    def _fail(self, error: BaseException) -> None:
+        # Hand the exception over to the executor.
+        with self._result_condition:
+            self._error = error
+            self._stop.set()
+            self._result_condition.notify_all()
+
+
+    def _next_result(self, after: int, not_before: float, last_id: str, last_action: float) -> Optional[Tuple[int, float, str]]:
+        # Wait for a result on a frame captured after the previous action, ignoring the interface just operated unless it persists.
+        # Gives up after the monitor interval when watched, so that stalls on unrecognized screens are noticed.
+        def is_ready() -> bool:
+            sequence, timestamp, interface_id = self._result
+            if self._error is not None:
+                return True
+            if sequence <= after or timestamp < not_before or interface_id == "unmatched":
+                return False
+            return interface_id != last_id or timestamp - last_action >= MONITOR_INTERVAL_TIME
+
+        with self._result_condition:
+            is_ready = self._result_condition.wait_for(is_ready, MONITOR_INTERVAL_TIME if self.watchdog is not None else None)
+            if self._error is not None:
+                raise self._error
+            return self._result if is_ready else None
+
+
+    def run(self) -> None:
+        self._logger.info("Begins pipelined monitoring, press Ctrl+C to interrupt;\n\n")
+        self.started = self.operator.clock.time()
+        threads = [
+            threading.Thread(target=self._capture_loop, args=(self.interface_matcher.capture, self.interface_matcher.boxes), name="capture", daemon=True),
+            threading.Thread(target=self._recognize_loop, name="recognize", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            sequence, last_id, last_action = 0, "", 0.
+            while self.attempts <= self.max_attempt_count:
+                # Never act on a frame captured before the previous action completed.
+                result = self._next_result(sequence, last_action, last_id, last_action)
+                if result is None:
+                    # Nothing to act on for the monitor interval, watch the newest recognition.
+                    if self.watchdog.observe(self._result[2]) is not None:
+                        last_id, last_action = "unmatched", time()
+                    continue
+                sequence, timestamp, interface_id = result
+                # Latency of the previous action, until the next interface is captured.
+                if self.operator.latency_profile is not None and last_id and interface_id != last_id:
+                    self.operator.latency_profile.observe(last_id, self.operator.last_action, timestamp - last_action)
+                if self.recorder is not None:
+                    self.recorder.record_interface(interface_id)
+                if metrics.registry is not None:
+                    metrics.registry.interface = interface_id
+                    metrics.registry.count("match")
+                if interface_id == "start_game":
+                    self.attempts += 1
+                    self._logger.info("Begin to attempt the order number: %d;\n%s", self.attempts, "-" * 100)
+                self._logger.info("Current interface id: [%s];", interface_id)
+                try:
+                    self.operator.operate(interface_id)
+                finally:
+                    if self.flight is not None:
+                        self.flight.record_action(self.operator.last_action)
+                    last_id, last_action = interface_id, time()
+                    self.tick_latencies.append(last_action - timestamp)
+                    if metrics.registry is not None:
+                        metrics.registry.observe("tick", self.tick_latencies[-1])
+                        metrics.registry.maybe_export()
+                if self.watchdog is not None and self.watchdog.observe(interface_id) is not None:
+                    last_action = time()
+            raise MaxAttemptCountExceededError(self.max_attempt_count)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=1)
@@ -3,17 +3,30 @@
 Defines Recognizer class.
 """
 
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple
+from time import perf_counter
 import numpy
-from pyautogui import screenshot
 import os
 import cv2
 import logging
-from PIL import Image
 
+from mypackage import metrics
+from mypackage.capture import Box, CaptureBackend, Frame, ScreenCapture
+from mypackage.scoring import create_engine
+from mypackage.transition import TransitionModel
+from mypackage.cache import ScoreCache
+from mypackage.bundle import load_bundle
+from mypackage.layout import scale_template
+from mypackage.clock import Clock
+from mypackage.calibrate import load_calibration
+from mypackage.config import POLL_INTERVAL_TIME, SCORE_CACHE_STEP, SHIFT_CONFIRM_COUNT, SIGNATURE_STEP, STABLE_FRAMES, STABLE_TOLERANCE
 from mypackage.exceptions import TemplateNotFoundError
 
 
+# Records of the region scores, (region ID, score) in the arguments, see utils.setup_logger.
+_score_logger = logging.getLogger(f"{__name__}.scores")
+
+
 class Recognizer:
     """
     Screen Recognizer, encapsulate the logic of template loading and screen identify.
@@ -21,12 +34,39 @@ class Recognizer:
     Arguments:
         templates_dir (str): directory of template image files;
         id_to_file_name (Dict[str, str]): mapping from characteristic region id to template file name;
-        confidence_threshold (float): matching confidence threshold;
-        id_to_coordinate (Dict[str, Tuple[int, int, int, int]]): mapping from interface ID to characteristic region coordinates.
+        confidence_threshold (float): matching confidence threshold, of the templates not calibrated;
+        id_to_coordinate (Dict[str, Tuple[int, int, int, int]]): mapping from interface ID to characteristic region coordinates;
+        capture (CaptureBackend): source of the screen content, grab the bounding box of the regions from the screen by default;
+        engine (str): scoring engine, "cv2" calls cv2.matchTemplate per template, "ncc" scores same-shape templates in one batch,
+            "cascade" rejects clear non-matches on downsampled images first;
+        transitions (TransitionModel): transition table to test the most likely next IDs first, None to test in the order of id_to_coordinate;
+        cache_size (int): maximum number of memoized region scores (of match, score and classify), 0 to disable memoization;
+        labels (List[str]): extra template file names loaded for classification;
+        use_bundle (bool): whether to memory-map the precompiled template bundle instead of decoding the PNGs;
+        scale (float): UI scale of the actual resolution, templates are rescaled once (and cached in the bundle) to match the regions;
+        clock (Clock): clock of the waits, the real clock by default;
+        search_padding (int): margin (px at the reference resolution) searched around each region when nothing matches at the configured offsets, 0 to disable;
+        reuse_buffers (bool): whether to convert each region to grayscale into its own preallocated buffer, instead of the whole captured patch;
+        calibration_file (str): per-template thresholds and margins (see mypackage.calibrate), empty to use confidence_threshold for all.
 
     Attributes:
         _file_name_to_template (Dict[str, np.ndarray]): mapping from template file name to template image data;
         _is_loaded (bool): whether template image date loaded;
+        engine (ScoringEngine): scores characteristic images against the loaded templates;
+        cache (Optional[ScoreCache]): memoized scores of unchanged regions, with hit/miss counters;
+        boxes (List[Tuple[int, int, int, int]]): distinct characteristic regions (padded when searching), requested from the capture backend;
+        offsets (Dict[Tuple[int, int, int, int], Tuple[int, int]]): mapping from configured region to the (dx, dy) shift applied to it;
+        _box_to_ids (Dict[Tuple[int, int, int, int], List[str]]): region plan, mapping from each distinct region to the IDs sharing it;
+        _origins (Dict[Tuple[int, int, int, int], Tuple[int, int, int, int]]): mapping from each distinct region to its configured region;
+        _search_boxes (Dict[Tuple[int, int, int, int], Tuple[int, int, int, int]]): mapping from configured region to the padded area searched;
+        _pending (Dict[Tuple[int, int, int, int], Tuple[Tuple[int, int], int]]): mapping from configured region to (offset found, consecutive times);
+        _gray_buffers (Dict[Tuple[int, int, int, int], numpy.ndarray]): mapping from region to its grayscale buffer, when reusing buffers;
+        thresholds (Dict[str, float]): mapping from template file name to its calibrated confidence threshold;
+        margins (Dict[str, float]): mapping from template file name to its calibrated threshold of the margin over the second best, when classifying;
+        _id_to_threshold (Dict[str, float]): confidence threshold of each ID;
+        last_frame (Optional[Frame]): frame of the last match, None before matching;
+        last_scores (Dict[str, float]): mapping from ID to the confidence computed in the last match (the IDs tested before the hit);
+        _previous_id (Optional[str]): ID matched last time, None if nothing matched yet;
         _logger (logging.Logger): log.
     """
 
@@ -36,18 +76,62 @@ class Recognizer:
         templates_dir: str,
         id_to_file_name: Dict[str, str],
         confidence_threshold: float,
-        id_to_coordinate: Dict[str, List[Tuple[int, int, int, int]]]
+        id_to_coordinate: Dict[str, List[Tuple[int, int, int, int]]],
+        capture: Optional[CaptureBackend] = None,
+        engine: str = "cv2",
+        transitions: Optional[TransitionModel] = None,
+        cache_size: int = 0,
+        labels: Optional[List[str]] = None,
+        use_bundle: bool = False,
+        scale: float = 1,
+        clock: Optional[Clock] = None,
+        search_padding: int = 0,
+        reuse_buffers: bool = False,
+        calibration_file: str = ""
     ) -> None:
 
         # Configuration parameters.
         self.templates_dir = templates_dir
         self.id_to_file_name = id_to_file_name
         self.confidence_threshold = confidence_threshold
-        self.id_to_coordinate = id_to_coordinate
+        self.id_to_coordinate = dict(id_to_coordinate)
+        self.capture = capture if capture is not None else ScreenCapture()
+        self.transitions = transitions
+        self.labels = labels if labels is not None else []
+        self.use_bundle = use_bundle
+        self.scale = scale
+        self.clock = clock if clock is not None else Clock()
+        self.search_padding = round(search_padding * scale)
+        self.reuse_buffers = reuse_buffers
 
         # State variables.
         self._file_name_to_template: Dict[str, numpy.ndarray] = {}   # Store the templates data loaded;
-        self._is_loaded = False                                      # Whether the templates has been loaded.
+        self._is_loaded = False                                      # Whether the templates has been loaded;
+        self.engine = create_engine(engine)                         # Score regions against templates;
+        self.cache = ScoreCache(cache_size, SCORE_CACHE_STEP) if cache_size > 0 else None
+        self.boxes = list(dict.fromkeys(id_to_coordinate.values())) # Regions to capture, without duplicates;
+        self._box_to_ids: Dict[Tuple[int, int, int, int], List[str]] = {box: [] for box in self.boxes}
+        for region_id, region_coor in id_to_coordinate.items():      # IDs sharing each region.
+            self._box_to_ids[region_coor].append(region_id)
+        self._previous_id: Optional[str] = None                      # ID matched last time;
+        self.offsets: Dict[Tuple[int, int, int, int], Tuple[int, int]] = {}
+        self._origins = {box: box for box in self.boxes}             # Configured region of each (shifted) region;
+        self._search_boxes: Dict[Tuple[int, int, int, int], Tuple[int, int, int, int]] = {}
+        self._pending: Dict[Tuple[int, int, int, int], Tuple[Tuple[int, int], int]] = {}
+        if self.search_padding > 0:                                  # Padded areas, captured instead of the regions.
+            width, height = self.capture.size()
+            pad = self.search_padding
+            self._search_boxes = {
+                box: (max(box[0] - pad, 0), max(box[1] - pad, 0), min(box[2] + pad, width), min(box[3] + pad, height)) for box in self.boxes
+            }
+            self.boxes = list(self._search_boxes.values())
+        self._gray_buffers: Dict[Tuple[int, int, int, int], numpy.ndarray] = {}
+        self.last_frame: Optional[Frame] = None
+        self.last_scores: Dict[str, float] = {}
+        calibration = load_calibration(calibration_file, templates_dir)
+        self.thresholds: Dict[str, float] = {name: values["threshold"] for name, values in calibration.items()}
+        self.margins: Dict[str, float] = {name: values["margin"] for name, values in calibration.items() if values.get("margin") is not None}
+        self._id_to_threshold = {id: self.threshold(file_name) for id, file_name in id_to_file_name.items()}
 
         # Logger.
         self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
@@ -55,42 +139,6 @@ class Recognizer:
         self._load_templates()
 
 
-    def _image_pretreat(self, image: Union[Image.Image, numpy.ndarray], if_cv: bool = False) -> numpy.ndarray:
-        """
-        Pretreat the image.
-
-        Arguments:
-            image (Union[PIL.Image, np.ndarray]): untreated image date
-            if_cv (bool): whether the umtreated imgae in format numpy.ndarray
-
-        Returns:
-            np.ndarray: treted image data
-        """
-
-        if if_cv:
-            return image
-        else:
-            return cv2.cvtColor(numpy.array(image), cv2.COLOR_RGB2GRAY)
-    
-
-    def _image_identify(self, screenshot: numpy.ndarray, template: numpy.ndarray) -> float:
-        """
-        Match screemshot with template.
-
-        Arguments:
-            image (numpy.ndarray): screenshot image data
-            template (numpy.ndarray): template image data
-
-        Returns:
-            float: Confidece to treat the screenshot matches with the template. -1 means that the screenshot and template size are different, skipping matching
-        """
-
-        if screenshot.shape != template.shape:
-            return -1.
-        else:
-            return cv2.matchTemplate(image = screenshot, templ = template, method = cv2.TM_CCOEFF_NORMED)[0][0]
-    
-
     def _load_templates(self) -> bool:
         """
         Load interface template data and check whether there is a one-to-one correspondence between templates and interface IDs.
@@ -107,21 +155,32 @@ class Recognizer:
         if not os.path.isdir(self.templates_dir):
             raise TemplateNotFoundError(self.templates_dir)
 
-        # Traverse all templates in the folder.
-        for template_file in os.listdir(self.templates_dir):
+        # Map the precompiled bundle if enabled, rebuilt when the PNGs changed.
+        bundle = load_bundle(self.templates_dir, scale=self.scale) if self.use_bundle else None
+        if bundle is not None:
+            for file_name, (template, mean, norm) in bundle.items():
+                # Only load specified templates and ignore others.
+                if file_name not in self.id_to_file_name.values() and file_name not in self.labels: continue
+                self._file_name_to_template[file_name] = template
+                self.engine.add(file_name, template, (mean, norm))
+
+        # Otherwise, traverse all templates in the folder.
+        for template_file in os.listdir(self.templates_dir) if bundle is None else []:
             file_name = os.path.splitext(template_file)[0]
             # Only load specified templates and ignore others.
-            if file_name not in self.id_to_file_name.values(): continue
-            self._logger.debug(f"Loading the template [{file_name}]...")
+            if file_name not in self.id_to_file_name.values() and file_name not in self.labels: continue
+            self._logger.debug("Loading the template [%s]...", file_name)
             # Load template image data.
             template_path = os.path.join(self.templates_dir, template_file)
             template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
 
             if template is None:
                 raise TemplateNotFoundError(template_path)
+            template = scale_template(template, self.scale)
 
-            # Pretreat and record template image data.
-            self._file_name_to_template[file_name] = self._image_pretreat(template, if_cv=True)
+            # Record template image data, already grayscale.
+            self._file_name_to_template[file_name] = template
+            self.engine.add(file_name, self._file_name_to_template[file_name])
 
         # Makesure all characteristic region IDs have corresponding template.
         missing_ids = [id for id in self.id_to_file_name if self.id_to_file_name[id] not in self._file_name_to_template.keys()]
@@ -130,34 +189,371 @@ class Recognizer:
 
         # Load templates successfully.
         self._is_loaded = True
-        self._logger.info(f"Success to load {len(self._file_name_to_template)} templates;\n")
+        self._logger.info("Success to load %d templates;\n", len(self._file_name_to_template))
         return True
 
 
-    def match(self) -> str:
+    def _grab(self, boxes: List[Box]) -> Frame:
+        # Capture the screen content, timed when instrumented.
+        if metrics.registry is None:
+            return self.capture.grab(boxes)
+        started = perf_counter()
+        screen = self.capture.grab(boxes)
+        metrics.registry.since("capture", started)
+        return screen
+
+
+    def _gray_crop(self, screen: Frame, region_coor: Tuple[int, int, int, int]) -> numpy.ndarray:
+        # Grayscale region, converted into its own buffer when reusing buffers.
+        if not self.reuse_buffers:
+            return screen.gray_crop(region_coor)
+        buffer = self._gray_buffers.get(region_coor)
+        if buffer is None:
+            buffer = self._gray_buffers[region_coor] = numpy.empty((region_coor[3] - region_coor[1], region_coor[2] - region_coor[0]), numpy.uint8)
+        return screen.gray_crop(region_coor, buffer)
+
+
+    def _score_region(self, screen: Frame, region_coor: Tuple[int, int, int, int]) -> Dict[str, float]:
+        """
+        Score all the IDs sharing one characteristic region.
+
+        Arguments:
+            screen (Frame): captured screen content;
+            region_coor (Tuple[int, int, int, int]): characteristic region coordinates.
+
+        Returns:
+            Dict[str, float]: mapping from ID to confidence.
+        """
+
+        # The region is cut out of the grayscale frame once, and scored against all its templates together.
+        character_image = self._gray_crop(screen, region_coor)
+        # Reuse the scores if the pixels of the region are unchanged.
+        if self.cache is not None:
+            cache_key = self.cache.key(region_coor, character_image)
+            scores = self.cache.get(cache_key)
+            if scores is not None:
+                return scores
+        region_ids = self._box_to_ids[region_coor]
+        if metrics.registry is not None:
+            started = perf_counter()
+        file_name_to_score = self.engine.score(character_image, list(dict.fromkeys(self.id_to_file_name[id] for id in region_ids)))
+        if metrics.registry is not None:
+            metrics.registry.since("score", started)
+        scores = {region_id: file_name_to_score[self.id_to_file_name[region_id]] for region_id in region_ids}
+        # Score records, as text in the log or as events in the JSONL stream.
+        if _score_logger.isEnabledFor(logging.DEBUG):
+            for region_id in region_ids:
+                _score_logger.debug("Interface [%s] with confidence level: %.4f;", region_id, scores[region_id])
+        if self.cache is not None:
+            self.cache.put(cache_key, scores)
+        return scores
+
+
+    def match(self, screen: Optional[Frame] = None) -> str:
         """
         Match screen with the interface IDS.
 
         Obtain current screenshot, match with the templates, return the matched interface ID.
 
+        Arguments:
+            screen (Optional[Frame]): frame already captured (covering the regions), None to grab one from the capture backend.
+
         Returns:
             str: if matched, return the interface ID; else, return "unmatched".
         """
 
-        # Makesure the template data is loaded and corresponds to the interface IDs.
-        
-        
-        # Obtain current screenshot.
-        screen = screenshot()
-        # Traverse all characteristic region IDs, crop and pretreat to obtain characteristic image.
-        for region_id, region_coor in self.id_to_coordinate.items():
-            character_image = self._image_pretreat(screen.crop(region_coor))
-            # Calculate the confidence level.
-            confidence = self._image_identify(character_image, self._file_name_to_template[self.id_to_file_name[region_id]])
-            self._logger.debug(f"Interface [{region_id}] with confidence level: {confidence:.4f};")
-
-            # Match success.
-            if confidence > self.confidence_threshold:
-                return region_id
+        # Obtain current screen content of the characteristic regions.
+        if screen is None:
+            screen = self._grab(self.boxes)
+        self.last_frame = screen
+        # Most likely IDs first, following the previous match.
+        if self.transitions is not None:
+            region_ids = self.transitions.candidates(self._previous_id, list(self.id_to_coordinate))
+        else:
+            region_ids = self.id_to_coordinate.keys()
+        region_ids = list(region_ids)
+        # Traverse the characteristic region IDs in order, each distinct region is scored once for all IDs sharing it.
+        scores: Dict[str, float] = {}
+        self.last_scores = scores
+        for region_id in region_ids:
+            if region_id not in scores:
+                scores.update(self._score_region(screen, self.id_to_coordinate[region_id]))
+
+            # Match success, stop at the first confident hit.
+            if scores[region_id] > self._id_to_threshold[region_id]:
+                self._pending.pop(self._origins[self.id_to_coordinate[region_id]], None)
+                return self._matched(region_id)
+        # Nothing at the configured offsets, search around the regions in the same order.
+        if self.search_padding > 0:
+            searched: Dict[str, Tuple[float, Tuple[int, int]]] = {}
+            for region_id in region_ids:
+                if region_id not in searched:
+                    searched.update(self._search_region(screen, self.id_to_coordinate[region_id]))
+                score, offset = searched[region_id]
+                if score > self._id_to_threshold[region_id]:
+                    self._feed_offset(self.id_to_coordinate[region_id], offset)
+                    return self._matched(region_id)
         # All regions unmatched.
         return "unmatched"
+
+
+    def _matched(self, region_id: str) -> str:
+        # Record the transition to the matched ID.
+        if self.transitions is not None and self._previous_id is not None:
+            self.transitions.observe(self._previous_id, region_id)
+        self._previous_id = region_id
+        return region_id
+
+
+    def _search_region(self, screen: Frame, region_coor: Tuple[int, int, int, int]) -> Dict[str, Tuple[float, Tuple[int, int]]]:
+        """
+        Search the best offset of the templates of one characteristic region, within the padded area around its configured position.
+
+        cv2.matchTemplate scores every offset of the padded area in one call (through the DFT for the larger templates).
+
+        Arguments:
+            screen (Frame): captured screen content, covering the padded area;
+            region_coor (Tuple[int, int, int, int]): characteristic region coordinates.
+
+        Returns:
+            Dict[str, Tuple[float, Tuple[int, int]]]: mapping from ID to (best confidence, its (dx, dy) offset from the configured region).
+        """
+
+        origin = self._origins[region_coor]
+        search_box = self._search_boxes[origin]
+        window = self._gray_crop(screen, search_box)
+        if metrics.registry is not None:
+            started = perf_counter()
+            metrics.registry.count("shift_search")
+        file_name_to_result = {}
+        for file_name in dict.fromkeys(self.id_to_file_name[id] for id in self._box_to_ids[region_coor]):
+            template = self._file_name_to_template[file_name]
+            if template.shape[0] > window.shape[0] or template.shape[1] > window.shape[1]:
+                file_name_to_result[file_name] = (-1., (0, 0))
+                continue
+            _, score, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED))
+            file_name_to_result[file_name] = (score, (search_box[0] + x - origin[0], search_box[1] + y - origin[1]))
+        if metrics.registry is not None:
+            metrics.registry.since("shift_search", started)
+        results = {region_id: file_name_to_result[self.id_to_file_name[region_id]] for region_id in self._box_to_ids[region_coor]}
+        if _score_logger.isEnabledFor(logging.DEBUG):
+            for region_id, (score, offset) in results.items():
+                _score_logger.debug("Interface [%s] searched with confidence level: %.4f at offset %s;", region_id, score, offset)
+        return results
+
+
+    def _feed_offset(self, region_coor: Tuple[int, int, int, int], offset: Tuple[int, int]) -> None:
+        """
+        Count a match found by the search, and move the region once the same offset is found on consecutive matches.
+
+        Arguments:
+            region_coor (Tuple[int, int, int, int]): current characteristic region coordinates;
+            offset (Tuple[int, int]): (dx, dy) of the match from the configured region.
+        """
+
+        origin = self._origins[region_coor]
+        previous, times = self._pending.get(origin, (None, 0))
+        times = times + 1 if offset == previous else 1
+        self._logger.debug("Region %s found at offset %s (%d time(s));", origin, offset, times)
+        if times < SHIFT_CONFIRM_COUNT:
+            self._pending[origin] = (offset, times)
+            return
+        self._pending.pop(origin, None)
+        shifted = (origin[0] + offset[0], origin[1] + offset[1], origin[2] + offset[0], origin[3] + offset[1])
+        # Another region already lies there.
+        if shifted in self._box_to_ids:
+            return
+        # Later ticks score the shifted region at a single offset.
+        region_ids = self._box_to_ids.pop(region_coor)
+        self._box_to_ids[shifted] = region_ids
+        del self._origins[region_coor]
+        self._origins[shifted] = origin
+        for region_id in region_ids:
+            self.id_to_coordinate[region_id] = shifted
+        self.offsets[origin] = offset
+        self._logger.info("Region %s of %s shifted by %s;", origin, region_ids, offset)
+
+
+    def score(self, screen: Optional[Frame] = None, region_ids: Optional[List[str]] = None, file_names: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Score characteristic regions against templates, without deciding on a match.
+
+        Arguments:
+            screen (Optional[Frame]): frame already captured (covering the regions), None to grab one from the capture backend;
+            region_ids (Optional[List[str]]): IDs of the regions to score, None for all;
+            file_names (Optional[List[str]]): template file names scored on every region, None for the template of each ID only.
+
+        Returns:
+            Dict[str, Dict[str, float]]: mapping from ID to mapping from template file name to confidence, templates of other sizes score -1.
+        """
+
+        region_ids = region_ids if region_ids is not None else list(self.id_to_coordinate)
+        if screen is None:
+            screen = self._grab([self.id_to_coordinate[id] for id in region_ids])
+        results = {}
+        for region_id in region_ids:
+            names = file_names if file_names is not None else [self.id_to_file_name[region_id]]
+            character_image = self._gray_crop(screen, self.id_to_coordinate[region_id])
+            # Reuse the scores if the pixels of the region are unchanged, and the same templates are requested.
+            if self.cache is not None:
+                cache_key = (self.cache.key(self.id_to_coordinate[region_id], character_image), tuple(names))
+                scores = self.cache.get(cache_key)
+                if scores is not None:
+                    results[region_id] = scores
+                    continue
+            if metrics.registry is not None:
+                started = perf_counter()
+            results[region_id] = self.engine.score(character_image, names)
+            if metrics.registry is not None:
+                metrics.registry.since("score", started)
+            if self.cache is not None:
+                self.cache.put(cache_key, results[region_id])
+        return results
+
+
+    def threshold(self, file_name: str) -> float:
+        """
+        Confidence threshold of a template.
+
+        Arguments:
+            file_name (str): template file name.
+
+        Returns:
+            float: the calibrated threshold, or the confidence threshold if not calibrated.
+        """
+
+        return self.thresholds.get(file_name, self.confidence_threshold)
+
+
+    def accepts(self, file_name: str, score: float, margin: Optional[float] = None) -> bool:
+        """
+        Decide whether a classification result is confident.
+
+        Arguments:
+            file_name (str): template file name classified;
+            score (float): its confidence;
+            margin (Optional[float]): its margin over the second best, None to ignore the margin.
+
+        Returns:
+            bool: whether the confidence, and the margin if calibrated, are above their thresholds.
+        """
+
+        return score > self.threshold(file_name) and (margin is None or margin > self.margins.get(file_name, -numpy.inf))
+
+
+    def classify(
+        self, region_ids: Optional[List[str]] = None, screen: Optional[Frame] = None, file_names: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, float, float]]:
+        """
+        Classify characteristic regions against the loaded templates.
+
+        Each region is scored against every template in one batch of the scoring engine, templates of other sizes score -1.
+
+        Arguments:
+            region_ids (Optional[List[str]]): IDs of the regions to classify, None for all;
+            screen (Optional[Frame]): frame already captured (covering the regions), None to grab one from the capture backend;
+            file_names (Optional[List[str]]): template file names to classify against, None for all the loaded templates.
+
+        Returns:
+            Dict[str, Tuple[str, float, float]]: mapping from ID to (best template file name, its confidence, margin over the second best).
+        """
+
+        results = {}
+        file_names = file_names if file_names is not None else list(self._file_name_to_template)
+        for region_id, scores in self.score(screen, region_ids, file_names).items():
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            best = ranked[0]
+            margin = scores[best] - (scores[ranked[1]] if len(ranked) > 1 else -1.)
+            results[region_id] = (best, scores[best], margin)
+            self._logger.debug("Region [%s] classified as [%s] with confidence level: %.4f, margin: %.4f;", region_id, best, scores[best], margin)
+        return results
+
+
+    def _signature(self, screen: Frame, regions: List[Tuple[int, int, int, int]]) -> numpy.ndarray:
+        # Cheap downsampled grayscale signature of the regions.
+        return numpy.concatenate([
+            screen.gray_crop(region)[::SIGNATURE_STEP, ::SIGNATURE_STEP].ravel() for region in regions
+        ]).astype(numpy.int16)
+
+
+    def wait_until_stable(self, region: Optional[Tuple[int, int, int, int]] = None, timeout: float = 0, changed: bool = False) -> bool:
+        """
+        Wait until the animation in a region settles.
+
+        Poll a downsampled signature of the region at high frequency, and return as soon as it stays unchanged for several polls.
+        The timeout is an upper bound instead of a fixed cost.
+
+        Arguments:
+            region (Optional[Tuple[int, int, int, int]]): region to watch, None to watch all the characteristic regions;
+            timeout (float): maximum time to wait, in seconds;
+            changed (bool): whether the region must change before settling, used when the animation has not started yet.
+
+        Returns:
+            bool: True if the region settled, False if timeout.
+        """
+
+        regions = [region] if region is not None else self.boxes
+        started = self.clock.time()
+        deadline = started + timeout
+        previous = self._signature(self._grab(regions), regions)
+        initial = previous
+        is_started = not changed
+        stable_count = 0
+        while self.clock.time() < deadline:
+            self.clock.sleep(POLL_INTERVAL_TIME)
+            current = self._signature(self._grab(regions), regions)
+            # Wait for the animation starting.
+            if not is_started:
+                is_started = numpy.abs(current - initial).mean() > STABLE_TOLERANCE
+                previous = current
+                continue
+            # Count the consecutive polls without change.
+            if numpy.abs(current - previous).mean() <= STABLE_TOLERANCE:
+                stable_count += 1
+                if stable_count >= STABLE_FRAMES:
+                    if metrics.registry is not None:
+                        metrics.registry.observe("stable_wait", self.clock.time() - started)
+                    return True
+            else:
+                stable_count = 0
+            previous = current
+        self._logger.debug("Region %s not stable after %ss;", region, timeout)
+        if metrics.registry is not None:
+            metrics.registry.observe("stable_wait", self.clock.time() - started)
+        return False
+
+
+    def wait_for_interface(self, ids: Optional[List[str]] = None, timeout: float = 0) -> str:
+        """
+        Wait until one of the expected interfaces appears.
+
+        Poll at high frequency, and return as soon as an expected ID is matched on several consecutive polls.
+        The timeout is an upper bound instead of a fixed cost.
+
+        Arguments:
+            ids (Optional[List[str]]): expected IDs, None to accept any ID;
+            timeout (float): maximum time to wait, in seconds.
+
+        Returns:
+            str: the matched expected ID, or "unmatched" if timeout.
+        """
+
+        started = self.clock.time()
+        deadline = started + timeout
+        previous_id = None
+        stable_count = 0
+        while self.clock.time() < deadline:
+            self.clock.sleep(POLL_INTERVAL_TIME)
+            current_id = self.match()
+            if current_id != "unmatched" and (ids is None or current_id in ids):
+                stable_count = stable_count + 1 if current_id == previous_id else 1
+                if stable_count >= STABLE_FRAMES:
+                    if metrics.registry is not None:
+                        metrics.registry.observe("interface_wait", self.clock.time() - started)
+                    return current_id
+            else:
+                stable_count = 0
+            previous_id = current_id
+        if metrics.registry is not None:
+            metrics.registry.observe("interface_wait", self.clock.time() - started)
+        return "unmatched"
@@ -0,0 +1,169 @@
+# mypackage/runtime.py
+"""
+Defines Runner class.
+"""
+
+from typing import List, Optional
+from time import perf_counter
+import logging
+
+from mypackage import metrics
+from mypackage.recognize import Recognizer
+from mypackage.operate import Operator
+from mypackage.transition import TransitionModel
+from mypackage.session import SessionRecorder
+from mypackage.watchdog import Watchdog
+from mypackage.flight import FlightRecorder
+from mypackage.config import MONITOR_INTERVAL_TIME
+from mypackage.exceptions import MaxAttemptCountExceededError
+
+
+class Runner:
+    """
+    Runner, encapsulate the monitoring loop.
+
+    Repeat the following process: Take the screenshot -> Match the interface -> Perform the operation -> Wait for the next interface.
+
+    Arguments:
+        interface_matcher (Recognizer): recognizer of the interfaces;
+        operator (Operator): operator performing the actions;
+        transitions (TransitionModel): transition table, to wait for the expected next interfaces;
+        max_attempt_count (int): maximum times of attempting;
+        recorder (Optional[SessionRecorder]): records the recognized interfaces, None if not recording;
+        watchdog (Optional[Watchdog]): recovers the loop from stalls, None to disable;
+        flight (Optional[FlightRecorder]): keeps the last ticks, None to disable.
+
+    Attributes:
+        attempts (int): times of attempts started;
+        tick_latencies (List[float]): processing time of each tick (match and operate), in seconds;
+        started (Optional[float]): time the run started, on the clock of the operator, None before running;
+        _logger (logging.Logger): log.
+    """
+
+    def __init__(
+        self,
+        interface_matcher: Recognizer,
+        operator: Operator,
+        transitions: TransitionModel,
+        max_attempt_count: int,
+        recorder: Optional[SessionRecorder] = None,
+        watchdog: Optional[Watchdog] = None,
+        flight: Optional[FlightRecorder] = None,
+    ) -> None:
+
+        # Configuration parameters.
+        self.interface_matcher = interface_matcher
+        self.operator = operator
+        self.transitions = transitions
+        self.max_attempt_count = max_attempt_count
+        self.recorder = recorder
+        self.watchdog = watchdog
+        self.flight = flight
+
+        # State variables.
+        self.attempts = 0
+        self.tick_latencies: List[float] = []
+        self.started: Optional[float] = None
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+
+    def tick(self) -> str:
+        """
+        Match the current interface and operate according to it.
+
+        Returns:
+            str: the matched interface ID, or "unmatched".
+        """
+
+        start = perf_counter()
+        # Match and update current interface.
+        current_interface_id = self.interface_matcher.match()
+        if self.recorder is not None:
+            self.recorder.record_interface(current_interface_id)
+        if self.flight is not None:
+            self.flight.record(self.interface_matcher.last_frame, self.interface_matcher.last_scores, current_interface_id)
+        if metrics.registry is not None:
+            metrics.registry.count("match")
+            if current_interface_id != "unmatched":
+                metrics.registry.interface = current_interface_id
+            else:
+                metrics.registry.count("unmatched")
+        if current_interface_id == "unmatched":
+            self._logger.info("Undefined interface;")
+        else:
+            # Each time entering the start game interface, the counter plus one.
+            if current_interface_id == "start_game":
+                self.attempts += 1
+                self._logger.info("Begin to attempt the order number: %d;\n%s", self.attempts, "-" * 100)
+            self._logger.info("Current interface id: [%s];", current_interface_id)
+
+        # Operate according to the current interface.
+        try:
+            self.operator.operate(current_interface_id)
+        finally:
+            if self.flight is not None:
+                self.flight.record_action(self.operator.last_action)
+            self.tick_latencies.append(perf_counter() - start)
+            if metrics.registry is not None:
+                metrics.registry.observe("tick", self.tick_latencies[-1])
+                metrics.registry.maybe_export()
+        # Recover if the loop stalls on this interface, or on unrecognized screens.
+        if self.watchdog is not None:
+            self.watchdog.observe(current_interface_id)
+        return current_interface_id
+
+
+    def wait(self, current_interface_id: str) -> None:
+        """
+        Wait for the next interface, at most the monitor interval, or the calibrated latency of the action performed.
+
+        Arguments:
+            current_interface_id (str): the interface ID matched in this tick.
+        """
+
+        if current_interface_id == "unmatched":
+            self.interface_matcher.wait_for_interface(timeout = MONITOR_INTERVAL_TIME)
+            return
+
+        profile, action = self.operator.latency_profile, self.operator.last_action
+        if profile is None:
+            self.interface_matcher.wait_for_interface(self.transitions.successors(current_interface_id), MONITOR_INTERVAL_TIME)
+            return
+        # Measure how long the game takes to show the next interface, back off if it does not within the calibrated wait.
+        clock = self.interface_matcher.clock
+        started = clock.time()
+        next_id = self.interface_matcher.wait_for_interface(
+            self.transitions.successors(current_interface_id), profile.delay(current_interface_id, action, MONITOR_INTERVAL_TIME)
+        )
+        if next_id == "unmatched":
+            profile.fail(current_interface_id, action)
+        else:
+            profile.observe(current_interface_id, action, clock.time() - started)
+
+
+    def attempts_per_hour(self) -> float:
+        """
+        Rate of attempts since the run started, on the clock of the operator (simulated time in replays).
+
+        Returns:
+            float: attempts per hour, 0 before running.
+        """
+
+        if self.started is None:
+            return 0.
+        elapsed = self.operator.clock.time() - self.started
+        return self.attempts * 3600 / elapsed if elapsed > 0 else 0.
+
+
+    def run(self) -> None:
+        """
+        Continuous monitoring, until the target is achieved (TargetAchievedError) or the attempts exceed the maximum count.
+        """
+
+        self._logger.info("Begins monitoring, press Ctrl+C to interrupt;\n\n")
+        self.started = self.operator.clock.time()
+        while self.attempts <= self.max_attempt_count:
+            self.wait(self.tick())
+        raise MaxAttemptCountExceededError(self.max_attempt_count)
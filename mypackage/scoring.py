@@ -0,0 +1,287 @@
+# mypackage/scoring.py
+"""
+Defines scoring engines.
+
+A scoring engine holds the template image data and scores a characteristic image against templates of the same size:
+* CvEngine, one cv2.matchTemplate (TM_CCOEFF_NORMED) call per template;
+* NccEngine, precomputed normalized template vectors, all same-shape templates scored in one matrix product;
+* CascadeEngine, cheap rejection on downsampled images before the full-resolution score.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy
+import cv2
+
+from mypackage.config import CASCADE_COARSE_THRESHOLD, CASCADE_FACTOR, CASCADE_FLAT_STD, CASCADE_FULL_ENGINE
+
+
+class ScoringEngine:
+    """
+    Base class of scoring engines.
+
+    Confidence is the normalized correlation coefficient between image and template, in [-1, 1]. -1 is also returned when their sizes are different.
+    """
+
+    def add(self, name: str, template: numpy.ndarray, stats: Optional[Tuple[float, float]] = None) -> None:
+        """
+        Register a grayscale template.
+
+        Arguments:
+            name (str): template file name;
+            template (numpy.ndarray): grayscale template image data;
+            stats (Optional[Tuple[float, float]]): precomputed (mean, norm of the zero-mean template), computed if None.
+        """
+
+        raise NotImplementedError
+
+
+    def score(self, image: numpy.ndarray, names: List[str]) -> Dict[str, float]:
+        """
+        Score a grayscale characteristic image against templates.
+
+        Arguments:
+            image (numpy.ndarray): grayscale characteristic image data;
+            names (List[str]): template file names to score against.
+
+        Returns:
+            Dict[str, float]: mapping from template file name to confidence.
+        """
+
+        raise NotImplementedError
+
+
+class CvEngine(ScoringEngine):
+    """
+    Score with cv2.matchTemplate, one call per template.
+
+    Attributes:
+        _templates (Dict[str, numpy.ndarray]): mapping from template file name to template image data;
+        _results (Dict[str, numpy.ndarray]): mapping from template file name to the preallocated 1×1 result of cv2.matchTemplate.
+    """
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, numpy.ndarray] = {}
+        self._results: Dict[str, numpy.ndarray] = {}
+
+
+    def add(self, name: str, template: numpy.ndarray, stats: Optional[Tuple[float, float]] = None) -> None:
+        self._templates[name] = template
+        self._results[name] = numpy.empty((1, 1), numpy.float32)
+
+
+    def score(self, image: numpy.ndarray, names: List[str]) -> Dict[str, float]:
+        scores = {}
+        for name in names:
+            template = self._templates[name]
+            if image.shape != template.shape:
+                scores[name] = -1.
+            else:
+                scores[name] = float(cv2.matchTemplate(image = image, templ = template, method = cv2.TM_CCOEFF_NORMED, result = self._results[name])[0][0])
+        return scores
+
+
+class NccEngine(ScoringEngine):
+    """
+    Score with precomputed normalized vectors, batched by template shape.
+
+    Since the characteristic image has exactly the template size, TM_CCOEFF_NORMED reduces to the dot product of
+    the zero-mean, unit-norm image vector with the zero-mean, unit-norm template vector.
+    Templates of the same shape are stacked into one contiguous matrix, and scored by a single matrix-vector product.
+    The image vector and the product are written into buffers preallocated per shape, the image norm is divided out of the product.
+
+    Attributes:
+        _name_to_slot (Dict[str, Tuple[Tuple[int, int], int]]): mapping from template file name to (shape, row in the matrix);
+        _shape_to_rows (Dict[Tuple[int, int], List[numpy.ndarray]]): normalized template vectors of each shape, before stacking;
+        _shape_to_matrix (Dict[Tuple[int, int], numpy.ndarray]): stacked matrix of each shape, built on first use;
+        _shape_to_buffers (Dict[Tuple[int, int], Tuple[numpy.ndarray, numpy.ndarray]]): (image vector, product) buffers of each shape.
+    """
+
+    def __init__(self) -> None:
+        self._name_to_slot: Dict[str, Tuple[Tuple[int, int], int]] = {}
+        self._shape_to_rows: Dict[Tuple[int, int], List[numpy.ndarray]] = {}
+        self._shape_to_matrix: Dict[Tuple[int, int], numpy.ndarray] = {}
+        self._shape_to_buffers: Dict[Tuple[int, int], Tuple[numpy.ndarray, numpy.ndarray]] = {}
+
+
+    @staticmethod
+    def normalize(image: numpy.ndarray, stats: Optional[Tuple[float, float]] = None) -> numpy.ndarray:
+        """
+        Flatten image data into a zero-mean, unit-norm float32 vector.
+
+        Arguments:
+            image (numpy.ndarray): grayscale image data;
+            stats (Optional[Tuple[float, float]]): precomputed (mean, norm of the zero-mean image), computed if None.
+
+        Returns:
+            numpy.ndarray: normalized vector, all zeros when the image is flat.
+        """
+
+        vector = image.reshape(-1).astype(numpy.float32)
+        if stats is None:
+            vector -= vector.mean()
+            norm = numpy.linalg.norm(vector)
+        else:
+            vector -= stats[0]
+            norm = stats[1]
+        return vector / norm if norm > 0 else vector
+
+
+    def add(self, name: str, template: numpy.ndarray, stats: Optional[Tuple[float, float]] = None) -> None:
+        rows = self._shape_to_rows.setdefault(template.shape, [])
+        self._name_to_slot[name] = (template.shape, len(rows))
+        rows.append(self.normalize(template, stats))
+        # The matrix and buffers of this shape are rebuilt on the next scoring.
+        self._shape_to_matrix.pop(template.shape, None)
+        self._shape_to_buffers.pop(template.shape, None)
+
+
+    def _matrix(self, shape: Tuple[int, int]) -> numpy.ndarray:
+        if shape not in self._shape_to_matrix:
+            self._shape_to_matrix[shape] = numpy.ascontiguousarray(numpy.stack(self._shape_to_rows[shape]))
+            self._shape_to_buffers[shape] = (numpy.empty(shape, numpy.float32), numpy.empty(len(self._shape_to_rows[shape]), numpy.float32))
+        return self._shape_to_matrix[shape]
+
+
+    def score(self, image: numpy.ndarray, names: List[str]) -> Dict[str, float]:
+        rows = self._shape_to_rows.get(image.shape)
+        if rows is not None:
+            matrix = self._matrix(image.shape)
+            buffer, product = self._shape_to_buffers[image.shape]
+            # Zero-mean image vector, in place.
+            numpy.copyto(buffer, image)
+            buffer -= buffer.mean()
+            vector = buffer.reshape(-1)
+            norm = float(numpy.sqrt(vector @ vector))
+            norm = norm if norm > 0 else 1.
+            # All same-shape templates are scored together, and then the requested ones are picked out,
+            # unless only a few of them are requested (cascade survivors).
+            if 4 * len(names) < len(rows):
+                correlations = {row: float(rows[row] @ vector) / norm for shape, row in map(self._name_to_slot.get, names) if shape == image.shape}
+            else:
+                correlations = numpy.dot(matrix, vector, out=product)
+                correlations /= norm
+        scores = {}
+        for name in names:
+            shape, row = self._name_to_slot[name]
+            scores[name] = float(correlations[row]) if shape == image.shape else -1.
+        return scores
+
+
+class CascadeEngine(ScoringEngine):
+    """
+    Coarse-to-fine cascade in front of a full-resolution engine.
+
+    Stage 1 rejects clear non-matches cheaply, on the image downsampled by `factor` (area averaging):
+    * a flat image (standard deviation under `flat_std`, e.g. a black loading screen) matches no template, all are rejected with confidence 0;
+    * the downsampled image is scored against the downsampled templates, those under `coarse_threshold` are rejected with their coarse confidence.
+    Only the surviving templates are scored at full resolution (stage 2).
+    Tune `coarse_threshold` on recorded frames with `python -m mypackage.bench cascade`, so that no match is rejected.
+
+    Arguments:
+        full (str): engine of stage 2, "cv2" or "ncc";
+        factor (int): downsampling factor of stage 1;
+        coarse_threshold (float): minimum coarse confidence to survive stage 1;
+        flat_std (float): standard deviation (gray levels) under which the image is flat.
+
+    Attributes:
+        stats (Dict[str, int]): template scorings requested ("candidates"), rejected as flat ("flat"), rejected by the coarse confidence ("coarse"),
+            and scored at full resolution ("full");
+        _full (ScoringEngine): engine of stage 2;
+        _coarse (NccEngine): engine of stage 1, holding the downsampled templates;
+        _shapes (Dict[str, Tuple[int, int]]): mapping from template file name to its full-resolution shape.
+    """
+
+    def __init__(
+        self,
+        full: str = CASCADE_FULL_ENGINE,
+        factor: int = CASCADE_FACTOR,
+        coarse_threshold: float = CASCADE_COARSE_THRESHOLD,
+        flat_std: float = CASCADE_FLAT_STD
+    ) -> None:
+
+        # Configuration parameters.
+        self.factor = factor
+        self.coarse_threshold = coarse_threshold
+        self.flat_std = flat_std
+
+        # State variables.
+        self.stats: Dict[str, int] = {"candidates": 0, "flat": 0, "coarse": 0, "full": 0}
+        self._full = create_engine(full)
+        self._coarse = NccEngine()
+        self._shapes: Dict[str, Tuple[int, int]] = {}
+
+
+    def _downsample(self, image: numpy.ndarray) -> numpy.ndarray:
+        height, width = image.shape[:2]
+        return cv2.resize(image, (max(width // self.factor, 1), max(height // self.factor, 1)), interpolation=cv2.INTER_AREA)
+
+
+    def add(self, name: str, template: numpy.ndarray, stats: Optional[Tuple[float, float]] = None) -> None:
+        self._shapes[name] = template.shape
+        self._full.add(name, template, stats)
+        self._coarse.add(name, self._downsample(template))
+
+
+    def coarse(self, image: numpy.ndarray, names: List[str]) -> Dict[str, float]:
+        """
+        Score the downsampled image against the downsampled templates (stage 1 only).
+
+        Arguments:
+            image (numpy.ndarray): grayscale characteristic image data, at full resolution;
+            names (List[str]): template file names to score against.
+
+        Returns:
+            Dict[str, float]: mapping from template file name to coarse confidence, -1 for templates of another size.
+        """
+
+        matching = [name for name in names if self._shapes[name] == image.shape]
+        scores = self._coarse.score(self._downsample(image), matching) if matching else {}
+        return {name: scores.get(name, -1.) for name in names}
+
+
+    def score(self, image: numpy.ndarray, names: List[str]) -> Dict[str, float]:
+        self.stats["candidates"] += len(names)
+        scores = {name: -1. for name in names if self._shapes[name] != image.shape}
+        candidates = [name for name in names if name not in scores]
+        if not candidates:
+            return scores
+
+        small = self._downsample(image)
+        # Flat image, nothing to correlate with.
+        if small.std() < self.flat_std:
+            self.stats["flat"] += len(candidates)
+            scores.update({name: 0. for name in candidates})
+            return scores
+        # Coarse rejection.
+        coarse = self._coarse.score(small, candidates)
+        survivors = [name for name in candidates if coarse[name] >= self.coarse_threshold]
+        self.stats["coarse"] += len(candidates) - len(survivors)
+        scores.update({name: coarse[name] for name in candidates if name not in survivors})
+        # Full-resolution score of the survivors.
+        if survivors:
+            self.stats["full"] += len(survivors)
+            scores.update(self._full.score(image, survivors))
+        return scores
+
+
+ENGINES = {
+    "cv2": CvEngine,
+    "ncc": NccEngine,
+    "cascade": CascadeEngine,
+}
+
+
+def create_engine(name: str) -> ScoringEngine:
+    """
+    Create a scoring engine by name.
+
+    Arguments:
+        name (str): "cv2", "ncc" or "cascade".
+
+    Returns:
+        ScoringEngine: the scoring engine.
+    """
+
+    if name not in ENGINES:
+        raise ValueError(f"Unknown scoring engine '{name}', expected one of {tuple(ENGINES)}.")
+    return ENGINES[name]()
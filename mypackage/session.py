@@ -0,0 +1,296 @@
+# mypackage/session.py
+"""
+Session recording and replay.
+
+A session is a directory:
+* session.json, metadata (format version, capture size, whether only the regions are stored, number of chunks);
+* chunk_NNNNN.npz, compressed chunks of events, each holding the events as JSON and the image data stacked per screen rectangle.
+
+Events are captured frames (grabs), recognized interface IDs and Operator actions, each with its timestamp.
+SessionCapture replays the frames against a (virtual) clock, so that Recognizer and Operator run on a recording as on the live game.
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+from time import time
+import json
+import os
+import numpy
+
+from mypackage.capture import Box, CaptureBackend, Frame
+from mypackage.clock import Clock, VirtualClock
+from mypackage.inputs import InputBackend
+from mypackage.exceptions import CaptureExhaustedError
+
+
+SESSION_VERSION: int = 1
+SESSION_META: str = "session.json"
+
+
+def _chunk_path(path: str, index: int) -> str:
+    return os.path.join(path, f"chunk_{index:05d}.npz")
+
+
+def _image_key(box: Box) -> str:
+    return "img_" + "_".join(str(value) for value in box)
+
+
+def load_chunk_frames(path: str, index: int) -> List[Frame]:
+    """
+    Load the recorded frames of one chunk of a session.
+
+    Arguments:
+        path (str): session directory;
+        index (int): index of the chunk.
+
+    Returns:
+        List[Frame]: the frames of the chunk, in time order.
+    """
+
+    with numpy.load(_chunk_path(path, index)) as chunk:
+        images = {key: chunk[key] for key in chunk.files if key != "events"}
+        events = json.loads(str(chunk["events"]))
+    return [
+        Frame([(tuple(box), images[_image_key(box)][position]) for box, position in event["patches"]], event["t"])
+        for event in events if event["type"] == "grab"
+    ]
+
+
+class SessionRecorder:
+    """
+    Record captured frames, recognized interfaces and actions into a session directory.
+
+    Arguments:
+        path (str): session directory, created if missing;
+        size (Tuple[int, int]): capture size (width, height);
+        chunk_size (int): number of grabs per chunk;
+        regions_only (bool): whether to store only the requested regions instead of the whole captured patches.
+
+    Attributes:
+        _events (List[dict]): events of the current chunk;
+        _images (Dict[str, List[numpy.ndarray]]): image data of the current chunk, per screen rectangle;
+        _grab_count (int): number of grabs in the current chunk;
+        _chunk_count (int): number of chunks written.
+    """
+
+    def __init__(self, path: str, size: Tuple[int, int], chunk_size: int = 256, regions_only: bool = True) -> None:
+
+        # Configuration parameters.
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.regions_only = regions_only
+
+        # State variables.
+        self._events: List[dict] = []
+        self._images: Dict[str, List[numpy.ndarray]] = {}
+        self._grab_count = 0
+        self._chunk_count = 0
+
+        os.makedirs(path, exist_ok=True)
+
+
+    def record_grab(self, boxes: List[Box], frame: Frame) -> None:
+        """
+        Record a captured frame.
+
+        Arguments:
+            boxes (List[Box]): screen rectangles requested from the capture backend;
+            frame (Frame): the captured frame.
+        """
+
+        if self.regions_only:
+            patches = [(box, frame.crop(box)) for box in dict.fromkeys(boxes)]
+        else:
+            patches = frame.patches
+        stored = []
+        for box, image in patches:
+            images = self._images.setdefault(_image_key(box), [])
+            stored.append([list(box), len(images)])
+            images.append(numpy.array(image))
+        self._events.append({"t": frame.timestamp, "type": "grab", "patches": stored})
+        self._grab_count += 1
+        if self._grab_count >= self.chunk_size:
+            self.flush()
+
+
+    def record_interface(self, interface_id: str, timestamp: Optional[float] = None) -> None:
+        """
+        Record a recognized interface ID.
+
+        Arguments:
+            interface_id (str): the interface ID, or "unmatched";
+            timestamp (Optional[float]): time of the recognition, now if None.
+        """
+
+        self._events.append({"t": time() if timestamp is None else timestamp, "type": "interface", "id": interface_id})
+
+
+    def record_action(self, kind: str, arguments: Tuple[int, ...], timestamp: Optional[float] = None) -> None:
+        """
+        Record an Operator action.
+
+        Arguments:
+            kind (str): "click" or "press";
+            arguments (Tuple[int, ...]): position of the click, or key code of the press;
+            timestamp (Optional[float]): time of the action, now if None.
+        """
+
+        self._events.append({"t": time() if timestamp is None else timestamp, "type": kind, "args": list(arguments)})
+
+
+    def flush(self) -> None:
+        """
+        Write the current chunk and the metadata.
+        """
+
+        if self._events:
+            images = {key: numpy.stack(stack) for key, stack in self._images.items()}
+            numpy.savez_compressed(_chunk_path(self.path, self._chunk_count), events=numpy.array(json.dumps(self._events)), **images)
+            self._chunk_count += 1
+            self._events, self._images, self._grab_count = [], {}, 0
+        with open(os.path.join(self.path, SESSION_META), "w", encoding="utf-8") as file:
+            json.dump({"version": SESSION_VERSION, "size": list(self.size), "regions_only": self.regions_only, "chunks": self._chunk_count}, file)
+
+
+    def close(self) -> None:
+        """
+        Write the remaining events, ending the recording.
+        """
+
+        self.flush()
+
+
+class RecordingCapture(CaptureBackend):
+    """
+    Capture backend wrapper recording every grab.
+
+    Arguments:
+        capture (CaptureBackend): the wrapped capture backend;
+        recorder (SessionRecorder): the session recorder.
+    """
+
+    def __init__(self, capture: CaptureBackend, recorder: SessionRecorder) -> None:
+        self.capture = capture
+        self.recorder = recorder
+
+
+    def size(self) -> Tuple[int, int]:
+        return self.capture.size()
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        frame = self.capture.grab(boxes)
+        self.recorder.record_grab(boxes, frame)
+        return frame
+
+
+class RecordingInput(InputBackend):
+    """
+    Input backend wrapper recording every action.
+
+    Arguments:
+        input_backend (InputBackend): the wrapped input backend;
+        recorder (SessionRecorder): the session recorder.
+    """
+
+    def __init__(self, input_backend: InputBackend, recorder: SessionRecorder) -> None:
+        super().__init__(input_backend.clock)
+        self.input_backend = input_backend
+        self.recorder = recorder
+
+
+    def click(self, x: int, y: int, hold: float) -> None:
+        self.recorder.record_action("click", (x, y))
+        self.input_backend.click(x, y, hold)
+
+
+    def press(self, key: int, hold: float) -> None:
+        self.recorder.record_action("press", (key,))
+        self.input_backend.press(key, hold)
+
+
+class SessionCapture(CaptureBackend):
+    """
+    Replay the frames of a recorded session against a clock.
+
+    Each grab returns the latest recorded frame, at the current time of the clock, that covers the requested rectangles,
+    or else the first one after it; ValueError is raised if no recorded frame covers them.
+    The clock is moved to the start of the session on creation; CaptureExhaustedError is raised once it passes the end.
+
+    Arguments:
+        path (str): session directory;
+        clock (Clock): clock the replay follows, usually a VirtualClock.
+
+    Attributes:
+        meta (dict): session metadata;
+        events (List[dict]): all events of the session, each tagged with its chunk index;
+        _grabs (List[dict]): grab events, in time order;
+        _timestamps (List[float]): timestamps of the grab events;
+        _chunk (Tuple[int, Dict[str, numpy.ndarray]]): the loaded chunk, as (index, image data).
+    """
+
+    def __init__(self, path: str, clock: Clock) -> None:
+        self.path = path
+        self.clock = clock
+
+        meta_path = os.path.join(path, SESSION_META)
+        if not os.path.isfile(meta_path):
+            raise CaptureExhaustedError(path)
+        with open(meta_path, "r", encoding="utf-8") as file:
+            self.meta = json.load(file)
+
+        # Index the events of all chunks, image data are loaded on demand.
+        self.events: List[dict] = []
+        for index in range(self.meta["chunks"]):
+            with numpy.load(_chunk_path(path, index)) as chunk:
+                for event in json.loads(str(chunk["events"])):
+                    event["chunk"] = index
+                    self.events.append(event)
+        self._grabs = [event for event in self.events if event["type"] == "grab"]
+        self._timestamps = [event["t"] for event in self._grabs]
+        self._chunk: Tuple[int, Dict[str, numpy.ndarray]] = (-1, {})
+        if not self._grabs:
+            raise CaptureExhaustedError(path)
+
+        # Start the virtual clock at the beginning of the session.
+        if isinstance(clock, VirtualClock):
+            clock.now = self._timestamps[0]
+
+
+    def size(self) -> Tuple[int, int]:
+        return tuple(self.meta["size"])
+
+
+    def _images(self, chunk_index: int) -> Dict[str, numpy.ndarray]:
+        if self._chunk[0] != chunk_index:
+            with numpy.load(_chunk_path(self.path, chunk_index)) as chunk:
+                self._chunk = (chunk_index, {key: chunk[key] for key in chunk.files if key != "events"})
+        return self._chunk[1]
+
+
+    @staticmethod
+    def _covers(event: dict, boxes: List[Box]) -> bool:
+        return all(
+            any(left <= box[0] and top <= box[1] and box[2] <= right and box[3] <= bottom for (left, top, right, bottom), _ in event["patches"])
+            for box in boxes
+        )
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        now = self.clock.time()
+        if now > self._timestamps[-1]:
+            raise CaptureExhaustedError(self.path)
+
+        # Latest grab at the current time covering the rectangles, or else the first one after it.
+        current = max(bisect_right(self._timestamps, now) - 1, 0)
+        index = next((index for index in range(current, -1, -1) if self._covers(self._grabs[index], boxes)), None)
+        if index is None:
+            index = next((index for index in range(current + 1, len(self._grabs)) if self._covers(self._grabs[index], boxes)), None)
+        if index is None:
+            raise ValueError(f"No recorded frame of session '{self.path}' covers the regions {boxes}.")
+        event = self._grabs[index]
+        images = self._images(event["chunk"])
+        patches = [(tuple(box), images[_image_key(box)][position]) for box, position in event["patches"]]
+        return Frame(patches, event["t"])
+
@@ -0,0 +1,286 @@
+# mypackage/simulate.py
+"""
+Defines GameSimulator class.
+
+A headless stand-in for the game, to exercise the monitoring loop without it: the simulator is both the capture backend of
+the recognizers and the input backend of Operator. Frames are composited at the reference resolution from the interface
+templates and random option templates, at the configured regions, and the simulated game follows the interface flow:
+start → conv → calculus → boon (with one roll) → equation → confirm → oddity / blessing / curio → in game → exit → (hint) → restart.
+Transitions take a random latency, showing a black loading screen, and the boon options slide in while animating.
+Optionally, an unexpected popup (a flat gray screen no template matches) covers the interface shown after a transition, until ESC is pressed,
+and the abort key is dropped on the selection interfaces (e.g. while the game is busy), so that the menu does not open.
+All times are on the clock given, a VirtualClock runs the loop faster than real time.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import os
+import random
+import numpy
+import cv2
+
+from mypackage.capture import Box, CaptureBackend, Frame
+from mypackage.inputs import InputBackend
+from mypackage.clock import Clock
+from mypackage.config import (
+    INTERFACE_TEMPL_DIR, INTERFACE_REGIONS, INTERFACE_FLOW, OPTION_TEMPL_DIR, OPTION_REGIONS,
+    REFERENCE_RESOLUTION, ROLL, CONFIRM, ABORT_KEY,
+)
+
+
+LOADING_TIME: Tuple[float, float] = (0.3, 1.2)   # Range of the latency of a transition, in seconds;
+ANIMATION_TIME: float = 1.0     # Duration of the boon options sliding in, on entering their interface and after rolling;
+SLIDE_DISTANCE: int = 600       # Distance (px) the boon options slide in from the right while animating;
+HINT_PROBABILITY: float = 0.2   # Probability of the hint interface after exiting;
+BUTTON_RADIUS: int = 40         # Distance (px) from a button position within which a click hits it;
+CARD_ROWS: Tuple[int, int] = (200, 900)   # Vertical extent of the option cards, a click in the column of a slot selects it;
+HIGHLIGHT: int = 40             # Brightness added to the selected option slot;
+POPUP_GRAY: int = 128           # Gray level of the popup.
+
+# Interfaces left by a click anywhere in their characteristic region, and by the ESC key.
+_CLICK_INTERFACES = ("start_game", "select_conv", "conv_calculus", "run_calculus", "exit", "hint", "restart_game")
+_ESC_INTERFACES = ("confirm_equation", "confirm_blessing", "in_game")
+_SELECTION_INTERFACES = ("select_golden_bloods_boon", "select_equation", "select_oddity", "select_blessing", "select_weighted_curio")
+
+
+class GameSimulator(CaptureBackend, InputBackend):
+    """
+    Simulated game, capture and input backend at once.
+
+    Arguments:
+        clock (Clock): clock of the simulated game, shared with the recognizers and Operator;
+        seed (Optional[int]): seed of the random options and latencies;
+        popup_probability (float): probability of a popup after each transition;
+        abort_drop_probability (float): probability the abort key is dropped on a selection interface.
+
+    Attributes:
+        interface (str): interface shown, "loading" during transitions, "popup" while a popup covers it;
+        popups (int): popups shown;
+        dropped_aborts (int): abort key presses dropped;
+        attempts (int): times the start interface was entered;
+        selected (Dict[str, str]): option confirmed on the boon and equation interfaces of the current attempt;
+        misses (int): clicks and key presses that hit nothing;
+        _rng (random.Random): source of the random options and latencies;
+        _background (numpy.ndarray): RGB texture behind the interfaces;
+        _interface_templates (Dict[str, numpy.ndarray]): mapping from interface ID to RGB template image data;
+        _option_templates (Dict[str, Dict[str, numpy.ndarray]]): mapping from selection interface ID to its options, RGB template image data;
+        _next (Optional[Tuple[str, float]]): interface shown after the loading screen, and when;
+        _entered (float): time the current interface was entered, or its options rolled;
+        _options (List[str]): options of the slots on the boon and equation interfaces;
+        _rolled (bool): whether the boon options were rolled in this attempt;
+        _selection (Optional[int]): index of the selected slot;
+        _visited (List[str]): interfaces met after the equation in this attempt;
+        _covered (Optional[str]): interface under the popup, None if no popup;
+        grabs (int): frames captured;
+        _canvas (numpy.ndarray): rendered frame of the current interface, updated in place;
+        _dirty (List[Box]): rectangles of the canvas drawn over the background;
+        _is_rendered (bool): whether the canvas shows the current state.
+    """
+
+    def __init__(self, clock: Optional[Clock] = None, seed: Optional[int] = None, popup_probability: float = 0., abort_drop_probability: float = 0.) -> None:
+        InputBackend.__init__(self, clock)
+
+        # Configuration parameters.
+        self.popup_probability = popup_probability
+        self.abort_drop_probability = abort_drop_probability
+
+        # State variables.
+        self.interface = "start_game"
+        self.attempts = 1
+        self.selected: Dict[str, str] = {}
+        self.misses = 0
+        self.popups = 0
+        self.dropped_aborts = 0
+        self._rng = random.Random(seed)
+        self._background = numpy.random.default_rng(seed).integers(20, 60, (REFERENCE_RESOLUTION[1], REFERENCE_RESOLUTION[0], 3), numpy.uint8)
+        self._interface_templates = {
+            id: cv2.cvtColor(cv2.imread(os.path.join(INTERFACE_TEMPL_DIR, f"{id}.png"), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+            for id in INTERFACE_REGIONS
+        }
+        # Options of each selection interface are the templates of the size of its slots.
+        self._option_templates: Dict[str, Dict[str, numpy.ndarray]] = {"select_golden_bloods_boon": {}, "select_equation": {}}
+        for file in sorted(os.listdir(OPTION_TEMPL_DIR)):
+            template = cv2.cvtColor(cv2.imread(os.path.join(OPTION_TEMPL_DIR, file), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+            for interface_id, options in self._option_templates.items():
+                left, top, right, bottom = OPTION_REGIONS[f"{interface_id}_1"]
+                if template.shape[:2] == (bottom - top, right - left):
+                    options[os.path.splitext(file)[0]] = template
+        self._next: Optional[Tuple[str, float]] = None
+        self._entered = self.clock.time()
+        self._options: List[str] = []
+        self._rolled = False
+        self._selection: Optional[int] = None
+        self._visited: List[str] = []
+        self._covered: Optional[str] = None
+        self.grabs = 0
+        self._canvas = self._background.copy()
+        self._dirty: List[Box] = []
+        self._is_rendered = False
+
+
+    # ---- Game logic ----
+
+    def _go(self, interface_id: str) -> None:
+        # Leave the current interface, the next one is shown after a loading screen.
+        self._next = (interface_id, self.clock.time() + self._rng.uniform(*LOADING_TIME))
+        self.interface = "loading"
+        self._selection = None
+        self._is_rendered = False
+
+
+    def _update(self) -> None:
+        # Show the next interface once loaded.
+        if self._next is None or self.clock.time() < self._next[1]:
+            return
+        self.interface, self._next = self._next[0], None
+        self._entered = self.clock.time()
+        self._is_rendered = False
+        if self.interface == "start_game":
+            self.attempts += 1
+            self.selected, self._rolled, self._visited = {}, False, []
+        elif self.interface in self._option_templates:
+            self._options = self._rng.sample(sorted(self._option_templates[self.interface]), 3)
+        if self.popup_probability and self._rng.random() < self.popup_probability:
+            self._covered, self.interface = self.interface, "popup"
+            self.popups += 1
+
+
+    def _after_equation(self) -> str:
+        # Next interface of the flow not yet met in this attempt, in game when none is left.
+        successors = [id for id in INTERFACE_FLOW.get(self.interface, []) if id not in self._visited]
+        interface_id = self._rng.choice(successors) if successors else "in_game"
+        self._visited.append(interface_id)
+        return interface_id
+
+
+    def _slot(self, x: int, y: int) -> Optional[int]:
+        # Index of the option card clicked.
+        if not CARD_ROWS[0] <= y <= CARD_ROWS[1]:
+            return None
+        prefix = self.interface if self.interface in self._option_templates else "select_equation"
+        for index in range(3):
+            left, _, right, _ = OPTION_REGIONS[f"{prefix}_{index + 1}"]
+            if left <= x <= right:
+                return index
+        return None
+
+
+    def _is_animating(self) -> bool:
+        # Whether the boon options are sliding in.
+        return self.interface == "select_golden_bloods_boon" and self.clock.time() < self._entered + ANIMATION_TIME
+
+
+    def click(self, x: int, y: int, hold: float) -> None:
+        self.clock.sleep(hold)
+        self._update()
+        interface_id = self.interface
+        near = lambda point: abs(x - point[0]) <= BUTTON_RADIUS and abs(y - point[1]) <= BUTTON_RADIUS
+
+        if interface_id in _CLICK_INTERFACES:
+            left, top, right, bottom = INTERFACE_REGIONS[interface_id]
+            if left <= x <= right and top <= y <= bottom:
+                if interface_id == "exit":
+                    self._go("hint" if self._rng.random() < HINT_PROBABILITY else "restart_game")
+                else:
+                    self._go(INTERFACE_FLOW[interface_id][0] if interface_id != "hint" else "restart_game")
+                return
+
+        elif interface_id in _SELECTION_INTERFACES:
+            # Roll the boon options once.
+            if interface_id == "select_golden_bloods_boon" and not self._rolled and near(ROLL):
+                self._rolled = True
+                self._options = self._rng.sample(sorted(self._option_templates[interface_id]), 3)
+                self._entered, self._selection, self._is_rendered = self.clock.time(), None, False
+                return
+            # Confirm the selected option.
+            if near(CONFIRM[interface_id]) and self._selection is not None:
+                if interface_id in self._option_templates:
+                    self.selected[interface_id] = self._options[self._selection]
+                if interface_id == "select_golden_bloods_boon":
+                    self._go("select_equation")
+                elif interface_id == "select_equation":
+                    self._go("confirm_equation")
+                elif interface_id == "select_blessing":
+                    self._go("confirm_blessing")
+                else:
+                    self._go(self._after_equation())
+                return
+            # Select an option.
+            slot = self._slot(x, y)
+            if slot is not None and not self._is_animating():
+                self._selection, self._is_rendered = slot, False
+                return
+
+        self.misses += 1
+
+
+    def press(self, key: int, hold: float) -> None:
+        self.clock.sleep(hold)
+        self._update()
+        if key == 27 and self.interface == "popup":
+            # Close the popup.
+            self.interface, self._covered = self._covered, None
+            self._entered, self._is_rendered = self.clock.time(), False
+        elif key == 27 and self.interface in _ESC_INTERFACES:
+            self._go("exit" if self.interface == "in_game" else self._after_equation())
+        elif key == ABORT_KEY and self.interface in self._option_templates and self._rng.random() < self.abort_drop_probability:
+            # The key is dropped, the selection interface stays.
+            self.dropped_aborts += 1
+        elif key == ABORT_KEY and self.interface in self._option_templates:
+            # Menu of the selection interfaces, leading out of the attempt.
+            self.selected = {}
+            self._go("exit")
+        else:
+            self.misses += 1
+
+
+    # ---- Capture ----
+
+    def _draw(self, box: Box, image: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        # Draw over a rectangle of the canvas, black if no image, restored to the background on the next rendering.
+        area = self._canvas[box[1]: box[3], box[0]: box[2]]
+        if image is None:
+            area[:] = 0
+        else:
+            area[:] = image
+        self._dirty.append(box)
+        return area
+
+
+    def _render(self) -> None:
+        # Composite the current interface, only the rectangles drawn last time are restored.
+        for left, top, right, bottom in self._dirty:
+            self._canvas[top: bottom, left: right] = self._background[top: bottom, left: right]
+        self._dirty = []
+        if self.interface == "loading":
+            self._draw((0, 0, *REFERENCE_RESOLUTION))
+            return
+        if self.interface == "popup":
+            self._draw((0, 0, *REFERENCE_RESOLUTION))[:] = POPUP_GRAY
+            return
+        self._draw(INTERFACE_REGIONS[self.interface], self._interface_templates[self.interface])
+        if self.interface in self._option_templates:
+            # Boon options slide in from the right while animating.
+            shift = round(SLIDE_DISTANCE * max(1 - (self.clock.time() - self._entered) / ANIMATION_TIME, 0)) if self._is_animating() else 0
+            for index, name in enumerate(self._options):
+                left, top, right, bottom = OPTION_REGIONS[f"{self.interface}_{index + 1}"]
+                width = min(right + shift, REFERENCE_RESOLUTION[0]) - (left + shift)
+                if width <= 0:
+                    continue
+                area = self._draw((left + shift, top, left + shift + width, bottom), self._option_templates[self.interface][name][:, :width])
+                if index == self._selection:
+                    numpy.add(area, numpy.minimum(255 - area, HIGHLIGHT), out=area)
+
+
+    def size(self) -> Tuple[int, int]:
+        return REFERENCE_RESOLUTION
+
+
+    def grab(self, boxes: List[Box]) -> Frame:
+        self._update()
+        if not self._is_rendered or self._is_animating():
+            self._render()
+            # Rendered again once the animation is over.
+            self._is_rendered = not self._is_animating()
+        self.grabs += 1
+        # Only the requested rectangles, copied out of the canvas as a screenshot would be.
+        return Frame([(box, self._canvas[box[1]: box[3], box[0]: box[2]].copy()) for box in dict.fromkeys(boxes)], self.clock.time())
@@ -0,0 +1,116 @@
+# mypackage/transition.py
+"""
+Defines TransitionModel class.
+"""
+
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+
+
+class TransitionModel:
+    """
+    Transition table of interfaces, used to test the most likely next interfaces first.
+
+    The table is seeded from the fixed flow of the game, and optionally learned from observed transitions and persisted between sessions.
+
+    Arguments:
+        seed (Dict[str, List[str]]): mapping from interface ID to the interface IDs expected to follow it;
+        path (str): file the learned table is loaded from and saved to, empty to keep it in memory only.
+
+    Attributes:
+        _counts (Dict[str, Dict[str, int]]): mapping from interface ID to the counts of the interface IDs following it;
+        _logger (logging.Logger): log.
+    """
+
+    def __init__(self, seed: Dict[str, List[str]], path: str = "") -> None:
+
+        # Configuration parameters.
+        self.path = path
+
+        # State variables.
+        self._counts: Dict[str, Dict[str, int]] = {
+            previous_id: {next_id: 1 for next_id in next_ids} for previous_id, next_ids in seed.items()
+        }
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self.load()
+
+
+    def load(self) -> None:
+        """
+        Merge the transition counts saved by previous sessions into the table.
+        """
+
+        if not self.path or not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for previous_id, next_counts in json.load(file).items():
+                counts = self._counts.setdefault(previous_id, {})
+                for next_id, count in next_counts.items():
+                    counts[next_id] = max(counts.get(next_id, 0), count)
+        self._logger.info("Success to load the transition table from '%s';\n", self.path)
+
+
+    def save(self) -> None:
+        """
+        Save the transition counts for later sessions.
+        """
+
+        if not self.path:
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(self._counts, file, indent=4)
+
+
+    def observe(self, previous_id: str, current_id: str) -> None:
+        """
+        Record a transition between two recognized interfaces.
+
+        Arguments:
+            previous_id (str): interface ID recognized before;
+            current_id (str): interface ID recognized now.
+        """
+
+        if previous_id == current_id:
+            return
+        counts = self._counts.setdefault(previous_id, {})
+        counts[current_id] = counts.get(current_id, 0) + 1
+
+
+    def successors(self, previous_id: Optional[str]) -> List[str]:
+        """
+        List the interface IDs observed to follow an interface, most frequent first.
+
+        Arguments:
+            previous_id (Optional[str]): interface ID recognized before.
+
+        Returns:
+            List[str]: the following interface IDs.
+        """
+
+        counts = self._counts.get(previous_id, {})
+        return sorted(counts, key=lambda id: -counts[id])
+
+
+    def candidates(self, previous_id: Optional[str], ids: List[str]) -> List[str]:
+        """
+        Order the interface IDs by how likely they follow the previous one.
+
+        The observed successors come first (most frequent first), then the previous interface itself (the screen often stays), then the others in their original order.
+
+        Arguments:
+            previous_id (Optional[str]): interface ID recognized before, None if nothing recognized yet;
+            ids (List[str]): all interface IDs.
+
+        Returns:
+            List[str]: the ordered interface IDs.
+        """
+
+        likely_ids = [id for id in self.successors(previous_id) if id in ids]
+        if previous_id in ids and previous_id not in likely_ids:
+            likely_ids.append(previous_id)
+        return likely_ids + [id for id in ids if id not in likely_ids]
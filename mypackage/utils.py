@@ -1,10 +1,44 @@
 # mypackage/utils.py
+import atexit
+import json
 import logging
 import logging.config
+import logging.handlers
+import queue
 
-def setup_logger() -> None:
+
+# Logger of the region scores, see Recognizer._score_region.
+SCORE_LOGGER: str = "mypackage.recognize.scores"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler leaving the formatting to the writer thread.
+
+    The record is enqueued as is, the message is only merged with its arguments by the handlers of the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class ScoreEventFormatter(logging.Formatter):
+    """
+    Format the score records as JSON lines: {"t": timestamp, "region": region ID, "score": score}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        region_id, score = record.args
+        return json.dumps({"t": record.created, "region": region_id, "score": round(float(score), 6)})
+
+
+def setup_logger(queued: bool = False, events_file: str = "") -> None:
     """
     Configuration of project logging system.
+
+    Arguments:
+        queued (bool): whether to format and write the log in a background thread, the calling threads only enqueue the records;
+        events_file (str): JSON lines file the region scores are written to instead of the text log, empty to keep them as text.
     """
 
     logging_config = {
@@ -43,5 +77,28 @@ def setup_logger() -> None:
         }
     }
 
+    # Region scores as an event stream, out of the text log.
+    if events_file:
+        logging_config["formatters"]["events"] = {"()": ScoreEventFormatter}
+        logging_config["handlers"]["events"] = {
+            "level": "DEBUG",
+            "class": "logging.FileHandler",
+            "filename": events_file,
+            "formatter": "events",
+            "mode": "w"
+        }
+        logging_config["loggers"][SCORE_LOGGER] = {"handlers": ["events"], "level": "DEBUG", "propagate": False}
+
     # Apply the configuration.
-    logging.config.dictConfig(logging_config)
\ No newline at end of file
+    logging.config.dictConfig(logging_config)
+
+    # Move the handlers of each configured logger behind a queue, drained by a writer thread.
+    if queued:
+        for name in logging_config["loggers"]:
+            logger = logging.getLogger(name)
+            records = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(records, *logger.handlers, respect_handler_level=True)
+            logger.handlers = [DeferredQueueHandler(records)]
+            listener.start()
+            # Drain the queue before the logging module closes the handlers at exit.
+            atexit.register(listener.stop)
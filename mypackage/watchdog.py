@@ -0,0 +1,160 @@
+# mypackage/watchdog.py
+"""
+Defines Watchdog class.
+"""
+
+from typing import Callable, List, Optional
+from time import strftime
+import logging
+import os
+import cv2
+
+from mypackage import metrics
+from mypackage.capture import CaptureBackend
+from mypackage.operate import Operator
+from mypackage.flight import FlightRecorder
+from mypackage.config import STALL_UNMATCHED_TIME, STALL_SAME_TIME, STALL_RECOVERY_ACTIONS, STALL_FRAMES_DIR
+
+
+class Watchdog:
+    """
+    Stall watchdog, recover the loop from unexpected screens (e.g. a popup no template matches).
+
+    The loop stalls when no interface is recognized for `unmatched_timeout`, or the same interface is recognized for `same_timeout`.
+    On each stall, the recovery actions are performed one by one, one more every timeout while the stall lasts (and from the first again after the last),
+    until another interface is recognized. The first frame of each stall is saved.
+
+    Recovery actions:
+    * "esc", press ESC, closing most dialogs;
+    * "click_center", click on the screen centre;
+    * "focus", activate the game window again.
+
+    Arguments:
+        operator (Operator): performs the "esc" and "click_center" actions, its clock times the stalls;
+        capture (CaptureBackend): source of the saved frames;
+        focus (Optional[Callable[[], None]]): activates the game window, None to skip the "focus" action (e.g. replays);
+        unmatched_timeout (float): time without any recognized interface before a stall, in seconds, 0 to disable;
+        same_timeout (float): time on the same interface before a stall, in seconds, 0 to disable;
+        actions (List[str]): recovery actions, in order of escalation;
+        frames_dir (str): directory the frames of the stalls are saved to, empty to disable;
+        flight (Optional[FlightRecorder]): dumped on each stall, None to disable.
+
+    Attributes:
+        stalls (int): stalls met;
+        recoveries (int): recovery actions performed;
+        _last_id (str): interface ID of the last tick, or "unmatched";
+        _last_recognized (float): time an interface was last recognized, or of the last recovery action;
+        _entered (float): time the current interface was entered, or of the last recovery action;
+        _level (int): recovery actions performed in the current stall, 0 if not stalled;
+        _logger (logging.Logger): log.
+    """
+
+    def __init__(
+        self,
+        operator: Operator,
+        capture: CaptureBackend,
+        focus: Optional[Callable[[], None]] = None,
+        unmatched_timeout: float = STALL_UNMATCHED_TIME,
+        same_timeout: float = STALL_SAME_TIME,
+        actions: Optional[List[str]] = None,
+        frames_dir: str = STALL_FRAMES_DIR,
+        flight: Optional[FlightRecorder] = None,
+    ) -> None:
+
+        # Configuration parameters.
+        self.operator = operator
+        self.capture = capture
+        self.focus = focus
+        self.unmatched_timeout = unmatched_timeout
+        self.same_timeout = same_timeout
+        self.actions = actions if actions is not None else STALL_RECOVERY_ACTIONS
+        self.frames_dir = frames_dir
+        self.flight = flight
+        for action in self.actions:
+            if action not in ("esc", "click_center", "focus"):
+                raise ValueError(f"Unknown recovery action '{action}', expected one of ('esc', 'click_center', 'focus').")
+
+        # State variables.
+        self.stalls = 0
+        self.recoveries = 0
+        now = operator.clock.time()
+        self._last_id = "unmatched"
+        self._last_recognized = now
+        self._entered = now
+        self._level = 0
+
+        # Logger.
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+
+    def observe(self, interface_id: str) -> Optional[str]:
+        """
+        Record the interface of a tick, and recover if the loop stalls.
+
+        Arguments:
+            interface_id (str): the interface ID matched in this tick, or "unmatched".
+
+        Returns:
+            Optional[str]: recovery action performed, None if not stalled.
+        """
+
+        now = self.operator.clock.time()
+        if interface_id != "unmatched":
+            self._last_recognized = now
+            # Progress, the stall (if any) is over.
+            if interface_id != self._last_id:
+                if self._level:
+                    self._logger.info("Recovered from the stall on [%s];", interface_id)
+                self._entered, self._level = now, 0
+        self._last_id = interface_id
+
+        if interface_id == "unmatched":
+            stalled = self.unmatched_timeout > 0 and now - self._last_recognized >= self.unmatched_timeout
+        else:
+            stalled = self.same_timeout > 0 and now - self._entered >= self.same_timeout
+        if not stalled or not self.actions:
+            return None
+
+        if self._level == 0:
+            self.stalls += 1
+            self._logger.warning("Stall %d on [%s], since %.1fs;", self.stalls, interface_id, now - min(self._last_recognized, self._entered))
+            self._save_frame(interface_id)
+            if self.flight is not None:
+                self.flight.dump(f"stall_{self.stalls}")
+            if metrics.registry is not None:
+                metrics.registry.count("stall")
+        action = self.actions[self._level % len(self.actions)]
+        self._recover(action)
+        self._level += 1
+        # The next action is performed after another timeout, if the stall lasts.
+        self._last_recognized = self._entered = self.operator.clock.time()
+        return action
+
+
+    def _recover(self, action: str) -> None:
+        self._logger.warning("Recovery action: [%s];", action)
+        if action == "focus":
+            if self.focus is None:
+                self._logger.info("No game window to activate, skip;")
+                return
+            self.focus()
+        else:
+            self.operator.recover(action)
+        self.recoveries += 1
+        if metrics.registry is not None:
+            metrics.registry.count("recovery")
+
+
+    def _save_frame(self, interface_id: str) -> None:
+        # Keep the screen of the stall, to add a template or a recovery for it.
+        if not self.frames_dir:
+            return
+        try:
+            frame = self.capture.grab([(0, 0, *self.capture.size())])
+            os.makedirs(self.frames_dir, exist_ok=True)
+            for index, (_, image) in enumerate(frame.patches):
+                path = os.path.join(self.frames_dir, f"stall_{strftime('%Y%m%d_%H%M%S')}_{self.stalls}_{interface_id}_{index}.png")
+                cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            self._logger.info("Save the frame of the stall to '%s';", self.frames_dir)
+        except Exception as e:
+            self._logger.warning("Fail to save the frame of the stall: %s;", e)
@@ -0,0 +1,88 @@
+# tests/test_goal.py
+"""
+Choice of the options and securing of the ranked combinations by Goal.
+"""
+
+import pytest
+
+from mypackage.goal import Goal, is_wildcard, parse_combination
+
+
+BOON, EQUATION = "select_golden_bloods_boon", "select_equation"
+
+
+def test_ranking_prefers_most_valuable() -> None:
+    # The slot of the most valuable reachable combination wins, whatever its position.
+    goal = Goal([{BOON: "baie", EQUATION: "wandi"}, {BOON: "tibao", EQUATION: "wandi"}])
+    assert goal.choose(BOON, ["tibao", "baie", "unknown"]) == 1
+    assert goal.choose(BOON, ["tibao", "unknown", "unknown"]) == 0
+    assert goal.choose(BOON, ["unknown", "fengjin", "unknown"]) is None
+
+
+def test_ranking_then_most_combinations() -> None:
+    # On a tie of the most valuable combination, the slot keeping more combinations reachable wins.
+    goal = Goal([{EQUATION: "wandi"}, {BOON: "baie", EQUATION: "huangdi"}])
+    assert goal.choose(BOON, ["fengjin", "baie"]) == 1
+    goal.select(BOON, "baie")
+    assert goal.secured() is None
+    # The most valuable combination first, even if it is secured with fewer selections.
+    assert goal.choose(EQUATION, ["huangdi", "wandi"]) == 1
+    goal.select(EQUATION, "wandi")
+    assert goal.secured() == {EQUATION: "wandi"}
+
+
+def test_wildcard_interface() -> None:
+    # A wildcard interface accepts any option, and is not needed to secure the combination.
+    goal = Goal([{BOON: "baie", EQUATION: "*"}])
+    assert goal.names(BOON) == {"baie"}
+    assert goal.names(EQUATION) == set()
+    assert goal.choose(BOON, ["fengjin", "baie"]) == 1
+    goal.select(BOON, "baie")
+    assert goal.secured() == {BOON: "baie", EQUATION: "*"}
+
+
+def test_wildcard_in_list() -> None:
+    # "*" among names accepts any option; a name merely containing "*" is a name.
+    assert is_wildcard("*") and is_wildcard(["baie", "*"])
+    assert not is_wildcard("ba*ie") and not is_wildcard(["baie", "tibao"])
+    goal = Goal([{BOON: "ba*ie", EQUATION: ["wandi", "*"]}])
+    assert goal.names() == {"ba*ie"}
+
+
+def test_any_of_names() -> None:
+    # A list of names accepts any of them.
+    goal = Goal([parse_combination("baie|tibao,wandi", [BOON, EQUATION])])
+    assert goal.names(BOON) == {"baie", "tibao"}
+    assert goal.choose(BOON, ["fengjin", "tibao"]) == 1
+    goal.select(BOON, "tibao")
+    assert goal.secured() is None
+    goal.select(EQUATION, "wandi")
+    assert goal.secured() == {BOON: ["baie", "tibao"], EQUATION: "wandi"}
+
+
+def test_reset() -> None:
+    # The selections are forgotten at the end of an attempt.
+    goal = Goal([{BOON: "baie", EQUATION: "wandi"}])
+    goal.select(BOON, "fengjin")
+    assert goal.choose(EQUATION, ["wandi"]) is None
+    goal.reset()
+    assert goal.selected == {}
+    assert goal.choose(BOON, ["baie"]) == 0
+
+
+def test_reachable_after_default() -> None:
+    # The default option ("unknown") leaves reachable only the combinations not constraining its interface.
+    goal = Goal([{BOON: "baie", EQUATION: "wandi"}, {BOON: "*", EQUATION: "huangdi"}])
+    goal.select(BOON, "unknown")
+    assert goal._reachable(goal.selected) == [1]
+    assert goal.secured() is None
+    assert goal.choose(EQUATION, ["wandi", "huangdi"]) == 1
+    goal.select(EQUATION, "huangdi")
+    assert goal.secured() == {BOON: "*", EQUATION: "huangdi"}
+
+
+@pytest.mark.parametrize("combination", [{BOON: "*", EQUATION: "*"}, {BOON: ["*"]}, {}])
+def test_unconstrained_combination_rejected(combination: dict) -> None:
+    # Accepting any option, it would be secured by the first selection of every attempt.
+    with pytest.raises(ValueError):
+        Goal([{BOON: "baie", EQUATION: "wandi"}, combination])
@@ -0,0 +1,128 @@
+# tests/test_scoring.py
+"""
+Parity of the scoring engines with the cv2 path, on the shipped templates.
+
+The repository ships no recorded frames, so the crops are the templates as the capture sees them:
+scaled in brightness and contrast, with sensor noise, and shifted by a pixel.
+"""
+
+from typing import Dict, List, Tuple
+import os
+import numpy
+import cv2
+import pytest
+
+from mypackage.scoring import CascadeEngine, CvEngine, NccEngine
+from mypackage.config import INTERFACE_TEMPL_DIR, OPTION_TEMPL_DIR, INTERFACE_MATCH_THRESHOLD, OPTION_MATCH_THRESHOLD
+
+
+TOLERANCE: float = 1e-3     # Maximum difference of confidence with cv2.matchTemplate.
+
+
+def _load(templates_dir: str) -> Dict[str, numpy.ndarray]:
+    # Grayscale templates, as Recognizer loads them.
+    return {
+        os.path.splitext(file)[0]: cv2.imread(os.path.join(templates_dir, file), cv2.IMREAD_GRAYSCALE)
+        for file in sorted(os.listdir(templates_dir))
+    }
+
+
+def _crops(template: numpy.ndarray, rng: numpy.random.Generator) -> List[numpy.ndarray]:
+    # The template as captured: exact, brightness and contrast changed with noise, and shifted right by a pixel.
+    noisy = template.astype(numpy.float32) * rng.uniform(0.8, 1.2) + rng.uniform(-20, 20) + rng.normal(0, 4, template.shape)
+    shifted = numpy.concatenate([template[:, :1], template[:, :-1]], axis=1)
+    return [template.copy(), numpy.clip(noisy, 0, 255).astype(numpy.uint8), shifted]
+
+
+def _engines(templates: Dict[str, numpy.ndarray]) -> Tuple[CvEngine, NccEngine]:
+    cv_engine, ncc_engine = CvEngine(), NccEngine()
+    for name, template in templates.items():
+        cv_engine.add(name, template)
+        ncc_engine.add(name, template)
+    return cv_engine, ncc_engine
+
+
+@pytest.fixture(scope="module", params=[INTERFACE_TEMPL_DIR, OPTION_TEMPL_DIR])
+def templates(request) -> Dict[str, numpy.ndarray]:
+    return _load(request.param)
+
+
+def test_ncc_matches_cv2(templates: Dict[str, numpy.ndarray]) -> None:
+    # Dense path: every template scored, those of other shapes at -1.
+    cv_engine, ncc_engine = _engines(templates)
+    names = list(templates)
+    rng = numpy.random.default_rng(0)
+    for name, template in templates.items():
+        for crop in _crops(template, rng):
+            expected, actual = cv_engine.score(crop, names), ncc_engine.score(crop, names)
+            assert actual.keys() == expected.keys()
+            for other in names:
+                assert actual[other] == pytest.approx(expected[other], abs=TOLERANCE), (name, other)
+            assert max(actual, key=actual.get) == max(expected, key=expected.get) == name
+
+
+def test_ncc_sparse_matches_cv2() -> None:
+    # Sparse path: a few of many same-shape templates requested, as the cascade survivors are.
+    templates = _load(OPTION_TEMPL_DIR)
+    cv_engine, ncc_engine = _engines(templates)
+    rng = numpy.random.default_rng(1)
+    for name, template in templates.items():
+        same_shape = [other for other in templates if templates[other].shape == template.shape]
+        rows = len(ncc_engine._shape_to_rows[template.shape])
+        names = [name, next(other for other in same_shape if other != name)]
+        # A template of another shape too, while the request stays sparse.
+        if 4 * (len(names) + 1) < rows:
+            names.append(next(other for other in templates if templates[other].shape != template.shape))
+        assert 4 * len(names) < rows
+        for crop in _crops(template, rng):
+            expected, actual = cv_engine.score(crop, names), ncc_engine.score(crop, names)
+            for other in names:
+                assert actual[other] == pytest.approx(expected[other], abs=TOLERANCE), (name, other)
+            assert max(actual, key=actual.get) == max(expected, key=expected.get) == name
+
+
+@pytest.mark.parametrize("templates_dir, threshold", [(INTERFACE_TEMPL_DIR, INTERFACE_MATCH_THRESHOLD), (OPTION_TEMPL_DIR, OPTION_MATCH_THRESHOLD)])
+@pytest.mark.parametrize("full", ["cv2", "ncc"])
+def test_cascade_coarse_keeps_matches(templates_dir: str, threshold: float, full: str) -> None:
+    # The coarse stage rejects no match: the best template keeps its full-resolution score,
+    # and the rejected ones stay under the threshold, as with cv2.
+    templates = _load(templates_dir)
+    cv_engine = CvEngine()
+    cascade = CascadeEngine(full=full)
+    for name, template in templates.items():
+        cv_engine.add(name, template)
+        cascade.add(name, template)
+    names = list(templates)
+    rng = numpy.random.default_rng(2)
+    for name, template in templates.items():
+        for crop in _crops(template, rng):
+            expected, actual = cv_engine.score(crop, names), cascade.score(crop, names)
+            assert actual[name] == pytest.approx(expected[name], abs=TOLERANCE), name
+            assert max(actual, key=actual.get) == max(expected, key=expected.get) == name
+            for other in names:
+                assert (actual[other] > threshold) == (expected[other] > threshold), (name, other)
+    # Some templates are rejected early, or the cascade saves nothing.
+    assert cascade.stats["coarse"] > 0
+
+
+@pytest.mark.parametrize("level", [0, 128, 255])
+def test_cascade_flat_rejects_all(level: int) -> None:
+    # A flat region (loading screen) matches nothing, with cv2 as with the cascade.
+    templates = _load(OPTION_TEMPL_DIR)
+    cv_engine = CvEngine()
+    cascade = CascadeEngine()
+    for name, template in templates.items():
+        cv_engine.add(name, template)
+        cascade.add(name, template)
+    names = list(templates)
+    shape = next(iter(templates.values())).shape
+    crop = numpy.full(shape, level, numpy.uint8)
+    expected, actual = cv_engine.score(crop, names), cascade.score(crop, names)
+    same_shape = [name for name in names if templates[name].shape == shape]
+    assert cascade.stats["flat"] == len(same_shape)
+    assert cascade.stats["full"] == 0
+    for name in names:
+        assert actual[name] <= OPTION_MATCH_THRESHOLD
+        assert expected[name] <= OPTION_MATCH_THRESHOLD
+        if name not in same_shape:
+            assert actual[name] == expected[name] == -1.